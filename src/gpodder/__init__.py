@@ -32,18 +32,23 @@ __public_version__, __local_version__ = next(
 __version_info__ = tuple(int(x) for x in __public_version__.split('.'))
 
 import gettext
+import importlib.util
 import locale
 import os
 import platform
 import socket
 import sys
 
+# Measure the startup time as early as possible (see gpodder.startupprofile)
+if os.environ.get('GPODDER_PROFILE_STARTUP'):
+    from gpodder import startupprofile  # isort:skip
+    startupprofile.start(os.environ['GPODDER_PROFILE_STARTUP'])
+
 from gpodder.build_info import BUILD_TYPE
 
-# Check if real hard dependencies are available
-try:
-    import podcastparser
-except ImportError:
+# Check if real hard dependencies are available (without importing
+# them, they are imported when they are used for the first time)
+if importlib.util.find_spec('podcastparser') is None:
     print("""
   Error: Module "podcastparser" (python-podcastparser) not found.
          The podcastparser module can be downloaded from
@@ -52,11 +57,8 @@ except ImportError:
   From a source checkout, see https://gpodder.github.io/docs/run-from-git.html
 """)
     sys.exit(1)
-del podcastparser
 
-try:
-    import mygpoclient
-except ImportError:
+if importlib.util.find_spec('mygpoclient') is None:
     print("""
   Error: Module "mygpoclient" (python-mygpoclient) not found.
          The mygpoclient module can be downloaded from
@@ -65,7 +67,6 @@ except ImportError:
   From a source checkout, see https://gpodder.github.io/docs/run-from-git.html
 """)
     sys.exit(1)
-del mygpoclient
 
 try:
     import sqlite3
@@ -54,23 +54,49 @@ defaults = {
         },
     },
 
+    # SQLite settings, see https://www.sqlite.org/pragma.html
+    'database': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': 8192,  # in KiB
+        'mmap_size': 64,  # in MiB, 0 to disable memory-mapped I/O
+        'vacuum_threshold': 0.25,  # VACUUM on exit if this part of the file is unused
+        'readers': 2,  # read-only connections (only with journal_mode WAL)
+    },
+
     # Various limits (downloading, updating, etc..)
     'limit': {
         'bandwidth': {
             'enabled': False,
-            'kbps': 500.0,  # maximum kB/s per download
+            'kbps': 500.0,  # maximum kB/s for all downloads together
         },
         'downloads': {
             'enabled': True,
             'concurrent': 1,
             'concurrent_max': 16,
+            'per_host': 0,  # parallel downloads per server, 0 for no limit
         },
         'episodes': 200,  # max episodes per feed
+        'updates': {
+            'concurrent': 4,  # feeds fetched in parallel
+            'per_host': 2,  # parallel feed fetches per server
+        },
     },
 
     # Behavior of downloads
     'downloads': {
         'chronological_order': True,  # download older episodes first
+        'order': 'queued',  # start queued downloads in order: queued, smallest, newest
+        # Look for deleted and externally downloaded files after startup
+        # instead of during startup (for large or slow download folders)
+        'check_folders_in_background': False,
+        # Download large files using several connections (if the server
+        # supports range requests); not used if the bandwidth is limited
+        'segmented': {
+            'enabled': False,
+            'connections': 4,
+            'min_size': 16,  # in MiB
+        },
     },
 
     # Automatic feed updates, download removal and retry on download timeout
@@ -243,6 +269,9 @@ defaults = {
         'proxy_use_username_password': False,
         'proxy_username': '',
         'proxy_password': '',
+        'pool_connections': 10,  # number of servers to keep connections for
+        'pool_maxsize': 10,  # connections kept per server
+        'keep_alive': True,
     },
 
     'extensions': {
@@ -282,6 +311,10 @@ def get_network_proxy_observer(config):
         global _proxies
         if name.startswith("network."):
             _proxies = get_proxies_from_config(config)
+            # Pooled connections may have been made through the old proxy
+            util.set_http_pool_options(config.network.pool_connections,
+                                       config.network.pool_maxsize,
+                                       config.network.keep_alive)
 
     return network_proxy_observer
 
@@ -22,7 +22,7 @@
 
 
 import gpodder
-from gpodder import config, dbsqlite, extensions, model, util
+from gpodder import config, dbsqlite, extensions, model, startupprofile, util
 
 
 class Core(object):
@@ -33,16 +33,19 @@ class Core(object):
         # Initialize the gPodder home directory
         util.make_directory(gpodder.home)
 
-        # Open the database and configuration file
-        self.db = database_class(gpodder.database_file)
+        # Open the configuration file and database
+        with startupprofile.phase('config'):
+            self.config = config_class(gpodder.config_file)
+        self.db = database_class(gpodder.database_file, dict(self.config.database))
         self.model = model_class(self.db)
-        self.config = config_class(gpodder.config_file)
 
         # Load extension modules and install the extension manager
-        gpodder.user_extensions = extensions.ExtensionManager(self)
+        with startupprofile.phase('extensions'):
+            gpodder.user_extensions = extensions.ExtensionManager(self)
 
         # Load installed/configured plugins
-        gpodder.load_plugins()
+        with startupprofile.phase('plugins'):
+            gpodder.load_plugins()
 
         # Update the current device in the configuration
         self.config.mygpo.device.type = util.detect_device_type()
@@ -24,12 +24,18 @@
 # 2010-04-24 Thomas Perl <thp@gpodder.org>
 #
 
+import collections
+import contextlib
 import logging
+import os
+import queue
 import threading
+import time
+import urllib.request
 from sqlite3 import dbapi2 as sqlite
 
 import gpodder
-from gpodder import schema, util
+from gpodder import config, query, schema, startupprofile, util
 
 _ = gpodder.gettext
 
@@ -40,22 +46,179 @@ class Database(object):
     TABLE_PODCAST = 'podcast'
     TABLE_EPISODE = 'episode'
 
-    def __init__(self, filename):
+    # Number of prepared statements kept by the sqlite3 module
+    STATEMENT_CACHE_SIZE = 256
+
+    # Defaults for the "database" settings
+    DEFAULT_SETTINGS = config.defaults['database']
+
+    JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL')
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+    def __init__(self, filename, settings=None):
         self.database_file = filename
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
         self._db = None
         self.lock = threading.RLock()
+        # Held while a podcast update writes its changes, so that updates
+        # running in parallel never interleave their multi-statement writes
+        self.write_lock = threading.RLock()
+        self._save_sql = {}
+        # Read-only connections (only used with write-ahead logging)
+        self._readers = None
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+        # Cached (total, deleted, new, downloaded, unplayed) per podcast ID
+        self._statistics = None
+        self._statistics_lock = threading.Lock()
+        # Podcasts whose cached statistics must be recalculated
+        self._statistics_dirty = set()
+        # Podcasts changed since the last commit; queries that don't see
+        # uncommitted changes might have cached old statistics for them
+        self._statistics_uncommitted = set()
+        # When the statistics of each podcast were last invalidated
+        self._statistics_generation = 0
+        self._statistics_changed = {}
+        self._wal = False
+        self._has_search_index = None
 
     def close(self):
         self.commit()
 
         with self.lock:
             self.db.isolation_level = None
-            self.db.execute('VACUUM')
+            self.db.execute('PRAGMA optimize')
+            if self._should_vacuum():
+                start = time.time()
+                self.db.execute('VACUUM')
+                logger.info('Database vacuumed in %.3f s', time.time() - start)
             self.db.isolation_level = ''
 
+        self._close_readers()
         self._db.close()
         self._db = None
 
+    def _should_vacuum(self):
+        """Only VACUUM if enough of the database file is unused"""
+        threshold = float(self.settings['vacuum_threshold'])
+        if threshold <= 0:
+            return True
+
+        page_count = self.db.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = self.db.execute('PRAGMA freelist_count').fetchone()[0]
+        ratio = freelist_count / page_count if page_count else 0
+        logger.debug('Database: %d of %d pages unused (%.1f%%)',
+                     freelist_count, page_count, ratio * 100)
+        return ratio >= threshold
+
+    def _tune(self, db):
+        """Apply the journal, sync and cache settings to a new connection"""
+        journal_mode = str(self.settings['journal_mode']).upper()
+        if journal_mode not in self.JOURNAL_MODES:
+            logger.warning('Invalid database journal mode: %s', journal_mode)
+            journal_mode = self.DEFAULT_SETTINGS['journal_mode']
+
+        synchronous = str(self.settings['synchronous']).upper()
+        if synchronous not in self.SYNCHRONOUS_LEVELS:
+            logger.warning('Invalid database synchronous level: %s', synchronous)
+            synchronous = self.DEFAULT_SETTINGS['synchronous']
+
+        # The journal mode might not be supported (e.g. WAL on network
+        # file systems), in which case SQLite keeps the current mode
+        journal_mode = db.execute('PRAGMA journal_mode = %s' % journal_mode).fetchone()[0]
+        self._wal = (journal_mode.upper() == 'WAL')
+        db.execute('PRAGMA synchronous = %s' % synchronous)
+        # Negative values are in KiB instead of pages
+        db.execute('PRAGMA cache_size = %d' % -abs(int(self.settings['cache_size'])))
+        db.execute('PRAGMA mmap_size = %d' % (int(self.settings['mmap_size']) * 1024 * 1024))
+
+        logger.debug('Database: journal_mode=%s, synchronous=%s, cache_size=%s KiB, mmap_size=%s MiB',
+                     journal_mode, synchronous, self.settings['cache_size'], self.settings['mmap_size'])
+
+    def _open_reader(self):
+        uri = 'file:%s?mode=ro' % urllib.request.pathname2url(os.path.abspath(self.database_file))
+        db = sqlite.connect(uri, uri=True, check_same_thread=False,
+                            cached_statements=self.STATEMENT_CACHE_SIZE)
+        db.execute('PRAGMA cache_size = %d' % -abs(int(self.settings['cache_size'])))
+        db.execute('PRAGMA mmap_size = %d' % (int(self.settings['mmap_size']) * 1024 * 1024))
+        return db
+
+    def _get_reader(self, readers):
+        """Get a read-only connection from the pool readers"""
+        try:
+            return readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._readers_lock:
+            create = self._readers_created < readers.maxsize
+            if create:
+                self._readers_created += 1
+
+        if not create:
+            return readers.get()
+
+        try:
+            return self._open_reader()
+        except Exception as e:
+            logger.warning('Cannot open read-only database connection: %s', e, exc_info=True)
+            # Don't try again, use the main connection from now on
+            self._readers = None
+            return None
+
+    def _close_readers(self):
+        readers, self._readers = self._readers, None
+        # Connections that are in use are closed when they are given back
+        while readers is not None and not readers.empty():
+            readers.get_nowait().close()
+        self._readers_created = 0
+
+    @contextlib.contextmanager
+    def _read_cursor(self, consistent=True):
+        """Cursor for a read-only query
+
+        Uses one of the read-only connections, so the query can run while
+        another thread is writing. These connections don't see uncommitted
+        changes, so queries run on the main connection while it has an open
+        transaction - unless consistent is False and the main connection is
+        busy, then the last committed state is used instead of waiting.
+        """
+        db = self.db
+        readers = self._readers
+        reader = None
+        if readers is not None:
+            if not db.in_transaction:
+                reader = self._get_reader(readers)
+            elif not consistent:
+                if self.lock.acquire(blocking=False):
+                    self.lock.release()
+                else:
+                    reader = self._get_reader(readers)
+
+        if reader is None:
+            with self.lock:
+                cur = db.cursor()
+                try:
+                    yield cur
+                finally:
+                    cur.close()
+            return
+
+        try:
+            cur = reader.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+        finally:
+            if readers is self._readers:
+                readers.put(reader)
+            else:
+                # The pool has been closed in the meantime
+                reader.close()
+
     def purge(self, max_episodes, podcast_id):
         """Delete old episodes.
 
@@ -79,18 +242,31 @@ class Database(object):
 
             cur.close()
 
+        self._invalidate_statistics(podcast_id)
+
     @property
     def db(self):
         if self._db is None:
-            self._db = sqlite.connect(self.database_file, check_same_thread=False)
+            start = time.time()
+            with startupprofile.phase('database open'):
+                self._db = sqlite.connect(self.database_file, check_same_thread=False,
+                                          cached_statements=self.STATEMENT_CACHE_SIZE)
+                self._tune(self._db)
 
             # Check schema version, upgrade if necessary
-            schema.upgrade(self._db, self.database_file)
+            with startupprofile.phase('database upgrade'):
+                schema.upgrade(self._db, self.database_file)
 
             # Sanity checks for the data in the database
-            schema.check_data(self)
+            with startupprofile.phase('database check'):
+                schema.check_data(self)
+                self._db.commit()
+
+            readers = int(self.settings['readers'])
+            if self._wal and readers > 0 and self.database_file != ':memory:':
+                self._readers = queue.Queue(readers)
 
-            logger.debug('Database opened.')
+            logger.info('Database opened in %.3f s', time.time() - start)
         return self._db
 
     def cursor(self):
@@ -101,17 +277,20 @@ class Database(object):
             try:
                 logger.debug('Commit.')
                 self.db.commit()
+                with self._statistics_lock:
+                    self._statistics_dirty.update(self._statistics_uncommitted)
+                    self._statistics_generation += 1
+                    for podcast_id in self._statistics_uncommitted:
+                        self._statistics_changed[podcast_id] = self._statistics_generation
+                    self._statistics_uncommitted.clear()
             except Exception as e:
                 logger.error('Cannot commit: %s', e, exc_info=True)
 
     def get_content_types(self, pid):
         """Given a podcast ID, returns the content types."""
-        with self.lock:
-            cur = self.cursor()
+        with self._read_cursor() as cur:
             cur.execute('SELECT mime_type FROM %s WHERE podcast_id = ?' % self.TABLE_EPISODE, (pid,))
-            for (mime_type,) in cur:
-                yield mime_type
-            cur.close()
+            return [mime_type for (mime_type,) in cur]
 
     def get_podcast_statistics(self, podcast_id=None):
         """Given a podcast ID, returns the statistics for it.
@@ -119,33 +298,81 @@ class Database(object):
         If the podcast_id is omitted (using the default value), the
         statistics will be calculated over all podcasts.
 
+        The statistics of all podcasts are cached; when episodes are
+        saved or deleted, only the statistics of their podcast are
+        calculated again on the next call.
+
         Returns a tuple (total, deleted, new, downloaded, unplayed)
         """
-        total, deleted, new, downloaded, unplayed = 0, 0, 0, 0, 0
-
-        with self.lock:
-            cur = self.cursor()
-            if podcast_id is not None:
-                cur.execute('SELECT COUNT(*), state, is_new FROM %s '
-                            'WHERE podcast_id = ? GROUP BY state, is_new'
-                            % self.TABLE_EPISODE, (podcast_id,))
+        with self._statistics_lock:
+            statistics = self._statistics
+            dirty = self._statistics_dirty
+            self._statistics_dirty = set()
+            generation = self._statistics_generation
+
+        if statistics is None or dirty:
+            if statistics is None:
+                result = self._query_podcast_statistics()
+                podcast_ids = set(result)
             else:
-                cur.execute('SELECT COUNT(*), state, is_new FROM %s '
-                            'GROUP BY state, is_new' % self.TABLE_EPISODE)
-            for count, state, is_new in cur:
-                total += count
+                result = self._query_podcast_statistics(dirty)
+                podcast_ids = dirty
+
+            with self._statistics_lock:
+                # Another thread might have stored newer statistics meanwhile
+                statistics = dict(self._statistics or {})
+                for pid in podcast_ids:
+                    if self._statistics_changed.get(pid, 0) > generation:
+                        # Changed again while querying, might be outdated
+                        self._statistics_dirty.add(pid)
+                        if pid in statistics:
+                            continue
+                    if pid in result:
+                        statistics[pid] = result[pid]
+                    else:
+                        statistics.pop(pid, None)
+                self._statistics = statistics
+
+        if podcast_id is not None:
+            return statistics.get(podcast_id, (0, 0, 0, 0, 0))
+
+        return tuple(sum(values) for values in zip((0, 0, 0, 0, 0), *statistics.values()))
+
+    def _query_podcast_statistics(self, podcast_ids=None):
+        """Calculate the statistics of podcast_ids (or all podcasts)"""
+        result = collections.defaultdict(lambda: [0, 0, 0, 0, 0])
+
+        sql = 'SELECT podcast_id, COUNT(*), state, is_new FROM %s' % self.TABLE_EPISODE
+        args = ()
+        if podcast_ids is not None:
+            podcast_ids = list(podcast_ids)
+            sql += ' WHERE podcast_id IN (%s)' % ', '.join('?' * len(podcast_ids))
+            args = podcast_ids
+        sql += ' GROUP BY podcast_id, state, is_new'
+
+        # Statistics of the last committed state are good enough
+        with self._read_cursor(consistent=False) as cur:
+            cur.execute(sql, args)
+            for podcast_id, count, state, is_new in cur:
+                counts = result[podcast_id]
+                counts[0] += count
                 if state == gpodder.STATE_DELETED:
-                    deleted += count
+                    counts[1] += count
                 elif state == gpodder.STATE_NORMAL and is_new:
-                    new += count
+                    counts[2] += count
                 elif state == gpodder.STATE_DOWNLOADED:
-                    downloaded += count
+                    counts[3] += count
                     if is_new:
-                        unplayed += count
+                        counts[4] += count
 
-            cur.close()
+        return {podcast_id: tuple(counts) for podcast_id, counts in result.items()}
 
-        return (total, deleted, new, downloaded, unplayed)
+    def _invalidate_statistics(self, podcast_id):
+        with self._statistics_lock:
+            self._statistics_dirty.add(podcast_id)
+            self._statistics_uncommitted.add(podcast_id)
+            self._statistics_generation += 1
+            self._statistics_changed[podcast_id] = self._statistics_generation
 
     def load_podcasts(self, factory):
         logger.info('Loading podcasts')
@@ -153,33 +380,87 @@ class Database(object):
         # See https://github.com/gpodder/gpodder/issues/1768 for why descending order
         sql = 'SELECT * FROM %s order by id desc' % self.TABLE_PODCAST
 
-        with self.lock:
-            cur = self.cursor()
+        with self._read_cursor() as cur:
             cur.execute(sql)
-
             keys = [desc[0] for desc in cur.description]
-            result = [factory(dict(list(zip(keys, row))), self) for row in cur]
-            cur.close()
+            rows = cur.fetchall()
 
-        return result
+        return [factory(dict(list(zip(keys, row))), self) for row in rows]
 
     def load_episodes(self, podcast, factory):
         assert podcast.id
 
         logger.info('Loading episodes for podcast %d', podcast.id)
 
-        sql = 'SELECT * FROM %s WHERE podcast_id = ? ORDER BY published DESC' % self.TABLE_EPISODE
+        # The detail columns are loaded later by load_episode_details()
+        sql = 'SELECT id, %s FROM %s WHERE podcast_id = ? ORDER BY published DESC' % (
+            ', '.join(schema.EpisodeSummaryColumns), self.TABLE_EPISODE)
         args = (podcast.id,)
 
-        with self.lock:
-            cur = self.cursor()
+        with self._read_cursor() as cur:
             cur.execute(sql, args)
-
             keys = [desc[0] for desc in cur.description]
-            result = [factory(dict(list(zip(keys, row)))) for row in cur]
-            cur.close()
+            rows = cur.fetchall()
 
-        return result
+        return [factory(dict(list(zip(keys, row)))) for row in rows]
+
+    def load_episodes_where(self, where, params=()):
+        """Return the summary columns of episodes matching an SQL condition
+
+        The condition can use the columns of the "episode" and "podcast"
+        tables (see query.EQL.get_sql), the returned dicts include the
+        episode id and podcast_id.
+        """
+        sql = ('SELECT episode.id, %s FROM %s AS episode JOIN %s AS podcast ON podcast.id = episode.podcast_id '
+               'WHERE %s ORDER BY episode.published DESC') % (
+            ', '.join('episode.%s' % column for column in schema.EpisodeSummaryColumns),
+            self.TABLE_EPISODE, self.TABLE_PODCAST, where)
+
+        with self._read_cursor() as cur:
+            cur.execute(sql, params)
+            keys = ['id'] + list(schema.EpisodeSummaryColumns)
+            return [dict(zip(keys, row)) for row in cur]
+
+    def has_search_index(self):
+        """Return True if the text search index exists (see schema.create_search_index)"""
+        if self._has_search_index is None:
+            self._has_search_index = bool(self.get("SELECT COUNT(*) FROM sqlite_master "
+                                                   "WHERE type = 'table' AND name = 'episode_fts'"))
+        return self._has_search_index
+
+    def search_episodes(self, phrases):
+        """Return the IDs of episodes containing all phrases, best matches first
+
+        Phrases are searched for in the title and shownotes, ignoring
+        case, using the text search index. Matches in the title count
+        more. Phrases shorter than three characters are ignored, so the
+        episodes still have to be checked for them. Returns None if the
+        index can't be used at all.
+        """
+        match = query.search_match(phrases)
+        if match is None or not self.has_search_index():
+            return None
+
+        with self._read_cursor() as cur:
+            cur.execute('SELECT rowid FROM episode_fts WHERE episode_fts MATCH ? '
+                        'ORDER BY bm25(episode_fts, 10.0, 1.0)', (match,))
+            return [episode_id for (episode_id,) in cur]
+
+    def load_episode_details(self, podcast_id, episode_id=None):
+        """Return (episode_id, details) for the detail columns of a podcast
+
+        If episode_id is given, only the details of this episode are loaded.
+        """
+        sql = 'SELECT id, %s FROM %s WHERE podcast_id = ?' % (
+            ', '.join(schema.EpisodeDetailColumns), self.TABLE_EPISODE)
+        args = (podcast_id,)
+        if episode_id is not None:
+            sql += ' AND id = ?'
+            args += (episode_id,)
+
+        with self._read_cursor() as cur:
+            cur.execute(sql, args)
+            return [(row[0], dict(zip(schema.EpisodeDetailColumns, row[1:]))) for row in cur]
 
     def delete_podcast(self, podcast):
         assert podcast.id
@@ -194,13 +475,103 @@ class Database(object):
             cur.close()
             self.db.commit()
 
+        self._invalidate_statistics(podcast.id)
+
     def save_podcast(self, podcast):
         self._save_object(podcast, self.TABLE_PODCAST, schema.PodcastColumns)
 
     def save_episode(self, episode):
-        self._save_object(episode, self.TABLE_EPISODE, schema.EpisodeColumns)
+        self.save_episodes([episode])
+
+    def _episode_columns(self, episode):
+        # Detail columns that have not been loaded are left untouched
+        if episode.id is None or episode._details_loaded:
+            return schema.EpisodeColumns
+        return schema.EpisodeSummaryColumns
+
+    def save_episodes(self, episodes):
+        """Save many episodes at once
+
+        New episodes are inserted one by one (to get their IDs), existing
+        ones are updated with a single executemany() call. Nothing is
+        committed, this is left to the caller.
+        """
+        with self.lock:
+            cur = self.cursor()
+            new_episodes, updated_episodes = [], []
+            updates = collections.defaultdict(list)
+            for episode in episodes:
+                columns = self._episode_columns(episode)
+                values = [util.convert_bytes(getattr(episode, name))
+                        for name in columns]
+                if episode.id is None:
+                    insert_sql, update_sql = self._get_save_sql(self.TABLE_EPISODE, columns)
+                    try:
+                        cur.execute(insert_sql, values)
+                        episode.id = cur.lastrowid
+                        new_episodes.append(episode)
+                    except Exception as e:
+                        logger.error('Cannot save %s: %s', episode, e, exc_info=True)
+                else:
+                    values.append(episode.id)
+                    updates[columns].append(values)
+                    updated_episodes.append(episode)
+
+            for podcast_id in {episode.podcast_id for episode in episodes}:
+                self._invalidate_statistics(podcast_id)
+
+            for columns, rows in updates.items():
+                insert_sql, update_sql = self._get_save_sql(self.TABLE_EPISODE, columns)
+                try:
+                    cur.executemany(update_sql, rows)
+                except Exception as e:
+                    logger.error('Cannot save %d episodes: %s', len(rows), e, exc_info=True)
+
+            if self.has_search_index():
+                try:
+                    self._update_search_index(cur, new_episodes, updated_episodes)
+                except Exception as e:
+                    logger.error('Cannot update the search index: %s', e, exc_info=True)
+
+            cur.close()
+
+    def _update_search_index(self, cur, new_episodes, episodes):
+        """Add new_episodes to the text search index and update episodes
+
+        This isn't done by triggers, as the indexed text is prepared with
+        Python functions (see schema.create_search_index()). Only changed
+        text is written, and the shownotes only if they have been loaded.
+        """
+        cur.executemany(schema.SEARCH_INDEX_INSERT_SQL,
+                        [(e.id, e.title.casefold(), e._text_description.casefold()) for e in new_episodes])
+
+        rows, title_rows = [], []
+        for episode in episodes:
+            title = episode.title.casefold()
+            if episode._details_loaded:
+                description = episode._text_description.casefold()
+                rows.append((title, description, episode.id, title, description))
+            else:
+                title_rows.append((title, episode.id, title))
+
+        cur.executemany('UPDATE episode_fts SET title = ?, description = ? '
+                        'WHERE rowid = ? AND (title IS NOT ? OR description IS NOT ?)', rows)
+        cur.executemany('UPDATE episode_fts SET title = ? WHERE rowid = ? AND title IS NOT ?', title_rows)
+
+    def _get_save_sql(self, table, columns):
+        """Return the (cached) INSERT and UPDATE statements for table"""
+        key = (table, columns)
+        if key not in self._save_sql:
+            qmarks = ', '.join('?' * len(columns))
+            insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(columns), qmarks)
+            qmarks = ', '.join('%s = ?' % name for name in columns)
+            update_sql = 'UPDATE %s SET %s WHERE id = ?' % (table, qmarks)
+            self._save_sql[key] = (insert_sql, update_sql)
+        return self._save_sql[key]
 
     def _save_object(self, o, table, columns):
+        insert_sql, update_sql = self._get_save_sql(table, columns)
+
         with self.lock:
             try:
                 cur = self.cursor()
@@ -208,15 +579,11 @@ class Database(object):
                         for name in columns]
 
                 if o.id is None:
-                    qmarks = ', '.join('?' * len(columns))
-                    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(columns), qmarks)
-                    cur.execute(sql, values)
+                    cur.execute(insert_sql, values)
                     o.id = cur.lastrowid
                 else:
-                    qmarks = ', '.join('%s = ?' % name for name in columns)
                     values.append(o.id)
-                    sql = 'UPDATE %s SET %s WHERE id = ?' % (table, qmarks)
-                    cur.execute(sql, values)
+                    cur.execute(update_sql, values)
             except Exception as e:
                 logger.error('Cannot save %s: %s', o, e, exc_info=True)
 
@@ -224,16 +591,13 @@ class Database(object):
 
     def get(self, sql, params=None):
         """Return the first cell of a query result, useful for COUNT()s."""
-        with self.lock:
-            cur = self.cursor()
-
+        with self._read_cursor() as cur:
             if params is None:
                 cur.execute(sql)
             else:
                 cur.execute(sql, params)
 
             row = cur.fetchone()
-            cur.close()
 
         if row is None:
             return None
@@ -275,3 +639,5 @@ class Database(object):
             cur = self.cursor()
             cur.execute('DELETE FROM %s WHERE podcast_id = ? AND guid = ?' %
                     self.TABLE_EPISODE, (podcast_id, guid))
+
+        self._invalidate_statistics(podcast_id)
@@ -25,7 +25,9 @@
 #  Based on libwget.py (2005-10-29)
 #
 
+import collections
 import glob
+import json
 import logging
 import mimetypes
 import os
@@ -34,12 +36,16 @@ import shutil
 import threading
 import time
 import urllib.error
+import urllib.parse
 from abc import ABC, abstractmethod
 
 import requests
-from requests.adapters import HTTPAdapter
-from requests.exceptions import HTTPError, RequestException
-from requests.packages.urllib3.exceptions import MaxRetryError
+from requests.exceptions import (ChunkedEncodingError, ContentDecodingError,
+                                 HTTPError, RequestException)
+from requests.packages.urllib3.exceptions import (DecodeError, MaxRetryError,
+                                                  ProtocolError,
+                                                  ReadTimeoutError)
+from requests.packages.urllib3.exceptions import SSLError as Urllib3SSLError
 from requests.packages.urllib3.util.retry import Retry
 
 import gpodder
@@ -51,10 +57,133 @@ _ = gpodder.gettext
 
 REDIRECT_RETRIES = 3
 
+# Limits for the size of the blocks read from the network (see iter_blocks)
+MIN_BLOCK_SIZE = 8 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+
+# How long reading a single block should take (in seconds)
+BLOCK_READ_TIME = .1
+
+
+class BandwidthLimiter(object):
+    """Token bucket limiting the total rate of all running downloads
+
+    Downloads take one token per byte they read. The bucket is refilled at
+    the configured rate and holds at most BURST seconds worth of tokens.
+    Tokens can be borrowed, and the borrower then waits until the debt is
+    paid off, so downloads are served in order and share the bandwidth
+    equally. The rate can be changed at any time using set_rate().
+    """
+    # Seconds worth of tokens that can be saved up while idle
+    BURST = .5
+
+    # Seconds worth of data that should be read at once when limited
+    GRANULARITY = .1
+
+    # Sleep a maximum of 10 seconds to not cause time-outs
+    MAX_DELAY = 10.
+
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self._rate = 0
+        self._tokens = 0.
+        self._last_refill = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        """Set the rate in bytes per second (0 disables the limit)"""
+        rate = max(0, int(rate))
+        with self._lock:
+            if rate != self._rate:
+                self._refill()
+                self._rate = rate
+                self._tokens = min(self._tokens, rate * self.BURST)
+
+    def block_size(self, size):
+        """Return the block size to use instead of size"""
+        rate = self._rate
+        if not rate:
+            return size
+        return max(1024, min(size, int(rate * self.GRANULARITY)))
+
+    def consume(self, amount):
+        """Take amount tokens, waiting until they are available"""
+        with self._lock:
+            if not self._rate:
+                return
+            self._refill()
+            self._tokens -= amount
+            delay = -self._tokens / self._rate
+
+        if delay > 0:
+            time.sleep(min(delay, self.MAX_DELAY))
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate:
+            self._tokens = min(self._rate * self.BURST,
+                               self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+
+# Shared by all downloads, the rate is set from the configuration by DownloadTask
+bandwidth_limiter = BandwidthLimiter()
+
+
+def iter_blocks(resp, limiter=None):
+    """Iterate over the body of a streaming response, like resp.iter_content()
+
+    The block size starts small and is doubled while full blocks arrive
+    quickly, and halved again when reading a block takes too long, so fast
+    connections need fewer (and larger) writes and callbacks, while slow
+    connections still report progress and react to cancellation in time.
+
+    If limiter (a BandwidthLimiter) is given, every block is paid for
+    with tokens of the limiter before it is returned.
+    """
+    bs = MIN_BLOCK_SIZE
+    try:
+        while True:
+            if limiter is not None:
+                bs = limiter.block_size(bs)
+            start = time.monotonic()
+            block = resp.raw.read(bs, decode_content=True)
+            if not block:
+                # Compressed data might not decode to anything yet, only
+                # stop at the end of the body (like resp.raw.stream() does)
+                if resp.raw.closed:
+                    break
+                continue
+            duration = time.monotonic() - start
+            if len(block) >= bs and duration < BLOCK_READ_TIME / 2:
+                bs = min(bs * 2, MAX_BLOCK_SIZE)
+            elif duration > BLOCK_READ_TIME * 2:
+                bs = max(bs // 2, MIN_BLOCK_SIZE)
+            if limiter is not None:
+                limiter.consume(len(block))
+            yield block
+    # Same exceptions as raised by resp.iter_content()
+    except ProtocolError as e:
+        raise ChunkedEncodingError(e)
+    except DecodeError as e:
+        raise ContentDecodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.ConnectionError(e)
+    except Urllib3SSLError as e:
+        raise requests.exceptions.SSLError(e)
+
 
 class CustomDownload(ABC):
     """Abstract class for custom downloads. DownloadTask call retrieve_resume() on it."""
 
+    # True if retrieve_resume() uses bandwidth_limiter itself, otherwise
+    # DownloadTask applies the bandwidth limit in the reporthook
+    limits_bandwidth = False
+
     @property
     @abstractmethod
     def partial_filename(self):
@@ -213,6 +342,158 @@ class gPodderDownloadHTTPError(Exception):
         self.error_message = error_message
 
 
+class SegmentedDownload(object):
+    """Download a file using several connections, each fetching a byte range
+
+    The file is preallocated to its full size and every segment is written
+    into its place. The progress of all segments is kept in a JSON file next
+    to the file, so an interrupted download can be resumed later on.
+    """
+    STATE_EXTENSION = '.segments'
+
+    # Seconds between progress reports and between saves of the state
+    PROGRESS_INTERVAL = .25
+    SAVE_INTERVAL = 2.
+
+    class RangeNotSupported(Exception):
+        pass
+
+    def __init__(self, filename, size, segments):
+        self.filename = filename
+        self.size = size
+        # List of [start, end (inclusive), bytes downloaded]
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._error = None
+
+    @classmethod
+    def create(cls, filename, size, count):
+        segment_size = -(-size // count)
+        segments = [[start, min(start + segment_size, size) - 1, 0]
+                    for start in range(0, size, segment_size)]
+        with open(filename, 'wb') as fp:
+            fp.truncate(size)
+        download = cls(filename, size, segments)
+        download.save()
+        return download
+
+    @classmethod
+    def load(cls, filename):
+        """Return the unfinished segmented download of filename (or None)"""
+        state_filename = filename + cls.STATE_EXTENSION
+        if not os.path.exists(state_filename):
+            return None
+
+        try:
+            with open(state_filename, 'r') as fp:
+                state = json.load(fp)
+            if os.path.getsize(filename) == state['size']:
+                return cls(filename, state['size'], state['segments'])
+        except Exception as e:
+            logger.warning('Cannot resume segmented download of %s: %s', filename, e)
+
+        util.delete_file(state_filename)
+        return None
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'size': self.size, 'segments': self.segments})
+
+        state_filename = self.filename + self.STATE_EXTENSION
+        with open(state_filename + '.tmp', 'w') as fp:
+            fp.write(data)
+        os.replace(state_filename + '.tmp', state_filename)
+
+    def remove_state(self):
+        util.delete_file(self.filename + self.STATE_EXTENSION)
+
+    @property
+    def downloaded(self):
+        with self._lock:
+            return sum(downloaded for start, end, downloaded in self.segments)
+
+    def run(self, open_range, connections, reporthook=None, limiter=None):
+        """Download the missing parts of all segments
+
+        open_range(start, end) must return a streaming response for the
+        byte range start-end. reporthook is called from this thread with
+        the same arguments as in DownloadURLOpener.retrieve_resume(), and
+        may raise an exception to stop the download. The segments are
+        read using iter_blocks() with the given limiter.
+        """
+        pending = [segment for segment in self.segments
+                   if segment[2] < segment[1] - segment[0] + 1]
+
+        def worker():
+            while not self._stopped:
+                with self._lock:
+                    if not pending:
+                        return
+                    segment = pending.pop(0)
+                try:
+                    self._download_segment(segment, open_range, limiter)
+                except Exception as e:
+                    with self._lock:
+                        if self._error is None:
+                            self._error = e
+                    self._stopped = True
+
+        threads = [util.run_in_background(worker, True)
+                   for _ in range(max(1, min(connections, len(pending))))]
+        try:
+            last_save = time.time()
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(self.PROGRESS_INTERVAL)
+                if reporthook:
+                    reporthook(self.downloaded, 1, self.size)
+                if time.time() - last_save > self.SAVE_INTERVAL:
+                    self.save()
+                    last_save = time.time()
+        finally:
+            self._stopped = True
+            for thread in threads:
+                thread.join()
+            self.save()
+
+        if self._error is not None:
+            raise self._error
+
+        downloaded = self.downloaded
+        if downloaded < self.size:
+            raise urllib.error.ContentTooShortError('retrieval incomplete: got only %i out '
+                                                    'of %i bytes' % (downloaded, self.size), None)
+
+        if reporthook:
+            reporthook(downloaded, 1, self.size)
+        self.remove_state()
+
+    def _download_segment(self, segment, open_range, limiter):
+        start, end, downloaded = segment
+        position = start + downloaded
+        with open_range(position, end) as resp:
+            resp.raise_for_status()
+            conrange = ContentRange.parse(resp.headers.get('content-range', ''))
+            if resp.status_code != 206 or conrange is None or conrange.start != position:
+                raise self.RangeNotSupported()
+
+            # Unbuffered, so the saved state never runs ahead of the file
+            with open(self.filename, 'r+b', buffering=0) as fp:
+                fp.seek(position)
+                for block in iter_blocks(resp, limiter):
+                    if self._stopped:
+                        break
+                    block = block[:end + 1 - position]
+                    view = memoryview(block)
+                    while view:
+                        view = view[fp.write(view):]
+                    position += len(block)
+                    with self._lock:
+                        segment[2] = position - start
+                    if position > end:
+                        break
+
+
 class DownloadURLOpener:
 
     # Sometimes URLs are not escaped correctly - try to fix them
@@ -220,10 +501,18 @@ class DownloadURLOpener:
     # FYI: The omission of "%" in the list is to avoid double escaping!
     ESCAPE_CHARS = {ord(c): '%%%x' % ord(c) for c in ' <>#"{}|\\^[]`'}
 
-    def __init__(self, channel, max_retries=3):
+    # Minimum time between calls of the reporthook (in seconds)
+    PROGRESS_INTERVAL = .25
+
+    def __init__(self, channel, max_retries=3, connections=1, segment_min_size=0, limiter=None):
         super().__init__()
         self.channel = channel
         self.max_retries = max_retries
+        # Number of connections for segmented downloads (see SegmentedDownload)
+        self.connections = connections
+        self.segment_min_size = segment_min_size
+        # BandwidthLimiter used for reading the downloaded data (or None)
+        self.limiter = limiter
 
     def init_session(self):
         """Init a session with our own retry codes + retry count."""
@@ -236,23 +525,19 @@ class DownloadURLOpener:
             redirect=max(REDIRECT_RETRIES, self.max_retries),
             status=self.max_retries,
             status_forcelist=Retry.RETRY_AFTER_STATUS_CODES.union((408, 418, 504, 598, 599,)))
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        http = requests.Session()
-        http.mount("https://", adapter)
-        http.mount("http://", adapter)
-        return http
+        return util.get_http_session(retry_strategy)
 
 # The following is based on Python's urllib.py "URLopener.retrieve"
 # Also based on http://mail.python.org/pipermail/python-list/2001-October/110069.html
 
-    def retrieve_resume(self, url, filename, reporthook=None, data=None, disable_auth=False):
+    def retrieve_resume(self, url, filename, reporthook=None, data=None, disable_auth=False,
+                        allow_segments=True):
         """Download files from an URL; return (headers, real_url).
 
         Resumes a download if the local filename exists and
         the server supports download resuming.
         """
         current_size = 0
-        tfp = None
         headers = {
             'User-agent': gpodder.user_agent
         }
@@ -263,21 +548,19 @@ class DownloadURLOpener:
         else:
             auth = None
 
-        if os.path.exists(filename):
+        # An unfinished segmented download has a preallocated file
+        segmented = SegmentedDownload.load(filename) if allow_segments else None
+
+        if segmented is None and os.path.exists(filename):
             try:
                 current_size = os.path.getsize(filename)
-                tfp = open(filename, 'ab')
                 # If the file exists, then only download the remainder
                 if current_size > 0:
                     headers['Range'] = 'bytes=%s-' % (current_size)
             except:
                 logger.warning('Cannot resume download: %s', filename, exc_info=True)
-                tfp = None
                 current_size = 0
 
-        if tfp is None:
-            tfp = open(filename, 'wb')
-
         # Fix a problem with bad URLs that are not encoded correctly (bug 549)
         url = url.translate(self.ESCAPE_CHARS)
 
@@ -295,54 +578,108 @@ class DownloadURLOpener:
             except HTTPError as e:
                 if auth is not None:
                     # Try again without authentication (bug 1296)
-                    return self.retrieve_resume(url, filename, reporthook, data, True)
+                    return self.retrieve_resume(url, filename, reporthook, data, True, allow_segments)
                 else:
                     raise gPodderDownloadHTTPError(url, resp.status_code, str(e))
 
             headers = resp.headers
+            result = headers, resp.url
 
-            if current_size > 0:
-                # We told the server to resume - see if she agrees
-                # See RFC2616 (206 Partial Content + Section 14.16)
-                # XXX check status code here, too...
-                conrange = ContentRange.parse(headers.get('content-range', ''))
-                if conrange is None or conrange.start != current_size:
-                    # Ok, that did not work. Reset the download
-                    # TODO: seek and truncate if content-range differs from request
-                    tfp.close()
-                    tfp = open(filename, 'wb')
-                    current_size = 0
-                    logger.warning('Cannot resume: Invalid Content-Range (RFC2616).')
+            if current_size == 0 and allow_segments:
+                size = self._get_segmented_size(resp)
+                if segmented is not None and segmented.size != size:
+                    logger.warning('Cannot resume segmented download: size has changed.')
+                    segmented.remove_state()
+                    segmented = None
+                if segmented is None and size >= max(1, self.segment_min_size) and self.connections > 1:
+                    segmented = SegmentedDownload.create(filename, size, self.connections)
 
-            result = headers, resp.url
-            bs = 1024 * 8
-            size = -1
-            read = current_size
-            blocknum = current_size // bs
-            if reporthook:
-                if "content-length" in headers:
-                    size = int(headers['content-length']) + current_size
-                reporthook(blocknum, bs, size)
-            for block in resp.iter_content(bs):
-                read += len(block)
-                tfp.write(block)
-                blocknum += 1
+            if segmented is None:
+                if current_size > 0:
+                    # We told the server to resume - see if she agrees
+                    # See RFC2616 (206 Partial Content + Section 14.16)
+                    # XXX check status code here, too...
+                    conrange = ContentRange.parse(headers.get('content-range', ''))
+                    if conrange is None or conrange.start != current_size:
+                        # Ok, that did not work. Reset the download
+                        # TODO: seek and truncate if content-range differs from request
+                        current_size = 0
+                        logger.warning('Cannot resume: Invalid Content-Range (RFC2616).')
+
+                tfp = open(filename, 'ab' if current_size > 0 else 'wb')
+                size = -1
+                read = current_size
+                last_report = time.monotonic()
                 if reporthook:
-                    reporthook(blocknum, bs, size)
-            tfp.close()
-            del tfp
+                    if "content-length" in headers:
+                        size = int(headers['content-length']) + current_size
+                    reporthook(read, 1, size)
+                for block in iter_blocks(resp, self.limiter):
+                    read += len(block)
+                    tfp.write(block)
+                    if reporthook and time.monotonic() - last_report >= self.PROGRESS_INTERVAL:
+                        reporthook(read, 1, size)
+                        last_report = time.monotonic()
+                if reporthook:
+                    reporthook(read, 1, size)
+                tfp.close()
+                del tfp
+
+                # raise exception if actual size does not match content-length header
+                if size >= 0 and read < size:
+                    raise urllib.error.ContentTooShortError("retrieval incomplete: got only %i out "
+                                               "of %i bytes" % (read, size), result)
+
+                return result
+
+        # The first response is only used for the headers, the segments
+        # are requested from the final URL (after redirects)
+        real_url = resp.url
+        if auth is not None and urllib.parse.urlsplit(real_url).netloc != urllib.parse.urlsplit(url).netloc:
+            # Like requests, don't send credentials to other hosts
+            auth = None
+        range_headers = {'User-agent': gpodder.user_agent}
 
-        # raise exception if actual size does not match content-length header
-        if size >= 0 and read < size:
-            raise urllib.error.ContentTooShortError("retrieval incomplete: got only %i out "
-                                       "of %i bytes" % (read, size), result)
+        def open_range(start, end):
+            return self.init_session().get(real_url,
+                                           headers=dict(range_headers, Range='bytes=%d-%d' % (start, end)),
+                                           stream=True,
+                                           auth=auth,
+                                           proxies=proxies,
+                                           timeout=gpodder.SOCKET_TIMEOUT)
+
+        logger.info('Downloading %s in %d segments', real_url, len(segmented.segments))
+        try:
+            segmented.run(open_range, self.connections, reporthook, self.limiter)
+        except SegmentedDownload.RangeNotSupported:
+            logger.warning('Server does not support range requests, downloading in one piece.')
+            segmented.remove_state()
+            util.delete_file(filename)
+            return self.retrieve_resume(url, filename, reporthook, data, disable_auth, False)
+        except urllib.error.ContentTooShortError as e:
+            raise urllib.error.ContentTooShortError(str(e), result)
 
         return result
 
+    @staticmethod
+    def _get_segmented_size(resp):
+        """Return the size of the response if it can be downloaded in segments"""
+        if (resp.status_code != 200
+                or 'bytes' not in resp.headers.get('accept-ranges', '').lower()
+                or resp.headers.get('content-encoding', 'identity') != 'identity'):
+            return -1
+
+        try:
+            return int(resp.headers['content-length'])
+        except (KeyError, ValueError):
+            return -1
+
 # end code based on urllib.py
 
 
 class DefaultDownload(CustomDownload):
+    limits_bandwidth = True
+
     def __init__(self, config, episode, url):
         self._config = config
         self.__episode = episode
@@ -361,7 +698,14 @@ class DefaultDownload(CustomDownload):
         url = self._url
         logger.info("Downloading %s", url)
         max_retries = max(0, self._config.auto.retries)
-        downloader = DownloadURLOpener(self.__episode.channel, max_retries=max_retries)
+        if self._config.downloads.segmented.enabled and not self._config.limit.bandwidth.enabled:
+            connections = max(1, int(self._config.downloads.segmented.connections))
+        else:
+            connections = 1
+        downloader = DownloadURLOpener(self.__episode.channel, max_retries=max_retries,
+                                       connections=connections,
+                                       segment_min_size=int(self._config.downloads.segmented.min_size) * 1024 * 1024,
+                                       limiter=bandwidth_limiter)
         self.partial_filename = tempname
 
         # Retry the download on incomplete download (other retries are done by the Retry strategy)
@@ -400,6 +744,95 @@ class DefaultDownloader(CustomDownloader):
         return DefaultDownload(config, episode, url)
 
 
+class DownloadScheduler(object):
+    """Queue of download tasks, handed out to worker threads by priority
+
+    Worker threads call get_next() directly, so no main loop is involved
+    in deciding which download to start next. Tasks are started in this
+    order, skipping tasks for servers that already have the maximum number
+    of running downloads (limit.downloads.per_host, 0 means no limit):
+
+        1. Manually started downloads before automatic downloads
+        2. As configured in downloads.order (see ORDERS)
+        3. In the order in which the tasks have been queued
+
+    Tasks that are paused or cancelled while queued are simply skipped.
+    """
+    ORDERS = ('queued', 'smallest', 'newest')
+
+    def __init__(self, config):
+        self._config = config
+        self._lock = threading.Lock()
+        # Tasks (in the order in which they have been queued) -> sequence number
+        self._queued = {}
+        self._sequence = 0
+        # Tasks that have been handed out by get_next()
+        self._running = []
+        self.enabled = True
+
+    @staticmethod
+    def get_host(task):
+        return urllib.parse.urlparse(task.url).hostname or ''
+
+    def queue_task(self, task):
+        with task:
+            if task.status in (task.NEW, task.FAILED, task.CANCELLED, task.PAUSED):
+                task.status = task.QUEUED
+                task.set_episode_download_task()
+
+        with self._lock:
+            if task not in self._queued:
+                self._sequence += 1
+                self._queued[task] = self._sequence
+
+    def _sort_key(self, task):
+        order = self._config.downloads.order
+        if order == 'smallest':
+            # Tasks of unknown size last
+            key = task.total_size if task.total_size > 0 else float('inf')
+        elif order == 'newest':
+            key = -task.episode.published
+        else:
+            key = 0
+        return (task.automatic, key, self._queued[task])
+
+    def _pending(self):
+        for task in [task for task in self._queued if task.status != task.QUEUED]:
+            del self._queued[task]
+        return list(self._queued)
+
+    def has_work(self):
+        return self.available_work_count() > 0
+
+    def available_work_count(self):
+        with self._lock:
+            return len(self._pending())
+
+    def get_next(self):
+        """Return the next task to download (now DOWNLOADING) or None"""
+        with self._lock:
+            self._running = [task for task in self._running
+                             if task.status in (task.DOWNLOADING, task.PAUSING, task.CANCELLING)]
+            per_host = int(self._config.limit.downloads.per_host)
+            running_hosts = collections.Counter(self.get_host(task) for task in self._running)
+
+            for task in sorted(self._pending(), key=self._sort_key):
+                host = self.get_host(task)
+                # Sync tasks have no URL, so they are not limited
+                if host and per_host > 0 and running_hosts[host] >= per_host:
+                    continue
+
+                with task:
+                    if task.status != task.QUEUED:
+                        continue
+                    task.status = task.DOWNLOADING
+                del self._queued[task]
+                self._running.append(task)
+                return task
+
+        return None
+
+
 class DownloadQueueWorker(object):
     def __init__(self, queue, exit_callback, continue_check_callback):
         self.queue = queue
@@ -441,9 +874,11 @@ class ForceDownloadWorker(object):
 
 
 class DownloadQueueManager(object):
-    def __init__(self, config, queue):
+    def __init__(self, config, queue, max_workers=None):
         self._config = config
         self.tasks = queue
+        # Run this many downloads at once instead of using limit.downloads
+        self._max_workers = max_workers
 
         self.worker_threads_access = threading.RLock()
         self.worker_threads = []
@@ -461,13 +896,21 @@ class DownloadQueueManager(object):
 
     def __continue_check_callback(self, worker_thread):
         with self.worker_threads_access:
-            if len(self.worker_threads) > self._config.limit.downloads.concurrent and \
-                    self._config.limit.downloads.enabled:
+            if len(self.worker_threads) > self.__get_spawn_limit():
                 self.worker_threads.remove(worker_thread)
                 return False
             else:
                 return True
 
+    def __get_spawn_limit(self):
+        if self._max_workers is not None:
+            return max(int(self._max_workers), 1)
+        elif self._config.limit.downloads.enabled:
+            # always allow at least 1 download
+            return max(int(self._config.limit.downloads.concurrent), 1)
+        else:
+            return self._config.limit.downloads.concurrent_max
+
     def __spawn_threads(self):
         """Spawn new worker threads if necessary."""
         if not self.tasks.enabled:
@@ -475,11 +918,7 @@ class DownloadQueueManager(object):
 
         with self.worker_threads_access:
             work_count = self.tasks.available_work_count()
-            if self._config.limit.downloads.enabled:
-                # always allow at least 1 download
-                spawn_limit = max(int(self._config.limit.downloads.concurrent), 1)
-            else:
-                spawn_limit = self._config.limit.downloads.concurrent_max
+            spawn_limit = self.__get_spawn_limit()
             running = len(self.worker_threads)
             logger.info('%r tasks to do, can start at most %r threads, %r threads currently running', work_count, spawn_limit, running)
             for i in range(0, min(work_count, spawn_limit - running)):
@@ -596,6 +1035,12 @@ class DownloadTask(object):
     # Minimum time between progress updates (in seconds)
     MIN_TIME_BETWEEN_UPDATES = 1.
 
+    # Minimum time between speed calculations (in seconds)
+    MIN_TIME_BETWEEN_SPEED_UPDATES = .25
+
+    # Automatic downloads are started after manual downloads (see DownloadScheduler)
+    automatic = False
+
     def __str__(self):
         return self.__episode.title
 
@@ -612,9 +1057,20 @@ class DownloadTask(object):
         if status != self.__status:
             self.__status_changed = True
             self.__status = status
+            self.__episode.changed()
 
     status = property(fget=__get_status, fset=__set_status)
 
+    def __get_progress(self):
+        return self.__progress
+
+    def __set_progress(self, progress):
+        if progress != self.__progress:
+            self.__progress = progress
+            self.__episode.changed()
+
+    progress = property(fget=__get_progress, fset=__set_progress)
+
     def __get_status_changed(self):
         if self.__status_changed:
             self.__status_changed = False
@@ -696,9 +1152,10 @@ class DownloadTask(object):
         return self.status in (self.CANCELLED, self.FAILED, self.DONE)
 
     def delete_partial_files(self):
-        temporary_files = [self.tempname]
+        # The state of a segmented download is kept next to the partial file
+        temporary_files = {self.tempname, self.tempname + SegmentedDownload.STATE_EXTENSION}
         # youtube-dl creates .partial.* files for adaptive formats
-        temporary_files += glob.glob('%s.*' % self.tempname)
+        temporary_files.update(glob.glob('%s.*' % glob.escape(self.tempname)))
 
         for tempfile in temporary_files:
             util.delete_file(tempfile)
@@ -714,6 +1171,7 @@ class DownloadTask(object):
         self.__activity = DownloadTask.ACTIVITY_DOWNLOAD
         self.__status_changed = True
         self.__episode = episode
+        self.__progress = 0.0
         self._config = config
         # specify a custom downloader to be used for this download
         self.__downloader = downloader
@@ -734,8 +1192,9 @@ class DownloadTask(object):
         # Variables for speed limit and speed calculation
         self.__start_time = 0
         self.__start_blocks = 0
-        self.__limit_rate_value = self._config.limit.bandwidth.kbps
-        self.__limit_rate = self._config.limit.bandwidth.enabled
+        self.__last_speed_update = 0
+        self.__limit_rate = bandwidth_limiter.rate
+        self.__limited_bytes = None
 
         # Progress update functions
         self._progress_updated = None
@@ -744,7 +1203,12 @@ class DownloadTask(object):
         # If the tempname already exists, set progress accordingly
         if os.path.exists(self.tempname):
             try:
-                already_downloaded = os.path.getsize(self.tempname)
+                segmented = SegmentedDownload.load(self.tempname)
+                if segmented is not None:
+                    # The partial file of a segmented download is preallocated
+                    already_downloaded = segmented.downloaded
+                else:
+                    already_downloaded = os.path.getsize(self.tempname)
                 if self.total_size > 0:
                     self.progress = max(0.0, min(1.0, already_downloaded / self.total_size))
             except OSError as os_error:
@@ -804,6 +1268,7 @@ class DownloadTask(object):
                     self._progress_updated(self.progress)
                     self._last_progress_updated = time.time()
 
+        self.limit_speed(count, blockSize)
         self.calculate_speed(count, blockSize)
 
         if self.status == DownloadTask.CANCELLING:
@@ -812,24 +1277,30 @@ class DownloadTask(object):
         if self.status == DownloadTask.PAUSING:
             raise DownloadCancelledException()
 
-    def calculate_speed(self, count, blockSize):
-        if count % 5 == 0:
-            now = time.time()
-            if self.__start_time > 0:
-                # Has rate limiting been enabled or disabled?
-                if self.__limit_rate != self._config.limit.bandwidth.enabled:
-                    # If it has been enabled then reset base time and block count
-                    if self._config.limit.bandwidth.enabled:
-                        self.__start_time = now
-                        self.__start_blocks = count
-                    self.__limit_rate = self._config.limit.bandwidth.enabled
-
-                # Has the rate been changed and are we currently limiting?
-                if self.__limit_rate_value != self._config.limit.bandwidth.kbps and self.__limit_rate:
-                    self.__start_time = now
-                    self.__start_blocks = count
-                    self.__limit_rate_value = self._config.limit.bandwidth.kbps
+    def limit_speed(self, count, blockSize):
+        # The limit is shared by all downloads and can change at any time
+        if self._config.limit.bandwidth.enabled:
+            bandwidth_limiter.set_rate(self._config.limit.bandwidth.kbps * 1024)
+        else:
+            bandwidth_limiter.set_rate(0)
+
+        if getattr(self.custom_downloader, 'limits_bandwidth', False):
+            return
+
+        # Other downloaders only tell us how much they have downloaded,
+        # so pay for the data received since the last call after the fact
+        downloaded = count * blockSize
+        if self.__limited_bytes is not None and downloaded > self.__limited_bytes:
+            bandwidth_limiter.consume(downloaded - self.__limited_bytes)
+        self.__limited_bytes = downloaded
 
+    def calculate_speed(self, count, blockSize):
+        now = time.time()
+        # Downloaders may call this for every block, so don't do it too often
+        if now - self.__last_speed_update >= self.MIN_TIME_BETWEEN_SPEED_UPDATES:
+            self.__last_speed_update = now
+            # Restart the calculation if the bandwidth limit has been changed
+            if self.__start_time > 0 and self.__limit_rate == bandwidth_limiter.rate:
                 passed = now - self.__start_time
                 if passed > 0:
                     speed = ((count - self.__start_blocks) * blockSize) / passed
@@ -838,20 +1309,11 @@ class DownloadTask(object):
             else:
                 self.__start_time = now
                 self.__start_blocks = count
-                passed = now - self.__start_time
-                speed = count * blockSize
+                self.__limit_rate = bandwidth_limiter.rate
+                speed = 0
 
             self.speed = float(speed)
 
-            if self._config.limit.bandwidth.enabled and speed > self._config.limit.bandwidth.kbps:
-                # calculate the time that should have passed to reach
-                # the desired download rate and wait if necessary
-                should_have_passed = (count - self.__start_blocks) * blockSize / (self._config.limit.bandwidth.kbps * 1024.0)
-                if should_have_passed > passed:
-                    # sleep a maximum of 10 seconds to not cause time-outs
-                    delay = min(10.0, float(should_have_passed - passed))
-                    time.sleep(delay)
-
     def recycle(self):
         if self.status not in (self.FAILED, self.PAUSED):
             self.episode.download_task = None
@@ -864,12 +1326,14 @@ class DownloadTask(object):
         # Speed calculation (re-)starts here
         self.__start_time = 0
         self.__start_blocks = 0
+        self.__last_speed_update = 0
+        self.__limited_bytes = None
 
         # If the download has already been cancelled/paused, skip it
         with self:
             if self.status == DownloadTask.CANCELLING:
-                self.status = DownloadTask.CANCELLED
                 self.__episode._download_error = None
+                self.status = DownloadTask.CANCELLED
                 self.delete_partial_files()
                 self.progress = 0.0
                 self.speed = 0.0
@@ -1036,8 +1500,8 @@ class DownloadTask(object):
             self.speed = 0.0
 
             if result == DownloadTask.FAILED:
-                self.status = DownloadTask.FAILED
                 self.__episode._download_error = self.error_message
+                self.status = DownloadTask.FAILED
 
             # cancelled/paused -- update state to mark it as safe to manipulate this task again
             elif self.status == DownloadTask.PAUSING:
@@ -36,7 +36,7 @@ import os
 import re
 
 import gpodder
-from gpodder import util
+from gpodder import startupprofile, util
 
 _ = gpodder.gettext
 
@@ -337,7 +337,10 @@ class ExtensionManager(object):
             logger.info('Disabling all extensions (from environment)')
             return
 
-        for name, (extension_priority, filename) in self._find_extensions():
+        with startupprofile.phase('find extensions'):
+            found_extensions = self._find_extensions()
+
+        for name, (extension_priority, filename) in found_extensions:
             logger.debug('Found extension "%s", priority %s, in %s', name, extension_priority, filename)
             config = getattr(core.config.extensions, name)
             container = ExtensionContainer(self, name, config, filename, priority=extension_priority)
@@ -22,12 +22,13 @@
 # Thomas Perl <thp@gpodder.org>; 2009-06-11
 #
 
+import hashlib
 import logging
+import tempfile
 import urllib.parse
 from html.parser import HTMLParser
-from io import BytesIO
 
-from gpodder import util, youtube
+from gpodder import util
 
 logger = logging.getLogger(__name__)
 
@@ -81,7 +82,8 @@ class AuthenticationRequired(Exception):
 
 
 # Successful status codes
-UPDATED_FEED, NEW_LOCATION, NOT_MODIFIED = list(range(3))
+# (UNCHANGED_FEED: downloaded again, but the contents have not changed)
+UPDATED_FEED, NEW_LOCATION, NOT_MODIFIED, UNCHANGED_FEED = list(range(4))
 
 
 class Result:
@@ -111,15 +113,36 @@ class FeedAutodiscovery(HTMLParser):
                 logger.info('Feed autodiscovery: %s', url)
                 self._resolved_url = url
             elif is_youtube and is_canonical and url:
+                from gpodder import youtube
                 url = youtube.parse_youtube_url(url)
                 logger.info('Feed autodiscovery: %s', url)
                 self._resolved_url = url
 
 
 class FetcherFeedData:
-    def __init__(self, text, content):
-        self.text = text
-        self.content = content
+    """Body of a downloaded feed, for helpers that need more than the parsed feed
+
+    The body is kept in a (spooled) temporary file and only read into
+    memory when text or content are accessed. It is closed once the feed
+    has been parsed, so it can only be used during Fetcher.parse_feed().
+    """
+    def __init__(self, body, encoding=None, digest=None):
+        self._body = body
+        self._encoding = encoding
+        self.digest = digest
+
+    @property
+    def content(self):
+        self._body.seek(0)
+        content = self._body.read()
+        # The body might still be parsed
+        self._body.seek(0)
+        return content
+
+    @property
+    def text(self):
+        # Decoded like requests.Response.text
+        return self.content.decode(self._encoding or 'utf-8', errors='replace')
 
 
 class Fetcher(object):
@@ -130,6 +153,12 @@ class Fetcher(object):
                   'application/xml',
                   'text/xml')
 
+    # Feeds larger than this are written to disk while downloading
+    SPOOL_MAX_SIZE = 1024 * 1024
+
+    # Size of the chunks read from the network
+    CHUNK_SIZE = 64 * 1024
+
     def _resolve_url(self, url):
         """Provide additional ways of resolving an URL.
 
@@ -164,11 +193,21 @@ class Fetcher(object):
         else:
             raise UnknownStatusCode(status)
 
+    def get_feed_digest(self, content_digest, **kwargs):
+        """Return a digest of the feed, given the SHA-1 of its contents
+
+        kwargs are passed from Fetcher.fetch. Subclasses can add
+        to the digest everything else that affects parsing the feed.
+        """
+        return content_digest
+
     def parse_feed(self, url, feed_data, data_stream, headers, status, **kwargs):
         """Parse feed.
 
         kwargs are passed from Fetcher.fetch
         :param str url: real url
+        :param FetcherFeedData feed_data: body of the feed (None for local files),
+            only available until parse_feed() returns
         :param data_stream: file-like object to read from (bytes mode)
         :param dict-like headers: response headers (may be empty)
         :param int status: always UPDATED_FEED for now
@@ -176,13 +215,18 @@ class Fetcher(object):
         """
         raise NotImplementedError("Implement parse_feed()")
 
-    def fetch(self, url, etag=None, modified=None, autodiscovery=True, **kwargs):
-        """Use kwargs to pass extra data to parse_feed in Fetcher subclasses."""
+    def fetch(self, url, etag=None, modified=None, autodiscovery=True, feed_digest=None, **kwargs):
+        """Use kwargs to pass extra data to parse_feed in Fetcher subclasses.
+
+        If feed_digest is the digest of the downloaded feed (see
+        get_feed_digest), the feed is not parsed and UNCHANGED_FEED is
+        returned, for servers that don't support conditional requests.
+        """
         # handle local file first
         if url.startswith('file://'):
             url = url[len('file://'):]
-            stream = open(url)
-            return self.parse_feed(url, None, stream, {}, UPDATED_FEED, **kwargs)
+            with open(url) as stream:
+                return self.parse_feed(url, None, stream, {}, UPDATED_FEED, **kwargs)
 
         # remote feed
         headers = {}
@@ -191,37 +235,54 @@ class Fetcher(object):
         if etag is not None:
             headers['If-None-Match'] = etag
 
-        stream = util.urlopen(url, headers)
-
-        responses = stream.history + [stream]
-        for i, resp in enumerate(responses):
-            if resp.is_permanent_redirect:
-                # there should always be a next response when a redirect is encountered
-                # If max redirects is reached, TooManyRedirects is raised
-                # TODO: since we've got the end contents anyway, modify model.py to accept contents on NEW_LOCATION
-                return Result(NEW_LOCATION, responses[i + 1].url)
-        res = self._check_statuscode(stream.status_code, stream.url)
-        if res == NOT_MODIFIED:
-            return Result(NOT_MODIFIED, stream.url)
-
-        if autodiscovery and stream.headers.get('content-type', '').startswith('text/html'):
-            ad = FeedAutodiscovery(url)
-            # response_text() will assume utf-8 if no charset specified
-            ad.feed(util.response_text(stream))
-            if ad._resolved_url and ad._resolved_url != url:
-                try:
-                    self.fetch(ad._resolved_url, etag=None, modified=None, autodiscovery=False, **kwargs)
-                    return Result(NEW_LOCATION, ad._resolved_url)
-                except Exception:
-                    logger.warning('Feed autodiscovery failed', exc_info=True)
-
-            # Second, try to resolve the URL
-            new_url = self._resolve_url(url)
-            if new_url and new_url != url:
-                return Result(NEW_LOCATION, new_url)
+        with util.urlopen(url, headers, stream=True) as stream:
+            responses = stream.history + [stream]
+            for i, resp in enumerate(responses):
+                if resp.is_permanent_redirect:
+                    # there should always be a next response when a redirect is encountered
+                    # If max redirects is reached, TooManyRedirects is raised
+                    # TODO: since we've got the end contents anyway, modify model.py to accept contents on NEW_LOCATION
+                    return Result(NEW_LOCATION, responses[i + 1].url)
+            res = self._check_statuscode(stream.status_code, stream.url)
+            if res == NOT_MODIFIED:
+                return Result(NOT_MODIFIED, stream.url)
+
+            if autodiscovery and stream.headers.get('content-type', '').startswith('text/html'):
+                ad = FeedAutodiscovery(url)
+                # response_text() will assume utf-8 if no charset specified
+                ad.feed(util.response_text(stream))
+                if ad._resolved_url and ad._resolved_url != url:
+                    try:
+                        self.fetch(ad._resolved_url, etag=None, modified=None, autodiscovery=False, **kwargs)
+                        return Result(NEW_LOCATION, ad._resolved_url)
+                    except Exception:
+                        logger.warning('Feed autodiscovery failed', exc_info=True)
+
+                # Second, try to resolve the URL
+                new_url = self._resolve_url(url)
+                if new_url and new_url != url:
+                    return Result(NEW_LOCATION, new_url)
+
+            # Don't keep (possibly several) copies of large feeds in memory,
+            # the parser reads the feed from the temporary file in chunks
+            body = tempfile.SpooledTemporaryFile(self.SPOOL_MAX_SIZE)
+            content_hash = hashlib.sha1()
+            for chunk in stream.iter_content(self.CHUNK_SIZE):
+                content_hash.update(chunk)
+                body.write(chunk)
+            body.seek(0)
+
+        digest = self.get_feed_digest(content_hash.hexdigest(), **kwargs)
+        if feed_digest is not None and digest == feed_digest:
+            logger.debug('Feed contents have not changed: %s', url)
+            body.close()
+            return Result(UNCHANGED_FEED, stream.url)
 
         # xml documents specify the encoding inline so better pass encoded body.
         # Especially since requests will use ISO-8859-1 for content-type 'text/xml'
         # if the server doesn't specify a charset.
-        return self.parse_feed(url, FetcherFeedData(stream.text, stream.content), BytesIO(stream.content), stream.headers,
-                            UPDATED_FEED, **kwargs)
+        try:
+            return self.parse_feed(url, FetcherFeedData(body, stream.encoding, digest), body, stream.headers,
+                                   UPDATED_FEED, **kwargs)
+        finally:
+            body.close()
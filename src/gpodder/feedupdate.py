@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.feedupdate - Parallel podcast feed updates (2018-06-12)
+#
+
+
+import collections
+import logging
+import threading
+import urllib.parse
+
+from gpodder import feedcore, util
+
+logger = logging.getLogger(__name__)
+
+
+class FeedUpdateStatistics(object):
+    def __init__(self):
+        self.updated = 0
+        self.not_modified = 0
+        # Downloaded again, but with the same contents (see feedcore.UNCHANGED_FEED)
+        self.skipped = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.new_episodes = []
+
+    @property
+    def unchanged(self):
+        """Number of podcasts without changes, whether downloaded again or not"""
+        return self.not_modified + self.skipped
+
+
+class FeedUpdateScheduler(object):
+    """Update many podcasts using a bounded pool of worker threads
+
+    Fetching feeds is done in parallel (at most max_workers at once and
+    at most max_per_host at once for the same server). Writing the results
+    to the database is serialized using the write lock of the database.
+
+    The callbacks are called from the worker threads, but never at the
+    same time, so they don't need any locking of their own:
+
+        on_started(channel, position, total)
+        on_finished(channel, new_episodes, error, position, total)
+
+    is_cancelled is polled before each podcast is started; podcasts that
+    have not been started when it returns True are skipped.
+    """
+    # How often to check for cancellation while waiting for a host slot
+    POLL_INTERVAL = .2
+
+    def __init__(self, max_workers=4, max_per_host=2):
+        self.max_workers = max(1, int(max_workers))
+        self.max_per_host = max(1, int(max_per_host))
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @staticmethod
+    def get_host(channel):
+        return urllib.parse.urlparse(channel.url).hostname or ''
+
+    def run(self, channels, max_episodes=0, on_started=None,
+            on_finished=None, is_cancelled=None):
+        """Update channels, returns a FeedUpdateStatistics object
+
+        Blocks until all channels have been processed or the update
+        has been cancelled (and all running updates have finished).
+        """
+        self._cancelled = False
+        pending = collections.deque(channels)
+        total = len(pending)
+        stats = FeedUpdateStatistics()
+        if not total:
+            return stats
+
+        condition = threading.Condition()
+        callback_lock = threading.Lock()
+        active_hosts = collections.Counter()
+        started = [0]
+
+        def cancelled():
+            if not self._cancelled and is_cancelled is not None and is_cancelled():
+                self._cancelled = True
+            return self._cancelled
+
+        def next_channel():
+            with condition:
+                while pending:
+                    if cancelled():
+                        stats.cancelled += len(pending)
+                        pending.clear()
+                        break
+
+                    for index, channel in enumerate(pending):
+                        host = self.get_host(channel)
+                        if active_hosts[host] < self.max_per_host:
+                            del pending[index]
+                            active_hosts[host] += 1
+                            started[0] += 1
+                            return channel, host, started[0]
+
+                    condition.wait(self.POLL_INTERVAL)
+
+                return None
+
+        def release_host(host):
+            with condition:
+                active_hosts[host] -= 1
+                condition.notify_all()
+
+        def notify(callback, *args):
+            if callback is None:
+                return
+            with callback_lock:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    logger.error('Error in feed update callback: %s', e, exc_info=True)
+
+        def update_channel(channel, host, position):
+            notify(on_started, channel, position, total)
+
+            new_episodes = []
+            error = None
+            try:
+                try:
+                    result = channel.fetch_update(max_episodes)
+                finally:
+                    release_host(host)
+
+                with channel.db.write_lock:
+                    new_episodes = channel.update(max_episodes, result=result)
+            except Exception as e:
+                error = e
+
+            with callback_lock:
+                if error is not None:
+                    stats.failed += 1
+                elif result.status == feedcore.NOT_MODIFIED:
+                    stats.not_modified += 1
+                elif result.status == feedcore.UNCHANGED_FEED:
+                    stats.skipped += 1
+                else:
+                    stats.updated += 1
+                stats.new_episodes.extend(new_episodes)
+
+            notify(on_finished, channel, new_episodes, error, position, total)
+
+        def worker():
+            while True:
+                item = next_channel()
+                if item is None:
+                    break
+                update_channel(*item)
+
+        threads = [util.run_in_background(worker, True)
+                   for _ in range(min(self.max_workers, total))]
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(self.POLL_INTERVAL)
+        except KeyboardInterrupt:
+            # Let running updates finish, so the database stays consistent
+            self.cancel()
+            for thread in threads:
+                thread.join()
+            raise
+
+        logger.info('Updated %d podcasts (%d not modified, %d skipped as unchanged, %d failed, %d cancelled)',
+                    stats.updated, stats.not_modified, stats.skipped, stats.failed, stats.cancelled)
+        return stats
@@ -33,7 +33,7 @@ except ImportError:
     sys.exit(1)
 
 import gpodder
-from gpodder import core, util
+from gpodder import core, startupprofile, util
 from gpodder.model import check_root_folder_path
 
 from .config import UIConfig
@@ -224,7 +224,10 @@ class gPodderApplication(Gtk.Application):
         if not self.window:
             # Windows are associated with the application
             # when the last one is closed the application shuts down
-            self.window = gPodder(self, core.Core(UIConfig, model_class=Model), self.options)
+            with startupprofile.phase('main window'):
+                self.window = gPodder(self, core.Core(UIConfig, model_class=Model), self.options)
+            # Startup is done when the main loop gets idle for the first time
+            util.idle_add(startupprofile.finish)
 
             if gpodder.ui.osx:
                 from . import macosx
@@ -25,7 +25,6 @@
 
 import collections
 import html
-import threading
 
 from gi.repository import Gtk
 
@@ -35,33 +34,18 @@ from gpodder import download, util
 _ = gpodder.gettext
 
 
-class DequeueRequest:
-    def __init__(self):
-        self.cv = threading.Condition()
-        self.value = None
-        self.resolved = False
-
-    def dequeue(self):
-        with self.cv:
-            self.cv.wait_for(lambda: self.resolved)
-            return self.value
-
-    def resolve(self, value):
-        self.value = value
-        self.resolved = True
-        with self.cv:
-            self.cv.notify()
-
-
 class DownloadStatusModel(Gtk.ListStore):
     # Symbolic names for our columns, so we know what we're up to
     C_TASK, C_NAME, C_URL, C_PROGRESS, C_PROGRESS_TEXT, C_ICON_NAME = list(range(6))
 
     SEARCH_COLUMNS = (C_NAME, C_URL)
 
-    def __init__(self):
+    def __init__(self, config):
         Gtk.ListStore.__init__(self, object, str, str, int, str, str)
 
+        # Decides which queued task to download next (without the main loop)
+        self.scheduler = download.DownloadScheduler(config)
+
         # Set up stock icon IDs for tasks
         self._status_ids = collections.defaultdict(lambda: None)
         self._status_ids[download.DownloadTask.DOWNLOADING] = 'folder-download-symbolic'
@@ -140,10 +124,7 @@ class DownloadStatusModel(Gtk.ListStore):
             self.__add_new_task(task)
 
     def queue_task(self, task):
-        with task:
-            if task.status in (task.NEW, task.FAILED, task.CANCELLED, task.PAUSED):
-                task.status = task.QUEUED
-                task.set_episode_download_task()
+        self.scheduler.queue_task(task)
 
     def tell_all_tasks_to_quit(self):
         for row in self:
@@ -174,33 +155,14 @@ class DownloadStatusModel(Gtk.ListStore):
         return False
 
     def has_work(self):
-        return any(self._work_gen())
+        return self.scheduler.has_work()
 
     def available_work_count(self):
-        return len(list(self._work_gen()))
-
-    def __get_next(self, dqr):
-        try:
-            task = next(self._work_gen())
-            # this is the only thread accessing the list store, so it's safe
-            # to assume a) the task is still queued and b) we can transition to downloading
-            task.status = task.DOWNLOADING
-        except StopIteration:
-            task = None
-        # hand the task off to the worker thread
-        dqr.resolve(task)
-
-    # get the next task to download. this proxies the request to the main thread,
-    # as only the main thread is allowed to manipulate the list store.
+        return self.scheduler.available_work_count()
+
+    # called from the worker threads
     def get_next(self):
-        dqr = DequeueRequest()
-        util.idle_add(self.__get_next, dqr)
-        return dqr.dequeue()
-
-    def _work_gen(self):
-        return (task for task in
-                (row[DownloadStatusModel.C_TASK] for row in self)
-                if task.status == task.QUEUED)
+        return self.scheduler.get_next()
 
 
 class DownloadTaskMonitor(object):
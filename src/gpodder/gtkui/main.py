@@ -33,10 +33,10 @@ import requests.exceptions
 import urllib3.exceptions
 
 import gpodder
-from gpodder import (common, download, feedcore, my, opml, registry, util,
-                     youtube)
+from gpodder import (common, download, feedcore, feedupdate, my, opml,
+                     registry, util, youtube)
 from gpodder.dbusproxy import DBusPodcastsProxy
-from gpodder.model import Model, PodcastEpisode, episode_object_by_uri
+from gpodder.model import Model, PodcastEpisode
 from gpodder.player import MyGPOClientObserver, PlayerInterface
 from gpodder.services import AutoRegisterObserver
 from gpodder.syncui import gPodderSyncUI
@@ -146,7 +146,7 @@ class gPodder(BuilderWidget):
 
         self.new_episodes_window = None
 
-        self.download_status_model = DownloadStatusModel()
+        self.download_status_model = DownloadStatusModel(self.config)
         self.download_queue_manager = download.DownloadQueueManager(self.config, self.download_status_model)
 
         self.config.connect_gtk_spinbutton('limit.downloads.concurrent', self.spinMaxDownloads,
@@ -185,10 +185,11 @@ class gPodder(BuilderWidget):
 
         # Subscribed channels
         self.active_channel = None
+        self.model.defer_download_folder_checks = self.config.downloads.check_folders_in_background
         self.channels = self.model.get_podcasts()
 
         # For loading the list model
-        self.episode_list_model = EpisodeListModel(self.on_episode_list_filter_changed)
+        self.episode_list_model = EpisodeListModel(self.on_episode_list_filter_changed, self.db)
 
         self.create_actions()
 
@@ -241,6 +242,9 @@ class gPodder(BuilderWidget):
         self.partial_downloads_indicator = None
         util.run_in_background(self.find_partial_downloads)
 
+        if self.model.defer_download_folder_checks:
+            util.run_in_background(self.check_download_folders)
+
         # Start the auto-update procedure
         self._auto_update_timer_source_id = None
         if self.config.auto.update.enabled:
@@ -447,6 +451,11 @@ class gPodder(BuilderWidget):
             self._for_each_task_set_status(selected_tasks, download.DownloadTask.QUEUED)
         self.resume_all_infobar.set_revealed(False)
 
+    def check_download_folders(self):
+        self.model.check_download_folders()
+        util.idle_add(self.update_podcast_list_model)
+        util.idle_add(self.update_episode_list_model)
+
     def find_partial_downloads(self):
         def start_progress_callback(count):
             if count:
@@ -902,9 +911,9 @@ class gPodder(BuilderWidget):
         namecell.set_property('ellipsize', Pango.EllipsizeMode.END)
         namecolumn = Gtk.TreeViewColumn(_('Episode'))
         namecolumn.pack_start(iconcell, False)
-        namecolumn.add_attribute(iconcell, 'icon-name', EpisodeListModel.C_STATUS_ICON)
+        self.episode_list_model.add_field_attribute(namecolumn, iconcell, 'icon-name', 'status_icon')
         namecolumn.pack_start(namecell, True)
-        namecolumn.add_attribute(namecell, 'markup', EpisodeListModel.C_DESCRIPTION)
+        self.episode_list_model.add_field_attribute(namecolumn, namecell, 'markup', 'description')
         namecolumn.set_sort_column_id(EpisodeListModel.C_DESCRIPTION)
         namecolumn.set_sizing(Gtk.TreeViewColumnSizing.AUTOSIZE)
         namecolumn.set_resizable(True)
@@ -919,19 +928,21 @@ class gPodder(BuilderWidget):
 
         sizecell = Gtk.CellRendererText()
         sizecell.set_property('xalign', 1)
-        sizecolumn = Gtk.TreeViewColumn(_('Size'), sizecell, text=EpisodeListModel.C_FILESIZE_TEXT)
+        sizecolumn = Gtk.TreeViewColumn(_('Size'), sizecell)
+        self.episode_list_model.add_field_attribute(sizecolumn, sizecell, 'text', 'filesize_text')
         sizecolumn.set_sort_column_id(EpisodeListModel.C_FILESIZE)
 
         timecell = Gtk.CellRendererText()
         timecell.set_property('xalign', 1)
-        timecolumn = Gtk.TreeViewColumn(_('Duration'), timecell, text=EpisodeListModel.C_TIME)
+        timecolumn = Gtk.TreeViewColumn(_('Duration'), timecell)
+        self.episode_list_model.add_field_attribute(timecolumn, timecell, 'text', 'time')
         timecolumn.set_sort_column_id(EpisodeListModel.C_TOTAL_TIME)
 
         self.releasecell = Gtk.CellRendererText()
         self.align_releasecell()
         releasecolumn = Gtk.TreeViewColumn(_('Released'))
         releasecolumn.pack_start(self.releasecell, True)
-        releasecolumn.add_attribute(self.releasecell, 'markup', EpisodeListModel.C_PUBLISHED_TEXT)
+        self.episode_list_model.add_field_attribute(releasecolumn, self.releasecell, 'markup', 'published_text')
         releasecolumn.set_sort_column_id(EpisodeListModel.C_PUBLISHED)
 
         sizetimecell = Gtk.CellRendererText()
@@ -939,7 +950,7 @@ class gPodder(BuilderWidget):
         sizetimecell.set_property('alignment', Pango.Alignment.RIGHT)
         sizetimecolumn = Gtk.TreeViewColumn(_('Size+'))
         sizetimecolumn.pack_start(sizetimecell, True)
-        sizetimecolumn.add_attribute(sizetimecell, 'markup', EpisodeListModel.C_FILESIZE_AND_TIME_TEXT)
+        self.episode_list_model.add_field_attribute(sizetimecolumn, sizetimecell, 'markup', 'filesize_and_time_text')
         sizetimecolumn.set_sort_column_id(EpisodeListModel.C_FILESIZE_AND_TIME)
 
         timesizecell = Gtk.CellRendererText()
@@ -947,7 +958,7 @@ class gPodder(BuilderWidget):
         timesizecell.set_property('alignment', Pango.Alignment.RIGHT)
         timesizecolumn = Gtk.TreeViewColumn(_('Duration+'))
         timesizecolumn.pack_start(timesizecell, True)
-        timesizecolumn.add_attribute(timesizecell, 'markup', EpisodeListModel.C_TIME_AND_SIZE)
+        self.episode_list_model.add_field_attribute(timesizecolumn, timesizecell, 'markup', 'time_and_size')
         timesizecolumn.set_sort_column_id(EpisodeListModel.C_TOTAL_TIME_AND_SIZE)
 
         namecolumn.set_reorderable(True)
@@ -1472,7 +1483,8 @@ class gPodder(BuilderWidget):
             setattr(treeview, TreeViewHelper.LAST_TOOLTIP, url)
 
             if role == TreeViewHelper.ROLE_EPISODES:
-                description = model.get_value(iterator, EpisodeListModel.C_TOOLTIP)
+                episode = model.get_value(iterator, EpisodeListModel.C_EPISODE)
+                description = self.episode_list_model.get_row_fields(episode).tooltip if episode is not None else None
                 if description:
                     tooltip.set_text(description)
                 else:
@@ -2173,6 +2185,7 @@ class gPodder(BuilderWidget):
         groups = collections.defaultdict(list)
         for episode in episodes:
             episode._download_error = None
+            episode.changed()
 
             if episode.download_task is not None and episode.download_task.status == episode.download_task.FAILED:
                 if not episode.can_stream(self.config):
@@ -2189,6 +2202,7 @@ class gPodder(BuilderWidget):
                 filename = episode.get_playback_url(self.config, allow_partial)
             except Exception as e:
                 episode._download_error = str(e)
+                episode.changed()
                 continue
 
             # Mark episode as played in the database
@@ -2317,8 +2331,8 @@ class gPodder(BuilderWidget):
         current_day = t[:3]
         if self.last_episode_date_refresh is not None and self.last_episode_date_refresh != current_day:
             # update all episodes in current view
-            for row in self.episode_list_model:
-                row[EpisodeListModel.C_PUBLISHED_TEXT] = row[EpisodeListModel.C_EPISODE].cute_pubdate()
+            self.episode_list_model.clear_row_fields()
+            self.treeAvailable.queue_draw()
 
         self.last_episode_date_refresh = current_day
 
@@ -2732,31 +2746,40 @@ class gPodder(BuilderWidget):
         @util.run_in_background
         def update_feed_cache_proc():
             updated_channels = []
-            nr_update_errors = 0
-            new_episodes = []
-            for updated, channel in enumerate(channels):
-                if self.feed_cache_update_cancelled:
-                    break
+            finished = [0]
 
-                def indicate_updating_podcast(channel):
-                    d = {'podcast': channel.title, 'position': updated + 1, 'total': count}
-                    progression = _('Updating %(podcast)s (%(position)d/%(total)d)') % d
-                    logger.info(progression)
-                    self.pbFeedUpdate.set_text(progression)
+            def indicate_updating_podcast(channel, position, total):
+                d = {'podcast': channel.title, 'position': position, 'total': total}
+                progression = _('Updating %(podcast)s (%(position)d/%(total)d)') % d
+                logger.info(progression)
+                self.pbFeedUpdate.set_text(progression)
 
-                try:
-                    channel._update_error = None
-                    util.idle_add(indicate_updating_podcast, channel)
-                    new_episodes.extend(channel.update(max_episodes=self.config.limit.episodes))
+            def on_started(channel, position, total):
+                channel._update_error = None
+                util.idle_add(indicate_updating_podcast, channel, position, total)
+
+            def update_progress(channel, fraction):
+                self.update_podcast_list_model([channel.url])
+
+                # If the currently-viewed podcast is updated, reload episodes
+                if self.active_channel is not None and \
+                        self.active_channel == channel:
+                    logger.debug('Updated channel is active, updating UI')
+                    self.update_episode_list_model()
+
+                self.pbFeedUpdate.set_fraction(fraction)
+
+            def on_finished(channel, episodes, error, position, total):
+                if error is None:
                     self._update_cover(channel)
-                except Exception as e:
-                    message = str(e)
+                else:
+                    message = str(error)
                     if message:
                         channel._update_error = message
                     else:
                         channel._update_error = '?'
-                    nr_update_errors += 1
-                    logger.error('Error updating feed: %s: %s', channel.title, message, exc_info=(e.__class__ not in [
+                    # Runs outside of the except block, so pass the exception itself
+                    logger.error('Error updating feed: %s: %s', channel.title, message, exc_info=(error if error.__class__ not in [
                         gpodder.feedcore.BadRequest,
                         gpodder.feedcore.AuthenticationRequired,
                         gpodder.feedcore.Unsubscribe,
@@ -2767,22 +2790,23 @@ class gPodder(BuilderWidget):
                         requests.exceptions.RetryError,
                         urllib3.exceptions.MaxRetryError,
                         urllib3.exceptions.ReadTimeoutError,
-                    ]))
+                    ] else False))
 
                 updated_channels.append(channel)
-
-                def update_progress(channel):
-                    self.update_podcast_list_model([channel.url])
-
-                    # If the currently-viewed podcast is updated, reload episodes
-                    if self.active_channel is not None and \
-                            self.active_channel == channel:
-                        logger.debug('Updated channel is active, updating UI')
-                        self.update_episode_list_model()
-
-                    self.pbFeedUpdate.set_fraction(float(updated + 1) / float(count))
-
-                util.idle_add(update_progress, channel)
+                finished[0] += 1
+                util.idle_add(update_progress, channel, float(finished[0]) / float(total))
+
+            scheduler = feedupdate.FeedUpdateScheduler(
+                self.config.limit.updates.concurrent,
+                self.config.limit.updates.per_host)
+            stats = scheduler.run(channels,
+                                  max_episodes=self.config.limit.episodes,
+                                  on_started=on_started,
+                                  on_finished=on_finished,
+                                  is_cancelled=lambda: self.feed_cache_update_cancelled)
+            nr_update_errors = stats.failed
+            nr_unchanged = stats.unchanged
+            new_episodes = stats.new_episodes
 
             if nr_update_errors > 0:
                 self.notification(
@@ -2817,11 +2841,18 @@ class gPodder(BuilderWidget):
                 # Remove episodes without downloadable content
                 downloadable_episodes = [e for e in episodes if e.url]
 
+                # Feeds that were not modified or downloaded with the same contents
+                unchanged_message = ''
+                if nr_unchanged > 0:
+                    unchanged_message = ' - ' + N_('%(count)d podcast unchanged',
+                                                   '%(count)d podcasts unchanged',
+                                                   nr_unchanged) % {'count': nr_unchanged}
+
                 if not downloadable_episodes:
                     # Nothing new here - but inform the user
                     self.pbFeedUpdate.set_fraction(1.0)
-                    self.pbFeedUpdate.set_text(
-                        _('No new episodes with downloadable content') if episodes else _('No new episodes'))
+                    message = _('No new episodes with downloadable content') if episodes else _('No new episodes')
+                    self.pbFeedUpdate.set_text(message + unchanged_message)
                     self.feed_cache_update_cancelled = True
                     self.btnCancelFeedUpdate.show()
                     self.btnCancelFeedUpdate.set_sensitive(True)
@@ -2835,7 +2866,7 @@ class gPodder(BuilderWidget):
                     self.pbFeedUpdate.set_fraction(1.0)
 
                     if self.config.ui.gtk.new_episodes == 'download':
-                        self.download_episode_list(episodes)
+                        self.download_episode_list(episodes, automatic=True)
                         title = N_('Downloading %(count)d new episode.',
                                    'Downloading %(count)d new episodes.',
                                    count) % {'count': count}
@@ -2855,7 +2886,7 @@ class gPodder(BuilderWidget):
                             message = N_('%(count)d new episode available',
                                          '%(count)d new episodes available',
                                          count) % {'count': count}
-                            self.pbFeedUpdate.set_text(message)
+                            self.pbFeedUpdate.set_text(message + unchanged_message)
 
                     self.show_update_feeds_buttons()
 
@@ -3152,7 +3183,8 @@ class gPodder(BuilderWidget):
     def download_episode_list_paused(self, episodes, hide_progress=False):
         self.download_episode_list(episodes, True, hide_progress=hide_progress)
 
-    def download_episode_list(self, episodes, add_paused=False, force_start=False, downloader=None, hide_progress=False):
+    def download_episode_list(self, episodes, add_paused=False, force_start=False, downloader=None, hide_progress=False,
+                              automatic=False):
         # Start progress indicator to queue existing tasks
         count = len(episodes)
         if count and not hide_progress:
@@ -3215,6 +3247,7 @@ class gPodder(BuilderWidget):
             logger.debug('Downloading episode: %s', episode.title)
             if not episode.was_downloaded(and_exists=True):
                 episode._download_error = None
+                episode.changed()
                 if episode.state == gpodder.STATE_DELETED:
                     episode.state = gpodder.STATE_NORMAL
                     episode.save()
@@ -3224,6 +3257,7 @@ class gPodder(BuilderWidget):
                         task_exists = True
                         task.unpause()
                         task.reuse()
+                        task.automatic = automatic
                         if task.status not in (task.DOWNLOADING, task.QUEUED):
                             if downloader:
                                 # replace existing task's download with forced one
@@ -3237,8 +3271,10 @@ class gPodder(BuilderWidget):
 
                 try:
                     task = download.DownloadTask(episode, self.config, downloader=downloader)
+                    task.automatic = automatic
                 except Exception as e:
                     episode._download_error = str(e)
+                    episode.changed()
                     d = {'episode': html.escape(episode.title), 'message': html.escape(str(e))}
                     message = _('Download error while downloading %(episode)s: %(message)s')
                     self.show_message(message % d, _('Download error'), important=True)
@@ -4015,7 +4051,7 @@ class gPodder(BuilderWidget):
                 self.on_itemUpdate_activate,
                 self.playback_episodes,
                 self.download_episode_list,
-                (lambda uri: episode_object_by_uri(self.channels, uri)),
+                self.model.get_episode_by_uri,
                 self.show_gui_window,
                 self.offer_new_episodes,
                 self.subscribe_to_url,
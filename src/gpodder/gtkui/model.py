@@ -23,6 +23,7 @@
 #  Based on code from libpodcasts.py (thp, 2005-10-29)
 #
 
+import collections
 import html
 import logging
 import os
@@ -105,9 +106,10 @@ class SeparatorMarker(object):
 
 
 class BackgroundUpdate(object):
-    def __init__(self, model, episodes):
+    def __init__(self, model, episodes, only_changed=False):
         self.model = model
-        self.episodes = episodes
+        self.episodes = collections.deque(episodes)
+        self.only_changed = only_changed
         self.index = 0
 
     def update(self):
@@ -115,24 +117,29 @@ class BackgroundUpdate(object):
 
         started = time.time()
         while self.episodes:
-            episode = self.episodes.pop(0)
+            episode = self.episodes.popleft()
+            try:
+                it = model.get_iter((self.index,))
+            # fix #727 the tree might be invalid when trying to update so discard the exception
+            except ValueError:
+                break
+
+            # Skip rows that are up to date with the episode
+            if (self.only_changed and model.get_value(it, model.C_EPISODE) is episode
+                    and model.get_value(it, model.C_VERSION) == episode.version):
+                self.index += 1
+                continue
+
             base_fields = (
                 model.C_URL, episode.url,
                 model.C_TITLE, episode.title,
                 model.C_EPISODE, episode,
-                model.C_PUBLISHED_TEXT, episode.cute_pubdate(show_time=self.model._config_ui_gtk_episode_list_show_released_time),
                 model.C_PUBLISHED, episode.published,
             )
             update_fields = model.get_update_fields(episode)
-            try:
-                it = model.get_iter((self.index,))
-            # fix #727 the tree might be invalid when trying to update so discard the exception
-            except ValueError:
-                break
-            # model.get_update_fields() takes 38-67% of each iteration, depending on episode status
-            # with downloaded episodes using the most time
-            # model.set(), excluding the field expansion, takes 33-62% of each iteration
-            # and each iteration takes 1ms or more on slow machines
+            # Only the columns needed for filtering and sorting are set here,
+            # the displayed text and icons are computed when a row is drawn
+            # (see EpisodeListModel.get_row_fields())
             model.set(it, *(base_fields + update_fields))
             self.index += 1
 
@@ -143,6 +150,16 @@ class BackgroundUpdate(object):
         return bool(self.episodes)
 
 
+class EpisodeRowFields(object):
+    """Displayed text and icons of an episode list row"""
+    __slots__ = ('status_icon', 'description', 'tooltip', 'time', 'filesize_text',
+                 'published_text', 'time_and_size', 'filesize_and_time_text')
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
 class EpisodeListModel(Gtk.ListStore):
     C_URL, C_TITLE, C_FILESIZE_TEXT, C_EPISODE, C_STATUS_ICON, \
         C_PUBLISHED_TEXT, C_DESCRIPTION, C_TOOLTIP, \
@@ -150,7 +167,8 @@ class EpisodeListModel(Gtk.ListStore):
         C_VIEW_SHOW_UNPLAYED, C_FILESIZE, C_PUBLISHED, \
         C_TIME, C_TIME_VISIBLE, C_TOTAL_TIME, \
         C_LOCKED, \
-        C_TIME_AND_SIZE, C_TOTAL_TIME_AND_SIZE, C_FILESIZE_AND_TIME_TEXT, C_FILESIZE_AND_TIME = list(range(21))
+        C_TIME_AND_SIZE, C_TOTAL_TIME_AND_SIZE, C_FILESIZE_AND_TIME_TEXT, C_FILESIZE_AND_TIME, \
+        C_VERSION = list(range(22))
 
     VIEW_ALL, VIEW_UNDELETED, VIEW_DOWNLOADED, VIEW_UNPLAYED = list(range(4))
 
@@ -162,11 +180,15 @@ class EpisodeListModel(Gtk.ListStore):
     # Steps for the "downloading" icon progress
     PROGRESS_STEPS = 20
 
-    def __init__(self, on_filter_changed=lambda has_episodes: None):
+    # How many rows to keep the displayed fields of (see get_row_fields())
+    ROW_FIELDS_CACHE_SIZE = 500
+
+    def __init__(self, on_filter_changed=lambda has_episodes: None, db=None):
         Gtk.ListStore.__init__(self, str, str, str, object, str, str, str,
                                str, bool, bool, bool, GObject.TYPE_INT64,
                                GObject.TYPE_INT64, str, bool,
-                               GObject.TYPE_INT64, bool, str, GObject.TYPE_INT64, str, GObject.TYPE_INT64)
+                               GObject.TYPE_INT64, bool, str, GObject.TYPE_INT64, str, GObject.TYPE_INT64,
+                               GObject.TYPE_INT64)
 
         # Callback for when the filter / list changes, gets one parameter
         # (has_episodes) that is True if the list has any episodes
@@ -179,6 +201,20 @@ class EpisodeListModel(Gtk.ListStore):
         self._search_term = None
         self._search_term_eql = None
         self._filter.set_visible_func(self._filter_visible_func)
+        self._sorter.set_sort_func(self.C_DESCRIPTION, self._sort_by_description)
+
+        # The displayed fields of the most recently drawn rows, the
+        # least recently used episodes come first (see get_row_fields())
+        self._row_fields = collections.OrderedDict()
+
+        # Set when settings change, so that update_all() also
+        # updates the rows of episodes that have not changed
+        self._update_unchanged_rows = False
+
+        # For text searches, the IDs of the episodes that can match
+        # (found in the search index of db), None to check all episodes
+        self._db = db
+        self._search_ids = None
 
         # Are we currently showing "all episodes"/section or a single channel?
         self._section_view = False
@@ -210,6 +246,13 @@ class EpisodeListModel(Gtk.ListStore):
         self._config_ui_gtk_episode_list_show_released_time = False
 
     def cache_config(self, config):
+        if (self._config_ui_gtk_episode_list_always_show_new != config.ui.gtk.episode_list.always_show_new
+                or self._config_ui_gtk_episode_list_trim_title_prefix != config.ui.gtk.episode_list.trim_title_prefix
+                or self._config_ui_gtk_episode_list_descriptions != config.ui.gtk.episode_list.descriptions
+                or self._config_ui_gtk_episode_list_show_released_time != config.ui.gtk.episode_list.show_released_time):
+            self.clear_row_fields()
+            self._update_unchanged_rows = True
+
         self._config_ui_gtk_episode_list_always_show_new = config.ui.gtk.episode_list.always_show_new
         self._config_ui_gtk_episode_list_trim_title_prefix = config.ui.gtk.episode_list.trim_title_prefix
         self._config_ui_gtk_episode_list_descriptions = config.ui.gtk.episode_list.descriptions
@@ -228,6 +271,9 @@ class EpisodeListModel(Gtk.ListStore):
             if episode is None:
                 return False
 
+            if self._search_ids is not None and episode.id not in self._search_ids:
+                return False
+
             try:
                 return self._search_term_eql.match(episode)
             except Exception:
@@ -244,6 +290,19 @@ class EpisodeListModel(Gtk.ListStore):
 
         return True
 
+    def _sort_by_description(self, model, iter_a, iter_b, data):
+        # Same order as sorting by the description markup: new episodes
+        # (in bold) first, then by title, without formatting any markup
+        keys = []
+        for iterator in (iter_a, iter_b):
+            episode = model.get_value(iterator, self.C_EPISODE)
+            if episode is None:
+                keys.append((False, ''))
+                continue
+            title = episode.trimmed_title if self._config_ui_gtk_episode_list_trim_title_prefix else episode.title
+            keys.append((not (episode.state != gpodder.STATE_DELETED and episode.is_new), title))
+        return (keys[0] > keys[1]) - (keys[0] < keys[1])
+
     def get_filtered_model(self):
         """Return a filtered version of this episode model.
 
@@ -280,12 +339,22 @@ class EpisodeListModel(Gtk.ListStore):
         if self._search_term != new_term:
             self._search_term = new_term
             self._search_term_eql = query.UserEQL(new_term)
+            self._update_search_ids()
             self._filter.refilter()
             self._on_filter_changed(self.has_episodes())
 
     def get_search_term(self):
         return self._search_term
 
+    def _update_search_ids(self):
+        self._search_ids = None
+        if self._db is not None and self._search_term_eql is not None:
+            text = self._search_term_eql.get_search_text()
+            if text:
+                ids = self._db.search_episodes([text])
+                if ids is not None:
+                    self._search_ids = set(ids)
+
     def _format_description(self, episode):
         d = []
 
@@ -316,6 +385,11 @@ class EpisodeListModel(Gtk.ListStore):
         """
         # Remove old episodes in the list store
         self.clear()
+        self.clear_row_fields()
+        self._update_unchanged_rows = False
+
+        # Episodes might have been added or changed
+        self._update_search_ids()
 
         self._section_view = isinstance(channel, PodcastChannelProxy)
 
@@ -333,11 +407,11 @@ class EpisodeListModel(Gtk.ListStore):
 
         self._update_from_episodes(episodes)
 
-    def _update_from_episodes(self, episodes):
+    def _update_from_episodes(self, episodes, only_changed=False):
         if self.background_update_tag is not None:
             GLib.source_remove(self.background_update_tag)
 
-        self.background_update = BackgroundUpdate(self, episodes)
+        self.background_update = BackgroundUpdate(self, episodes, only_changed)
         self.background_update_tag = GLib.idle_add(self._update_background)
 
     def _update_background(self):
@@ -360,7 +434,10 @@ class EpisodeListModel(Gtk.ListStore):
             # ...and also include episodes that still need to be initialized
             episodes.extend(self.background_update.episodes)
 
-        self._update_from_episodes(episodes)
+        # Rows of unchanged episodes are skipped, unless the settings changed
+        only_changed = not self._update_unchanged_rows
+        self._update_unchanged_rows = False
+        self._update_from_episodes(episodes, only_changed)
 
     def update_by_urls(self, urls):
         for row in self:
@@ -374,12 +451,77 @@ class EpisodeListModel(Gtk.ListStore):
         self.update_by_iter(self._filter.convert_iter_to_child_iter(iterator))
 
     def get_update_fields(self, episode):
-        tooltip = []
-        status_icon = None
+        """Return the columns used for filtering and sorting episode
+
+        These are cheap to compute, and are kept up to date for all rows.
+        """
         view_show_undeleted = True
         view_show_downloaded = False
         view_show_unplayed = False
 
+        if episode.downloading:
+            view_show_downloaded = True
+            view_show_unplayed = True
+        elif episode.state == gpodder.STATE_DELETED:
+            view_show_undeleted = False
+        elif episode.state == gpodder.STATE_DOWNLOADED:
+            view_show_downloaded = True
+            view_show_unplayed = episode.is_new
+        elif episode.state == gpodder.STATE_NORMAL and episode.is_new:
+            view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
+            view_show_unplayed = True
+
+        return (
+                self.C_VIEW_SHOW_UNDELETED, view_show_undeleted,
+                self.C_VIEW_SHOW_DOWNLOADED, view_show_downloaded,
+                self.C_VIEW_SHOW_UNPLAYED, view_show_unplayed,
+                self.C_TOTAL_TIME, episode.total_time,
+                self.C_LOCKED, episode.archive,
+                self.C_FILESIZE, episode.file_size,
+                self.C_TOTAL_TIME_AND_SIZE, episode.total_time,
+                self.C_FILESIZE_AND_TIME, episode.file_size,
+                self.C_VERSION, episode.version,
+        )
+
+    def get_row_fields(self, episode):
+        """Return the EpisodeRowFields of episode
+
+        The fields are only computed for rows that are drawn, and the
+        most recently used ones are cached until the episode changes
+        (i.e. until its version is incremented).
+        """
+        version, fields = self._row_fields.get(episode, (None, None))
+        if version == episode.version:
+            self._row_fields.move_to_end(episode)
+            return fields
+
+        fields = self._get_row_fields(episode)
+        self._row_fields[episode] = (episode.version, fields)
+        self._row_fields.move_to_end(episode)
+        if len(self._row_fields) > self.ROW_FIELDS_CACHE_SIZE:
+            self._row_fields.popitem(last=False)
+        return fields
+
+    def clear_row_fields(self):
+        """Forget the cached fields of all episodes (e.g. when settings change)"""
+        self._row_fields.clear()
+
+    def add_field_attribute(self, column, cell, attribute, field):
+        """Like column.add_attribute(), but with a field of get_row_fields()"""
+        column.set_cell_data_func(cell, self._cell_data_func, (attribute, field))
+
+    def _cell_data_func(self, column, cell, model, iterator, data):
+        attribute, field = data
+        episode = model.get_value(iterator, self.C_EPISODE)
+        if episode is None:
+            cell.set_property(attribute, None)
+        else:
+            cell.set_property(attribute, getattr(self.get_row_fields(episode), field))
+
+    def _get_row_fields(self, episode):
+        tooltip = []
+        status_icon = None
+
         if episode.downloading:
             task = episode.download_task
             if task.status in (task.PAUSING, task.PAUSED):
@@ -391,18 +533,11 @@ class EpisodeListModel(Gtk.ListStore):
                     int(task.progress * 100)))
                 index = int(self.PROGRESS_STEPS * task.progress)
                 status_icon = 'gpodder-progress-%d' % index
-
-            view_show_downloaded = True
-            view_show_unplayed = True
         else:
             if episode.state == gpodder.STATE_DELETED:
                 tooltip.append(_('Deleted'))
                 status_icon = self.ICON_DELETED
-                view_show_undeleted = False
             elif episode.state == gpodder.STATE_DOWNLOADED:
-                view_show_downloaded = True
-                view_show_unplayed = episode.is_new
-
                 file_type = episode.file_type()
                 if file_type == 'audio':
                     tooltip.append(_('Downloaded episode'))
@@ -443,19 +578,11 @@ class EpisodeListModel(Gtk.ListStore):
             elif episode._download_error is not None:
                 tooltip.append(_('ERROR: %s') % episode._download_error)
                 status_icon = self.ICON_ERROR
-                if episode.state == gpodder.STATE_NORMAL and episode.is_new:
-                    view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
-                    view_show_unplayed = True
             elif not episode.url:
                 tooltip.append(_('No downloadable content'))
                 status_icon = self.ICON_WEB_BROWSER
-                if episode.state == gpodder.STATE_NORMAL and episode.is_new:
-                    view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
-                    view_show_unplayed = True
             elif episode.state == gpodder.STATE_NORMAL and episode.is_new:
                 tooltip.append(_('New episode'))
-                view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
-                view_show_unplayed = True
 
         if episode.total_time:
             total_time = util.format_time(episode.total_time)
@@ -468,29 +595,21 @@ class EpisodeListModel(Gtk.ListStore):
         time = episode.get_play_info_string()
         filesize = self._format_filesize(episode)
 
-        return (
-                self.C_STATUS_ICON, status_icon,
-                self.C_VIEW_SHOW_UNDELETED, view_show_undeleted,
-                self.C_VIEW_SHOW_DOWNLOADED, view_show_downloaded,
-                self.C_VIEW_SHOW_UNPLAYED, view_show_unplayed,
-                self.C_DESCRIPTION, description,
-                self.C_TOOLTIP, tooltip,
-                self.C_TIME, time,
-                self.C_TIME_VISIBLE, bool(episode.total_time),
-                self.C_TOTAL_TIME, episode.total_time,
-                self.C_LOCKED, episode.archive,
-                self.C_FILESIZE_TEXT, filesize,
-                self.C_FILESIZE, episode.file_size,
-
-                self.C_TIME_AND_SIZE, "%s\n<small>%s</small>" % (time, filesize if episode.file_size > 0 else ""),
-                self.C_TOTAL_TIME_AND_SIZE, episode.total_time,
-                self.C_FILESIZE_AND_TIME_TEXT, "%s\n<small>%s</small>" % (filesize if episode.file_size > 0 else "", time),
-                self.C_FILESIZE_AND_TIME, episode.file_size,
+        return EpisodeRowFields(
+                status_icon=status_icon,
+                description=description,
+                tooltip=tooltip,
+                time=time,
+                filesize_text=filesize,
+                published_text=episode.cute_pubdate(show_time=self._config_ui_gtk_episode_list_show_released_time),
+                time_and_size="%s\n<small>%s</small>" % (time, filesize if episode.file_size > 0 else ""),
+                filesize_and_time_text="%s\n<small>%s</small>" % (filesize if episode.file_size > 0 else "", time),
         )
 
     def update_by_iter(self, iterator):
         episode = self.get_value(iterator, self.C_EPISODE)
-        if episode is not None:
+        if episode is not None and self.get_value(iterator, self.C_VERSION) != episode.version:
+            # Also emits "row-changed", so the row is drawn with new fields
             self.set(iterator, *self.get_update_fields(episode))
 
 
@@ -586,6 +705,9 @@ class PodcastListModel(Gtk.ListStore):
         self._scale = 1
         self._cover_downloader = cover_downloader
 
+        # What each row was last drawn from, to skip unchanged rows in update_by_iter()
+        self._row_keys = {}
+
         self.icon_theme = Gtk.IconTheme.get_default()
         self.ICON_DISABLED = 'media-playback-pause'
         self.ICON_ERROR = 'dialog-warning'
@@ -658,6 +780,7 @@ class PodcastListModel(Gtk.ListStore):
         self._max_image_side = size * scale
         self._scale = scale
         self._cover_cache = {}
+        self._row_keys = {}
 
     def _resize_pixbuf_keep_ratio(self, url, pixbuf):
         """Resizes a GTK Pixbuf but keeps its aspect ratio.
@@ -814,6 +937,7 @@ class PodcastListModel(Gtk.ListStore):
     def set_channels(self, db, config, channels):
         # Clear the model and update the list of podcasts
         self.clear()
+        self._row_keys = {}
 
         def channel_to_row(channel, add_overlay=False):
             # C_URL, C_TITLE, C_DESCRIPTION, C_PILL, C_CHANNEL
@@ -927,6 +1051,14 @@ class PodcastListModel(Gtk.ListStore):
 
         total, deleted, new, downloaded, unplayed = channel.get_statistics()
 
+        # Formatting the description and drawing the pill and cover
+        # can be skipped if nothing that is shown in the row changed
+        row_key = ((total, deleted, new, downloaded, unplayed), channel.title, channel.description,
+                   channel.section, channel.pause_subscription, channel._update_error)
+        if self._row_keys.get(channel) == row_key:
+            return
+        self._row_keys[channel] = row_key
+
         if isinstance(channel, PodcastChannelProxy) and not channel.ALL_EPISODES_PROXY:
             section = channel.title
 
@@ -962,6 +1094,9 @@ class PodcastListModel(Gtk.ListStore):
             logger.info('Clearing cover from cache: %s', podcast_url)
             del self._cover_cache[podcast_url]
 
+        self._row_keys = {channel: row_key for channel, row_key in self._row_keys.items()
+                          if channel.url != podcast_url}
+
     def add_cover_by_channel(self, channel, pixbuf):
         if pixbuf is None:
             return
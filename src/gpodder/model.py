@@ -33,13 +33,13 @@ import os
 import re
 import shutil
 import string
+import sys
+import threading
 import time
 import urllib.parse
 
-import podcastparser
-
 import gpodder
-from gpodder import coverart, feedcore, registry, schema, util, vimeo, youtube
+from gpodder import feedcore, query, registry, schema, startupprofile, util
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +77,10 @@ class Feed:
         """Return the last HTTP Last-Modified header, for conditional request next time, or None."""
         return None
 
+    def get_feed_digest(self):
+        """Return the digest of the feed contents, to skip parsing it next time if unchanged, or None."""
+        return None
+
     def get_new_episodes(self, channel, existing_guids):
         """Produce new episodes and update old ones.
 
@@ -88,6 +92,18 @@ class Feed:
         """
         return ([], set())
 
+    def prepare_episodes(self, channel, existing_guids):
+        """Do the network requests of get_new_episodes() ahead of time.
+
+        Called without holding the database write lock (see
+        PodcastChannel.fetch_update), so this must not touch the database.
+        :param PodcastChannel channel: the updated channel
+        :param dict(str, PodcastEpisode): existing episodes, by guid
+        :return (list(PodcastEpisode), set(str)): new and changed episodes, all_seen_guids
+                                                  or None if not supported
+        """
+        return None
+
     def get_next_page(self, channel, max_episodes):
         """Paginated feed support (RFC 5005).
 
@@ -100,24 +116,28 @@ class Feed:
 
 
 class PodcastParserFeed(Feed):
-    def __init__(self, feed, fetcher, max_episodes=0):
+    # After this many known and unchanged episodes in a row, older known
+    # episodes are only checked for changes of their fingerprint, e.g. not
+    # for missing YouTube durations (0 = always check everything)
+    STOP_AFTER_KNOWN_EPISODES = 20
+
+    def __init__(self, feed, fetcher, max_episodes=0, feed_data=None):
         self.feed = feed
         self.fetcher = fetcher
         self.max_episodes = max_episodes
+        self.feed_data = feed_data
+        # Results of prepare_episodes() and get_next_page(), which are
+        # called by fetch_update() before update() needs them
+        self._prepared = None
+        self._next_pages = {}
 
     def get_title(self):
         return self.feed.get('title')
 
     def get_link(self):
-        vid = youtube.get_youtube_id(self.feed['url'])
-        if vid is not None:
-            self.feed['link'] = youtube.get_channel_id_url(self.feed['url'], self.fetcher.feed_data)
         return self.feed.get('link')
 
     def get_description(self):
-        vid = youtube.get_youtube_id(self.feed['url'])
-        if vid is not None:
-            self.feed['description'] = youtube.get_channel_desc(self.feed['url'], self.fetcher.feed_data)
         return self.feed.get('description')
 
     def get_cover_url(self):
@@ -132,12 +152,21 @@ class PodcastParserFeed(Feed):
     def get_http_last_modified(self):
         return self.feed.get('headers', {}).get('last-modified')
 
-    def get_new_episodes(self, channel, existing_guids):
+    def get_feed_digest(self):
+        return self.feed_data.digest if self.feed_data is not None else None
+
+    def prepare_episodes(self, channel, existing_guids):
+        if self._prepared is not None:
+            return self._prepared[:2]
+
         # Keep track of episode GUIDs currently seen in the feed
         seen_guids = set()
 
-        # list of new episodes
-        new_episodes = []
+        # list of new and modified episodes, not yet merged with the existing ones
+        episodes = []
+
+        # durations of YouTube episodes, by guid
+        durations = {}
 
         # We have to sort the entries in descending chronological order,
         # because if the feed lists items in ascending order and has >
@@ -150,9 +179,24 @@ class PodcastParserFeed(Feed):
             entries = entries[:self.max_episodes]
 
         num_duplicate_guids = 0
+        known_episodes = 0
 
         # Search all entries for new episodes
         for entry in entries:
+            # Look up known episodes before parsing the entry, unchanged ones are skipped
+            existing_episode = existing_guids.get(entry['guid'])
+            if existing_episode is not None and entry['guid'] not in seen_guids:
+                # Entries are sorted newest first, after a run of known episodes
+                # older ones are only updated when their entry has changed
+                stopped = self.STOP_AFTER_KNOWN_EPISODES and known_episodes >= self.STOP_AFTER_KNOWN_EPISODES
+                if (existing_episode.fingerprint == channel.EpisodeClass.get_entry_fingerprint(entry)
+                        and (stopped or not (existing_episode.total_time == 0 and 'youtube' in existing_episode.url))):
+                    seen_guids.add(entry['guid'])
+                    known_episodes += 1
+                    continue
+
+            if known_episodes < self.STOP_AFTER_KNOWN_EPISODES:
+                known_episodes = 0
             episode = channel.EpisodeClass.from_podcastparser_entry(entry, channel)
             if episode is None:
                 continue
@@ -160,31 +204,65 @@ class PodcastParserFeed(Feed):
             # Discard episode when its GUID collides with a newer episode
             if episode.guid in seen_guids:
                 num_duplicate_guids += 1
-                channel._update_error = ('Discarded {} episode(s) with non-unique GUID, contact the podcast publisher to fix this issue.'
-                        .format(num_duplicate_guids))
                 logger.warning('Discarded episode with non-unique GUID, contact the podcast publisher to fix this issue. [%s] [%s]',
                         channel.title, episode.title)
                 continue
 
             seen_guids.add(episode.guid)
+            existing_episode = existing_guids.get(episode.guid, None)
+            total_time = existing_episode.total_time if existing_episode else episode.total_time
+            if total_time == 0 and 'youtube' in episode.url:
+                # query duration for new and existing youtube episodes that haven't been
+                # downloaded or queried such as live streams after they have ended
+                from gpodder import youtube
+                durations[episode.guid] = youtube.get_total_time(episode)
+
+            episodes.append(episode)
+
+        self._prepared = (episodes, seen_guids, durations, num_duplicate_guids)
+        return self._prepared[:2]
+
+    def get_new_episodes(self, channel, existing_guids):
+        episodes, seen_guids = self.prepare_episodes(channel, existing_guids)
+        durations, num_duplicate_guids = self._prepared[2:]
+        if num_duplicate_guids:
+            channel._update_error = ('Discarded {} episode(s) with non-unique GUID, contact the podcast publisher to fix this issue.'
+                    .format(num_duplicate_guids))
+
+        # list of new episodes
+        new_episodes = []
+
+        # list of new and modified episodes, saved all at once
+        changed_episodes = []
+
+        for episode in episodes:
             # Detect (and update) existing episode based on GUIDs
             existing_episode = existing_guids.get(episode.guid, None)
             if existing_episode:
-                existing_episode.update_from(episode)
+                changed = existing_episode.update_from(episode)
                 episode = existing_episode
             else:
                 new_episodes.append(episode)
+                changed = True
 
-            if episode.total_time == 0 and 'youtube' in episode.url:
-                # query duration for new and existing youtube episodes that haven't been
-                # downloaded or queried such as live streams after they have ended
-                episode.total_time = youtube.get_total_time(episode)
+            if episode.total_time == 0 and episode.guid in durations:
+                episode.total_time = durations[episode.guid]
+                changed = changed or episode.total_time != 0
+
+            # Unchanged episodes don't need to be written again
+            if changed:
+                episode.cache_text_description()
+                changed_episodes.append(episode)
 
-            episode.cache_text_description()
-            episode.save()
+        channel.save_episodes(changed_episodes)
         return new_episodes, seen_guids
 
     def get_next_page(self, channel, max_episodes):
+        if max_episodes not in self._next_pages:
+            self._next_pages[max_episodes] = self._fetch_next_page(channel, max_episodes)
+        return self._next_pages[max_episodes]
+
+    def _fetch_next_page(self, channel, max_episodes):
         if 'paged_feed_next' in self.feed:
             url = self.feed['paged_feed_next']
             logger.debug("get_next_page: feed has next %s", url)
@@ -205,20 +283,40 @@ class gPodderFetcher(feedcore.Fetcher):
         # Note: using a HTTPBasicAuthHandler would be pain because we need to
         # know the realm. It can be done, but I think this method works, too
         url = channel.authenticate_url(channel.url)
-        return self.fetch(url, channel.http_etag, channel.http_last_modified, max_episodes=max_episodes)
+        return self.fetch(url, channel.http_etag, channel.http_last_modified,
+                          feed_digest=channel.feed_digest, max_episodes=max_episodes)
 
     def _resolve_url(self, url):
+        from gpodder import vimeo, youtube
         url = youtube.get_real_channel_url(url)
         url = vimeo.get_real_channel_url(url)
         return url
 
+    def get_feed_digest(self, content_digest, max_episodes=0, **kwargs):
+        # A different episode limit gives different results for the same feed
+        return '%s-%d' % (content_digest, max_episodes)
+
+    def _get_youtube_metadata(self, url, feed_data):
+        """Return the channel link and description of YouTube feeds"""
+        from gpodder import youtube
+        if youtube.get_youtube_id(url) is None:
+            return {}
+
+        return {
+            'link': youtube.get_channel_id_url(url, feed_data),
+            'description': youtube.get_channel_desc(url, feed_data),
+        }
+
     def parse_feed(self, url, feed_data, data_stream, headers, status, max_episodes=0, **kwargs):
-        self.feed_data = feed_data
         try:
+            # Parsing closes the body, which might be needed for YouTube feeds
+            youtube_metadata = self._get_youtube_metadata(url, feed_data)
+            import podcastparser
             feed = podcastparser.parse(url, data_stream)
             feed['url'] = url
             feed['headers'] = headers
-            return feedcore.Result(status, PodcastParserFeed(feed, self, max_episodes))
+            feed.update(youtube_metadata)
+            return feedcore.Result(status, PodcastParserFeed(feed, self, max_episodes, feed_data))
         except ValueError as e:
             raise feedcore.InvalidFeed('Could not parse feed: {url}: {msg}'.format(url=url, msg=e))
 
@@ -268,7 +366,39 @@ class PodcastEpisode(PodcastModelObject):
     MAX_FILENAME_LENGTH = 120  # without extension
     MAX_FILENAME_WITH_EXT_LENGTH = 140 - len(".partial.webm")  # with extension
 
-    __slots__ = schema.EpisodeColumns + ('_download_error', '_text_description',)
+    __slots__ = (schema.EpisodeSummaryColumns
+                 + tuple('_' + name for name in schema.EpisodeDetailColumns)
+                 + ('_details_loaded', '_download_error', '_cached_text_description', 'version',))
+
+    def _detail_property(name):
+        """Column that is loaded from the database on first access
+
+        Episodes are loaded without their (large) detail columns, they are
+        loaded for the whole podcast when one of them is first accessed.
+        """
+        attr = '_' + name
+
+        def getter(self):
+            if not self._details_loaded:
+                self.parent._load_episode_details(self)
+            return getattr(self, attr)
+
+        def setter(self, value):
+            if not self._details_loaded:
+                self.parent._load_episode_details(self)
+            setattr(self, attr, value)
+            self._cached_text_description = None
+
+        return property(getter, setter)
+
+    # Columns that usually have the same value for many episodes, only one
+    # copy of each value is kept in memory for episodes loaded from the database
+    SHARED_STRING_COLUMNS = ('mime_type', 'episode_art_url', 'payment_url')
+
+    description = _detail_property('description')
+    description_html = _detail_property('description_html')
+    chapters = _detail_property('chapters')
+    del _detail_property
 
     def _deprecated(self):
         raise Exception('Property is deprecated!')
@@ -277,20 +407,28 @@ class PodcastEpisode(PodcastModelObject):
     is_locked = property(fget=_deprecated, fset=_deprecated)
 
     def has_website_link(self):
+        from gpodder import youtube
         return bool(self.link) and (self.link != self.url
                 or youtube.is_video_link(self.link))
 
+    @staticmethod
+    def get_entry_fingerprint(entry):
+        """Return a fingerprint of a podcastparser entry, to detect changes"""
+        data = json.dumps(entry, sort_keys=True, default=str).encode('utf-8')
+        return int.from_bytes(hashlib.sha1(data).digest()[:8], 'big', signed=True)
+
     @classmethod
     def from_podcastparser_entry(cls, entry, channel):
         episode = cls(channel)
         episode.guid = entry['guid']
+        episode.fingerprint = cls.get_entry_fingerprint(entry)
         episode.title = entry['title']
         episode.link = entry['link']
         episode.episode_art_url = entry.get('episode_art_url')
 
         # Only one of the two description fields should be set at a time.
         # This keeps the database from doubling in size and reduces load time from slow storage.
-        # episode._text_description is initialized by episode.cache_text_description() from the set field.
+        # episode._text_description is computed on first use from the set field.
         # episode.html_description() returns episode.description_html or generates from episode.description.
         if entry.get('description_html'):
             episode.description = ''
@@ -319,7 +457,7 @@ class PodcastEpisode(PodcastModelObject):
 
         url_is_invalid = False
         for enclosure in entry['enclosures']:
-            episode.mime_type = enclosure['mime_type']
+            episode.mime_type = sys.intern(enclosure['mime_type'])
 
             # Skip images in feeds if audio or video is available (bug 979)
             # This must (and does) also look in Media RSS enclosures (bug 1430)
@@ -350,6 +488,7 @@ class PodcastEpisode(PodcastModelObject):
                 episode._download_error = 'Invalid episode URL'
             return episode
 
+        from gpodder import vimeo, youtube
         if any(mod.is_video_link(episode.url) for mod in (youtube, vimeo)):
             return episode
 
@@ -375,6 +514,12 @@ class PodcastEpisode(PodcastModelObject):
         self.podcast_id = self.parent.id
         self.children = (None, None)
 
+        self._details_loaded = True
+        self._cached_text_description = None
+
+        # Incremented when the episode changes (see changed())
+        self.version = 0
+
         self.id = None
         self.url = ''
         self.title = ''
@@ -389,6 +534,7 @@ class PodcastEpisode(PodcastModelObject):
         self.published = 0
         self.download_filename = None
         self.payment_url = None
+        self.fingerprint = 0
 
         self.state = gpodder.STATE_NORMAL
         self.is_new = True
@@ -403,7 +549,6 @@ class PodcastEpisode(PodcastModelObject):
         self.last_playback = 0
 
         self._download_error = None
-        self._text_description = ''
 
     @property
     def channel(self):
@@ -459,6 +604,7 @@ class PodcastEpisode(PodcastModelObject):
 
     def _set_download_task(self, download_task):
         self.children = (download_task, self.children[1])
+        self.changed()
 
     def _get_download_task(self):
         return self.children[0]
@@ -545,9 +691,18 @@ class PodcastEpisode(PodcastModelObject):
         return (self.state == gpodder.STATE_NORMAL and self.is_new
                 and not self.downloading)
 
+    def changed(self):
+        """Increment the version, so that the UI knows to update the episode
+
+        Called when the episode is saved and when its download progresses.
+        """
+        self.version += 1
+
     def save(self):
+        self.changed()
         gpodder.user_extensions.on_episode_save(self)
         self.db.save_episode(self)
+        self.parent.model._index_episode(self)
 
     def on_downloaded(self, filename):
         self.state = gpodder.STATE_DOWNLOADED
@@ -591,11 +746,23 @@ class PodcastEpisode(PodcastModelObject):
 
     def cache_text_description(self):
         if self.description:
-            self._text_description = self.description
+            self._cached_text_description = self.description
         elif self.description_html:
-            self._text_description = util.remove_html_tags(self.description_html)
+            self._cached_text_description = util.remove_html_tags(self.description_html)
         else:
-            self._text_description = ''
+            self._cached_text_description = ''
+
+    @property
+    def _text_description(self):
+        if self._cached_text_description is None:
+            self.cache_text_description()
+        return self._cached_text_description
+
+    def _set_details(self, details):
+        for name in schema.EpisodeDetailColumns:
+            setattr(self, '_' + name, details[name])
+        self._details_loaded = True
+        self._cached_text_description = None
 
     def html_description(self):
         return self.description_html \
@@ -643,17 +810,21 @@ class PodcastEpisode(PodcastModelObject):
             url = registry.download_url.resolve(config, self.url, self, allow_partial)
         return url
 
-    def find_unique_file_name(self, filename, extension):
+    def find_unique_file_name(self, filename, extension, taken_filenames=None):
         # Remove leading and trailing whitespace + dots (to avoid hidden files)
         filename = filename.strip('.' + string.whitespace) + extension
 
         for name in util.generate_names(filename):
-            if (not self.db.episode_filename_exists(self.podcast_id, name)
-                    or self.download_filename == name):
+            if taken_filenames is not None:
+                # Filenames of all episodes of the podcast, saves a query per name
+                taken = name in taken_filenames
+            else:
+                taken = self.db.episode_filename_exists(self.podcast_id, name)
+            if not taken or self.download_filename == name:
                 return name
 
     def local_filename(self, create, force_update=False, check_only=False,
-            template=None, return_wanted_filename=False):
+            template=None, return_wanted_filename=False, taken_filenames=None):
         """Get (and possibly generate) the local saving filename.
 
         Pass create=True if you want this function to generate a
@@ -684,6 +855,9 @@ class PodcastEpisode(PodcastModelObject):
         If return_wanted_filename is True, the filename will not be written to
         the database, but simply returned by this function (for use by the
         "import external downloads" feature).
+
+        If taken_filenames is a set of the download filenames of all episodes
+        in the podcast, it is used instead of querying the database.
         """
         if self.download_filename is None and (check_only or not create):
             return None
@@ -712,6 +886,7 @@ class PodcastEpisode(PodcastModelObject):
                 episode_filename, _ = util.filename_from_url(url)
 
             # Use title for YouTube, Vimeo and Soundcloud downloads
+            from gpodder import vimeo, youtube
             if (youtube.is_video_link(self.url)
                     or vimeo.is_video_link(self.url)
                     or episode_filename == 'stream'):
@@ -730,7 +905,7 @@ class PodcastEpisode(PodcastModelObject):
                 self.MAX_FILENAME_LENGTH,
                 self.MAX_FILENAME_WITH_EXT_LENGTH)
             # Find a unique filename for this episode
-            wanted_filename = self.find_unique_file_name(fn_template, ext)
+            wanted_filename = self.find_unique_file_name(fn_template, ext, taken_filenames)
 
             if return_wanted_filename:
                 # return the calculated filename without updating the database
@@ -806,6 +981,7 @@ class PodcastEpisode(PodcastModelObject):
 
     def file_type(self):
         # Assume all YouTube/Vimeo links are video files
+        from gpodder import vimeo, youtube
         if youtube.is_video_link(self.url) or vimeo.is_video_link(self.url):
             return 'video'
 
@@ -910,17 +1086,30 @@ class PodcastEpisode(PodcastModelObject):
             return '-'
 
     def update_from(self, episode):
-        for k in ('title', 'url', 'episode_art_url', 'description', 'description_html', 'chapters', 'link',
-                  'published', 'guid', 'payment_url'):
-            setattr(self, k, getattr(episode, k))
+        """Update the feed-provided fields from episode
+
+        Returns the names of the fields that have been changed,
+        an empty list if the episode doesn't need to be saved.
+        """
+        fields = ['title', 'url', 'episode_art_url', 'description', 'description_html', 'chapters', 'link',
+                  'published', 'guid', 'payment_url', 'fingerprint']
         # Don't overwrite file size on downloaded episodes
         # See #648 refreshing a youtube podcast clears downloaded file size
         if self.state != gpodder.STATE_DOWNLOADED:
-            setattr(self, 'file_size', getattr(episode, 'file_size'))
+            fields.append('file_size')
+
+        changed = []
+        for k in fields:
+            value = getattr(episode, k)
+            if getattr(self, k) != value:
+                setattr(self, k, value)
+                changed.append(k)
+        return changed
 
 
 class PodcastChannel(PodcastModelObject):
-    __slots__ = schema.PodcastColumns + ('_common_prefix', '_update_error',)
+    __slots__ = schema.PodcastColumns + ('_children', '_children_lock', '_detached_episodes',
+                                         '_common_prefix', '_update_error',)
 
     UNICODE_TRANSLATE = {ord('ö'): 'o', ord('ä'): 'a', ord('ü'): 'u'}
 
@@ -936,13 +1125,20 @@ class PodcastChannel(PodcastModelObject):
     MAX_FOLDERNAME_LENGTH = 60
     SECONDS_PER_DAY = 24 * 60 * 60
     SECONDS_PER_WEEK = 7 * 24 * 60 * 60
+    # Permanent redirects followed in a row by fetch_update()
+    MAX_NEW_LOCATIONS = 5
     EpisodeClass = PodcastEpisode
 
     feed_fetcher = gPodderFetcher()
 
     def __init__(self, model, channel_id=None):
         self.parent = model
-        self.children = []
+        self._children = []
+        self._children_lock = threading.Lock()
+
+        # Episodes loaded on their own (see get_detached_episode),
+        # by ID, until the other episodes are loaded, too
+        self._detached_episodes = {}
 
         self.id = channel_id
         self.url = None
@@ -957,6 +1153,7 @@ class PodcastChannel(PodcastModelObject):
 
         self.http_last_modified = None
         self.http_etag = None
+        self.feed_digest = None
 
         self.auto_archive_episodes = False
         self.download_folder = None
@@ -969,11 +1166,71 @@ class PodcastChannel(PodcastModelObject):
         self.download_strategy = PodcastChannel.STRATEGY_DEFAULT
 
         if self.id:
-            self.children = self.db.load_episodes(self, self.episode_factory)
-            self._determine_common_prefix()
+            # Episodes are loaded on first access (see children)
+            self._children = None
 
         self._update_error = None
 
+    @property
+    def children(self):
+        if self._children is None:
+            # Feed update workers and the UI may load the episodes at the same time
+            with self._children_lock:
+                if self._children is None:
+                    self._children = self.db.load_episodes(self, self._load_episode)
+                    self._detached_episodes = {}
+                    self._determine_common_prefix()
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    def _load_episode(self, d):
+        # Reuse episodes that have already been loaded on their own
+        episode = self._detached_episodes.get(d['id'])
+        if episode is None:
+            episode = self.episode_factory(d)
+        return episode
+
+    def get_detached_episode(self, d):
+        """Return the episode for a row of the episode table
+
+        Used to load single episodes without loading all episodes of the
+        podcast. The same episode is returned for the same row, and it
+        becomes part of children when all episodes are loaded later.
+        """
+        with self._children_lock:
+            if self._children is not None:
+                for episode in self._children:
+                    if episode.id == d['id']:
+                        return episode
+
+            episode = self._detached_episodes.get(d['id'])
+            if episode is None:
+                episode = self._detached_episodes[d['id']] = self.episode_factory(d)
+            return episode
+
+    def _load_episode_details(self, episode):
+        """Load the detail columns of episode and all other loaded episodes"""
+        if self._children is None:
+            # Loaded on its own (see Model.find_episodes)
+            episodes = {episode.id: episode}
+            rows = self.db.load_episode_details(self.id, episode.id)
+        else:
+            episodes = {e.id: e for e in self._children if not e._details_loaded}
+            episodes[episode.id] = episode
+            rows = self.db.load_episode_details(self.id)
+
+        for episode_id, details in rows:
+            e = episodes.pop(episode_id, None)
+            if e is not None:
+                e._set_details(details)
+
+        # Not in the database (anymore), keep the empty defaults
+        for e in episodes.values():
+            e._details_loaded = True
+
     @property
     def model(self):
         return self.parent
@@ -1002,9 +1259,10 @@ class PodcastChannel(PodcastModelObject):
         if new_url is None:
             return None
 
-        self.url = new_url
+        self.model._change_podcast_url(self, new_url)
         self.http_etag = None
         self.http_last_modified = None
+        self.feed_digest = None
         self.save()
         return new_url
 
@@ -1016,84 +1274,133 @@ class PodcastChannel(PodcastModelObject):
 
         This will also cause missing files to be marked as deleted.
         """
+        # List the folder once instead of checking each file separately,
+        # which is slow for large folders and on network filesystems.
+        # Like glob(), skip hidden files. youtube-dl and yt-dlp create
+        # <name>.partial and <name>.partial.<ext> files while downloading.
+        # On startup, the latter is reported as an unknown external file.
+        # Both files are properly removed when the download completes.
+        try:
+            with os.scandir(self.save_dir) as it:
+                existing_files = {entry.name for entry in it
+                        if not entry.name.startswith('.') and not entry.name.endswith('.partial')}
+        except FileNotFoundError:
+            existing_files = set()
+
         known_files = set()
 
-        for episode in self.get_episodes(gpodder.STATE_DOWNLOADED):
+        if self._children is None:
+            # Only load the downloaded episodes, not all of them
+            episodes = [self.get_detached_episode(row) for row in self.db.load_episodes_where(
+                'episode.podcast_id = ? AND episode.state = ?', (self.id, gpodder.STATE_DOWNLOADED))]
+        else:
+            episodes = self.get_episodes(gpodder.STATE_DOWNLOADED)
+
+        for episode in episodes:
             if episode.was_downloaded():
-                filename = episode.local_filename(create=False)
-                if filename is None:
+                basename = episode.download_filename
+                if basename is None:
                     # No filename has been determined for this episode
                     continue
 
-                if not os.path.exists(filename):
+                # Not listed can still mean a different case on case-insensitive filesystems
+                filename = os.path.join(self.save_dir, basename)
+                if basename not in existing_files and not os.path.exists(filename):
                     # File has been deleted by the user - simulate a
                     # delete event (also marks the episode as deleted)
                     logger.debug('Episode deleted: %s', filename)
                     episode.delete_from_disk()
                     continue
 
-                known_files.add(filename)
-
-        # youtube-dl and yt-dlp create <name>.partial and <name>.partial.<ext> files while downloading.
-        # On startup, the latter is reported as an unknown external file.
-        # Both files are properly removed when the download completes.
-        existing_files = {filename
-                for filename in glob.glob(os.path.join(self.save_dir, '*'))
-                if not filename.endswith('.partial')}
+                known_files.add(basename)
 
+        from gpodder import coverart
         ignore_files = ['folder' + ext for ext in
                 coverart.CoverDownloader.EXTENSIONS]
 
-        external_files = existing_files.difference(list(known_files)
-                + [os.path.join(self.save_dir, ignore_file)
-                 for ignore_file in ignore_files])
+        external_files = existing_files.difference(known_files, ignore_files)
         if not external_files:
             return
 
         all_episodes = self.get_all_episodes()
+        by_filename = {}
+        for episode in all_episodes:
+            if episode.download_filename:
+                by_filename.setdefault(episode.download_filename, episode)
+
+        # Wanted filenames are only determined when they are needed, all at once
+        by_wanted_filename = None
+        by_wanted_base = None
+        imported = set()
 
-        for filename in external_files:
-            found = False
+        for basename in sorted(external_files):
+            filename = os.path.join(self.save_dir, basename)
 
-            basename = os.path.basename(filename)
-            existing = [e for e in all_episodes if e.download_filename == basename]
-            if existing:
-                existing = existing[0]
+            existing = by_filename.get(basename)
+            if existing is not None:
                 logger.info('Importing external download: %s', filename)
                 existing.on_downloaded(filename)
                 continue
 
-            for episode in all_episodes:
-                wanted_filename = episode.local_filename(create=True,
-                        return_wanted_filename=True)
-                if basename == wanted_filename:
-                    logger.info('Importing external download: %s', filename)
-                    episode.download_filename = basename
-                    episode.on_downloaded(filename)
-                    found = True
+            if by_wanted_filename is None:
+                by_wanted_filename, by_wanted_base = self._get_wanted_filenames(all_episodes)
+
+            # Use the first episode (in episode list order) that wants this file
+            found = None
+            index, episode = by_wanted_filename.get(basename, (None, None))
+            if episode is not None and episode not in imported:
+                found = (index, episode)
+
+            target_base, target_ext = os.path.splitext(basename)
+            for index, episode, wanted_ext in by_wanted_base.get(target_base, ()):
+                if found is not None and found[0] <= index:
+                    break
+                if episode in imported:
+                    continue
+
+                # Filenames only differ by the extension
+                wanted_type = util.file_type_by_extension(wanted_ext)
+                target_type = util.file_type_by_extension(target_ext)
+
+                # If wanted type is None, assume that we don't know
+                # the right extension before the download (e.g. YouTube)
+                # if the wanted type is the same as the target type,
+                # assume that it's the correct file
+                if wanted_type is None or wanted_type == target_type:
+                    found = (index, episode)
                     break
 
-                wanted_base, wanted_ext = os.path.splitext(wanted_filename)
-                target_base, target_ext = os.path.splitext(basename)
-                if wanted_base == target_base:
-                    # Filenames only differ by the extension
-                    wanted_type = util.file_type_by_extension(wanted_ext)
-                    target_type = util.file_type_by_extension(target_ext)
-
-                    # If wanted type is None, assume that we don't know
-                    # the right extension before the download (e.g. YouTube)
-                    # if the wanted type is the same as the target type,
-                    # assume that it's the correct file
-                    if wanted_type is None or wanted_type == target_type:
-                        logger.info('Importing external download: %s', filename)
-                        episode.download_filename = basename
-                        episode.on_downloaded(filename)
-                        found = True
-                        break
-
-            if not found and not util.is_system_file(filename):
+            if found is not None:
+                index, episode = found
+                logger.info('Importing external download: %s', filename)
+                episode.download_filename = basename
+                episode.on_downloaded(filename)
+                imported.add(episode)
+                continue
+
+            if not util.is_system_file(filename):
                 logger.warning('Unknown external file: %s', filename)
 
+    def _get_wanted_filenames(self, episodes):
+        """Index the filenames that episodes would be downloaded to
+
+        Returns a dict filename -> (index, episode) and a dict
+        basename without extension -> [(index, episode, extension), ...],
+        where index is the position of the episode in episodes.
+        """
+        taken_filenames = {e.download_filename for e in episodes if e.download_filename}
+
+        by_wanted_filename = {}
+        by_wanted_base = {}
+        for index, episode in enumerate(episodes):
+            wanted_filename = episode.local_filename(create=True, return_wanted_filename=True,
+                                                     taken_filenames=taken_filenames)
+            by_wanted_filename.setdefault(wanted_filename, (index, episode))
+            wanted_base, wanted_ext = os.path.splitext(wanted_filename)
+            by_wanted_base.setdefault(wanted_base, []).append((index, episode, wanted_ext))
+
+        return by_wanted_filename, by_wanted_base
+
     @classmethod
     def sort_key(cls, podcast):
         key = util.convert_bytes(podcast.title.lower())
@@ -1101,10 +1408,9 @@ class PodcastChannel(PodcastModelObject):
 
     @classmethod
     def load(cls, model, url, create=True, authentication_tokens=None, max_episodes=0):
-        existing = [p for p in model.get_podcasts() if p.url == url]
-
-        if existing:
-            return existing[0]
+        existing = model.get_podcast(url)
+        if existing is not None:
+            return existing
 
         if create:
             tmp = cls(model)
@@ -1152,8 +1458,14 @@ class PodcastChannel(PodcastModelObject):
 
         Returns: A new PodcastEpisode object
         """
+        for key in self.EpisodeClass.SHARED_STRING_COLUMNS:
+            if d.get(key):
+                d[key] = sys.intern(d[key])
+
         episode = self.EpisodeClass.create_from_dict(d, self)
-        episode.cache_text_description()
+        if 'description' not in d:
+            # Detail columns are loaded on demand (see PodcastEpisode)
+            episode._details_loaded = False
         return episode
 
     def _consume_updated_title(self, new_title):
@@ -1184,33 +1496,15 @@ class PodcastChannel(PodcastModelObject):
         self.payment_url = payment_url
         self.save()
 
-    def _consume_updated_feed(self, feed, max_episodes=0):
-        self._consume_metadata(feed.get_title() or self.url,
-                               feed.get_link() or self.link,
-                               feed.get_description() or '',
-                               feed.get_cover_url() or None,
-                               feed.get_payment_url() or None)
-
-        # Update values for HTTP conditional requests
-        self.http_etag = feed.get_http_etag() or self.http_etag
-        self.http_last_modified = feed.get_http_last_modified() or self.http_last_modified
-
-        # Load all episodes to update them properly.
-        existing = self.get_all_episodes()
-        # GUID-based existing episode list
-        existing_guids = {e.guid: e for e in existing}
-
-        # Get most recent published of all episodes
-        last_published = self.db.get_last_published(self) or 0
-        # fix for #516 an episode was marked published one month in the future (typo in month number)
-        # causing every new episode to be marked old
-        tomorrow = datetime.datetime.now().timestamp() + self.SECONDS_PER_DAY
-        if last_published > tomorrow:
-            logger.debug('Episode published in the future for podcast %s', self.title)
-            last_published = tomorrow
+    def _get_new_episodes_paged(self, feed, max_episodes, existing_guids, get_new_episodes):
+        """Get the new episodes of feed and of as many next pages as needed
 
-        # new episodes from feed
-        new_episodes, seen_guids = feed.get_new_episodes(self, existing_guids)
+        get_new_episodes(page, existing_guids) returns the new episodes and
+        the seen GUIDs of one page. existing_guids is updated with the new
+        episodes of the pages while going through them.
+        """
+        num_existing = len(existing_guids)
+        new_episodes, seen_guids = get_new_episodes(feed, existing_guids)
 
         # pagination
         next_feed = feed
@@ -1219,7 +1513,7 @@ class PodcastChannel(PodcastModelObject):
         #  - we raised the max episode count so we want more old episodes now
         #    FIXME: could also be that feed has less episodes than max_episodes and we're paginating for nothing
         #  - all episodes are new so we continue getting them until max_episodes is reached
-        could_have_more = max_episodes > len(existing) or len(new_episodes) == len(seen_guids)
+        could_have_more = max_episodes > num_existing or len(new_episodes) == len(seen_guids)
         while next_feed and could_have_more:
             if max_episodes > 0 and next_max_episodes <= 0:
                 logger.debug("stopping pagination: seen enough episodes (%i)", max_episodes)
@@ -1230,7 +1524,7 @@ class PodcastChannel(PodcastModelObject):
                 next_feed = next_result.feed
                 for e in new_episodes:
                     existing_guids[e.guid] = e
-                next_new_episodes, next_seen_guids = next_feed.get_new_episodes(self, existing_guids)
+                next_new_episodes, next_seen_guids = get_new_episodes(next_feed, existing_guids)
                 logger.debug("next page has %i new episodes, %i seen episodes", len(next_new_episodes), len(next_seen_guids))
                 if not next_seen_guids:
                     logger.debug("breaking out of get_next_page loop because no episode in this page")
@@ -1241,6 +1535,56 @@ class PodcastChannel(PodcastModelObject):
             else:
                 next_feed = None
 
+        return new_episodes, seen_guids
+
+    def _prepare_update(self, feed, max_episodes):
+        """Do the network requests of update() for an updated feed ahead of time
+
+        This fetches the next pages of the feed that update() will need
+        and prepares their episodes (see Feed.prepare_episodes), without
+        touching the database.
+        """
+        # Reading the episodes doesn't need the write lock
+        existing_guids = {e.guid: e for e in self.get_all_episodes()}
+        if feed.prepare_episodes(self, existing_guids) is None:
+            return
+
+        def prepare_new_episodes(page, existing_guids):
+            episodes, seen_guids = page.prepare_episodes(self, existing_guids)
+            return [e for e in episodes if e.guid not in existing_guids], seen_guids
+
+        self._get_new_episodes_paged(feed, max_episodes, existing_guids, prepare_new_episodes)
+
+    def _consume_updated_feed(self, feed, max_episodes=0):
+        self._consume_metadata(feed.get_title() or self.url,
+                               feed.get_link() or self.link,
+                               feed.get_description() or '',
+                               feed.get_cover_url() or None,
+                               feed.get_payment_url() or None)
+
+        # Update values for HTTP conditional requests
+        self.http_etag = feed.get_http_etag() or self.http_etag
+        self.http_last_modified = feed.get_http_last_modified() or self.http_last_modified
+
+        # Load all episodes to update them properly.
+        existing = self.get_all_episodes()
+        # GUID-based existing episode list
+        existing_guids = {e.guid: e for e in existing}
+
+        # Get most recent published of all episodes
+        last_published = self.db.get_last_published(self) or 0
+        # fix for #516 an episode was marked published one month in the future (typo in month number)
+        # causing every new episode to be marked old
+        tomorrow = datetime.datetime.now().timestamp() + self.SECONDS_PER_DAY
+        if last_published > tomorrow:
+            logger.debug('Episode published in the future for podcast %s', self.title)
+            last_published = tomorrow
+
+        # new episodes from feed and its next pages
+        new_episodes, seen_guids = self._get_new_episodes_paged(
+            feed, max_episodes, existing_guids,
+            lambda page, existing_guids: page.get_new_episodes(self, existing_guids))
+
         # mark episodes not new
         real_new_episodes = []
         # Search all entries for new episodes
@@ -1265,6 +1609,9 @@ class PodcastChannel(PodcastModelObject):
         self.children.extend(new_episodes)
 
         self.remove_unreachable_episodes(existing, seen_guids, max_episodes)
+
+        # Only skip the next update if this one has been completed
+        self.feed_digest = feed.get_feed_digest()
         return real_new_episodes
 
     def remove_unreachable_episodes(self, existing, seen_guids, max_episodes):
@@ -1285,6 +1632,7 @@ class PodcastChannel(PodcastModelObject):
                 # Remove the episode from the "children" episodes list
                 if self.children is not None:
                     self.children.remove(episode)
+                self.model._remove_episode(episode)
 
         # This *might* cause episodes to be skipped if there were more than
         # limit.episodes items added to the feed between updates.
@@ -1295,25 +1643,58 @@ class PodcastChannel(PodcastModelObject):
         # Sort episodes by pubdate, descending
         self.children.sort(key=lambda e: e.published, reverse=True)
 
-    def update(self, max_episodes=0):
+    def fetch_update(self, max_episodes=0):
+        """Fetch the feed of this podcast without touching the database
+
+        The result can be passed to update() later on, which allows the
+        (slow) network part of an update to run in parallel for many
+        podcasts (see gpodder.feedupdate).
+        """
+        try:
+            result = self.feed_fetcher.fetch_channel(self, int(max_episodes))
+
+            # Fetch moved feeds from their new location right away, so that
+            # update() does not go to the network (while holding the write lock)
+            seen_urls = [self.url]
+            while result.status == feedcore.NEW_LOCATION:
+                seen_urls.append(result.feed)
+                if result.feed in seen_urls[:-1] or len(seen_urls) > self.MAX_NEW_LOCATIONS + 1:
+                    raise feedcore.InvalidFeed('Too many feed redirects: %s' % ' => '.join(seen_urls))
+                self._set_new_location(result.feed)
+                result = self.feed_fetcher.fetch_channel(self, int(max_episodes))
+
+            # Likewise for the next pages of the feed and YouTube durations
+            if result.status == feedcore.UPDATED_FEED:
+                self._prepare_update(result.feed, int(max_episodes))
+
+            return result
+        except Exception as e:
+            gpodder.user_extensions.on_podcast_update_failed(self, e)
+            raise
+
+    def _set_new_location(self, url):
+        # FIXME: could return the feed because in autodiscovery it is parsed already
+        logger.info('New feed location: %s => %s', self.url, url)
+        if self.model.get_podcast(url) is not None:
+            raise Exception('Already subscribed to ' + url)
+        self.model._change_podcast_url(self, url)
+
+    def update(self, max_episodes=0, result=None):
         max_episodes = int(max_episodes)
         new_episodes = []
         try:
-            result = self.feed_fetcher.fetch_channel(self, max_episodes)
+            if result is None:
+                result = self.feed_fetcher.fetch_channel(self, max_episodes)
 
             if result.status == feedcore.UPDATED_FEED:
                 new_episodes = self._consume_updated_feed(result.feed, max_episodes)
             elif result.status == feedcore.NEW_LOCATION:
-                # FIXME: could return the feed because in autodiscovery it is parsed already
-                url = result.feed
-                logger.info('New feed location: %s => %s', self.url, url)
-                if url in {x.url for x in self.model.get_podcasts()}:
-                    raise Exception('Already subscribed to ' + url)
-                self.url = url
+                # Only when not fetched with fetch_update()
+                self._set_new_location(result.feed)
                 # With the updated URL, fetch the feed again
                 self.update(max_episodes)
                 return new_episodes
-            elif result.status == feedcore.NOT_MODIFIED:
+            elif result.status in (feedcore.NOT_MODIFIED, feedcore.UNCHANGED_FEED):
                 pass
 
             self.save()
@@ -1354,6 +1735,16 @@ class PodcastChannel(PodcastModelObject):
         self.db.save_podcast(self)
         self.model._append_podcast(self)
 
+    def save_episodes(self, episodes):
+        """Save new and modified episodes of this podcast in one go"""
+        for episode in episodes:
+            episode.changed()
+            gpodder.user_extensions.on_episode_save(episode)
+
+        self.db.save_episodes(episodes)
+        for episode in episodes:
+            self.model._index_episode(episode)
+
     def get_statistics(self):
         if self.id is None:
             return (0, 0, 0, 0, 0)
@@ -1505,36 +1896,245 @@ class Model(object):
         self.db = db
         self.children = None
 
+        # If True, get_podcasts() does not check the download folders,
+        # check_download_folders() has to be called later on (e.g. in
+        # the background after startup)
+        self.defer_download_folder_checks = False
+
+        # Lookup indexes, updated whenever podcasts and episodes are saved.
+        # Entries can be stale (e.g. after a podcast changed its URL), so
+        # lookups always check that the found object still matches.
+        self._podcasts_by_url = {}
+        self._podcasts_by_folder = {}
+        # Episode indexes are built on first use, from the loaded episodes
+        self._episodes_by_url = None
+        self._episodes_by_guid = None  # podcast id -> guid -> episode
+        self._episodes_by_filename = None  # podcast id -> download filename -> episode
+
+    def _index_podcast(self, podcast):
+        if podcast.url:
+            self._podcasts_by_url[podcast.url] = podcast
+        if podcast.download_folder:
+            self._podcasts_by_folder[podcast.download_folder] = podcast
+
+    def _change_podcast_url(self, podcast, url):
+        if self._podcasts_by_url.get(podcast.url) is podcast:
+            del self._podcasts_by_url[podcast.url]
+        podcast.url = url
+        self._index_podcast(podcast)
+
     def _append_podcast(self, podcast):
-        if podcast not in self.children:
+        if (self._podcasts_by_url.get(podcast.url) is not podcast
+                and podcast not in self.children):
             self.children.append(podcast)
+        self._index_podcast(podcast)
 
     def _remove_podcast(self, podcast):
         self.children.remove(podcast)
+        if self._podcasts_by_url.get(podcast.url) is podcast:
+            del self._podcasts_by_url[podcast.url]
+        if self._podcasts_by_folder.get(podcast.download_folder) is podcast:
+            del self._podcasts_by_folder[podcast.download_folder]
+        if self._episodes_by_url is not None:
+            for episode in (podcast._children or []) + list(podcast._detached_episodes.values()):
+                self._remove_episode(episode)
         gpodder.user_extensions.on_podcast_delete(podcast)
 
+    def _index_episode(self, episode):
+        if self._episodes_by_url is None or episode.podcast_id is None:
+            return
+
+        if episode.url:
+            self._episodes_by_url[episode.url] = episode
+        self._episodes_by_guid.setdefault(episode.podcast_id, {})[episode.guid] = episode
+        if episode.download_filename:
+            self._episodes_by_filename.setdefault(episode.podcast_id, {})[episode.download_filename] = episode
+
+    def _remove_episode(self, episode):
+        if self._episodes_by_url is None:
+            return
+
+        if self._episodes_by_url.get(episode.url) is episode:
+            del self._episodes_by_url[episode.url]
+        by_guid = self._episodes_by_guid.get(episode.podcast_id, {})
+        if by_guid.get(episode.guid) is episode:
+            del by_guid[episode.guid]
+        by_filename = self._episodes_by_filename.get(episode.podcast_id, {})
+        if by_filename.get(episode.download_filename) is episode:
+            del by_filename[episode.download_filename]
+
+    def _build_episode_indexes(self):
+        # Only index podcasts with loaded episodes, the others are looked
+        # up in the database on a miss (see _find_episode)
+        self._episodes_by_url = {}
+        self._episodes_by_guid = {}
+        self._episodes_by_filename = {}
+        for podcast in self.get_podcasts():
+            if podcast._children is None:
+                continue
+            by_guid = self._episodes_by_guid[podcast.id] = {}
+            by_filename = self._episodes_by_filename[podcast.id] = {}
+            for episode in podcast._children:
+                # Keep the first match for duplicate URLs, like a linear search would
+                if episode.url:
+                    self._episodes_by_url.setdefault(episode.url, episode)
+                by_guid[episode.guid] = episode
+                if episode.download_filename:
+                    by_filename[episode.download_filename] = episode
+
+    def _find_episode(self, where, params):
+        """Look up an episode that is not in the indexes in the database
+
+        Loads only the matching episode (see get_detached_episode), not
+        all episodes of its podcast, and adds it to the indexes.
+        """
+        podcasts = {podcast.id: podcast for podcast in self.get_podcasts()}
+        for row in self.db.load_episodes_where(where, params):
+            podcast = podcasts.get(row['podcast_id'])
+            if podcast is not None:
+                episode = podcast.get_detached_episode(row)
+                self._index_episode(episode)
+                return episode
+        return None
+
     def get_podcasts(self):
         def podcast_factory(dct, db):
             return self.PodcastClass.create_from_dict(dct, self, dct['id'])
 
         if self.children is None:
-            self.children = self.db.load_podcasts(podcast_factory)
+            with startupprofile.phase('load podcasts'):
+                self.children = self.db.load_podcasts(podcast_factory)
+                for podcast in self.children:
+                    self._index_podcast(podcast)
 
-            # Check download folders for changes (bug 902)
-            for podcast in self.children:
-                podcast.check_download_folder()
+            if not self.defer_download_folder_checks:
+                self.check_download_folders()
 
         return self.children
 
+    def check_download_folders(self):
+        """Check download folders of all podcasts for changes (bug 902)"""
+        with startupprofile.phase('check download folders'):
+            for podcast in self.get_podcasts():
+                try:
+                    podcast.check_download_folder()
+                except Exception as e:
+                    logger.warning('Cannot check download folder of %s: %s', podcast.url, e, exc_info=True)
+
     def get_podcast(self, url):
-        for p in self.get_podcasts():
-            if p.url == url:
-                return p
+        self.get_podcasts()
+        podcast = self._podcasts_by_url.get(url)
+        if podcast is not None and podcast.url == url:
+            return podcast
         return None
 
+    def get_podcast_by_download_folder(self, download_folder):
+        self.get_podcasts()
+        podcast = self._podcasts_by_folder.get(download_folder)
+        if podcast is not None and podcast.download_folder == download_folder:
+            return podcast
+        return None
+
+    def get_episode_by_url(self, url):
+        if self._episodes_by_url is None:
+            self._build_episode_indexes()
+        episode = self._episodes_by_url.get(url)
+        if episode is not None and episode.url == url:
+            return episode
+        return self._find_episode('episode.url = ?', (url,))
+
+    def get_episode_by_guid(self, podcast, guid):
+        if self._episodes_by_url is None:
+            self._build_episode_indexes()
+        episode = self._episodes_by_guid.get(podcast.id, {}).get(guid)
+        if episode is not None and episode.guid == guid:
+            return episode
+        return self._find_episode('episode.podcast_id = ? AND episode.guid = ?', (podcast.id, guid))
+
+    def get_episode_by_filename(self, download_folder, download_filename):
+        podcast = self.get_podcast_by_download_folder(download_folder)
+        if podcast is None:
+            return None
+        if self._episodes_by_url is None:
+            self._build_episode_indexes()
+        episode = self._episodes_by_filename.get(podcast.id, {}).get(download_filename)
+        if episode is not None and episode.download_filename == download_filename:
+            return episode
+        return self._find_episode('episode.podcast_id = ? AND episode.download_filename = ?',
+                                  (podcast.id, download_filename))
+
+    def find_episodes(self, eql):
+        """Return the episodes of all podcasts matching an EQL query
+
+        Podcasts with loaded episodes are filtered in memory. For the
+        others, only the episodes selected by the SQL condition of the
+        query are loaded - on their own, without the other episodes of
+        the podcast - and then checked with the query. The podcast keeps
+        them, so loading its episodes later does not create copies.
+        """
+        episodes = []
+        unloaded = {}
+        for podcast in self.get_podcasts():
+            if podcast._children is None:
+                unloaded[podcast.id] = podcast
+            else:
+                episodes.extend(eql.filter(podcast.children))
+
+        where, params = eql.get_sql(self.db.has_search_index())
+        if where is None:
+            for podcast in unloaded.values():
+                episodes.extend(eql.filter(podcast.children))
+        elif unloaded:
+            for row in self.db.load_episodes_where(where, params):
+                podcast = unloaded.get(row['podcast_id'])
+                if podcast is not None:
+                    episode = podcast.get_detached_episode(row)
+                    if eql.match(episode):
+                        episodes.append(episode)
+
+        return episodes
+
+    def search_episodes(self, text):
+        """Return the episodes containing all words of text, best matches first
+
+        Words are searched for in the titles and shownotes, ignoring case.
+        Matches are ranked using the text search index, if available.
+        """
+        words = text.split()
+        if not words:
+            return []
+
+        episodes = self.find_episodes(query.EQL(' and '.join('s(%r)' % word for word in words)))
+
+        ranking = self.db.search_episodes(words)
+        if ranking is None:
+            episodes.sort(key=lambda e: e.published, reverse=True)
+        else:
+            ranks = {episode_id: rank for rank, episode_id in enumerate(ranking)}
+            episodes.sort(key=lambda e: (ranks.get(e.id, len(ranks)), -e.published))
+        return episodes
+
+    def get_episode_by_uri(self, uri):
+        """Get an episode object given a local or remote URI
+
+        Same as episode_object_by_uri(), but using the lookup indexes.
+        """
+        if uri.startswith('/'):
+            uri = 'file://' + urllib.parse.quote(uri)
+
+        prefix = 'file://' + urllib.parse.quote(gpodder.downloads)
+        if uri.startswith(prefix):
+            filename = urllib.parse.unquote(uri[len(prefix):])
+            file_parts = [_f for _f in filename.split(os.sep) if _f]
+            if len(file_parts) != 2:
+                return None
+            return self.get_episode_by_filename(*file_parts)
+
+        return self.get_episode_by_url(uri)
+
     def load_podcast(self, url, create=True, authentication_tokens=None,
                      max_episodes=0):
-        assert all(url != podcast.url for podcast in self.get_podcasts())
+        assert self.get_podcast(url) is None
         return self.PodcastClass.load(self, url, create,
                                       authentication_tokens,
                                       max_episodes)
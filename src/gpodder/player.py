@@ -33,7 +33,6 @@ from abc import ABCMeta, abstractmethod
 
 from gpodder import registry
 
-from .model import episode_object_by_uri
 from .services import AutoRegisterObserver, ObservableService
 
 logger = logging.getLogger(__name__)
@@ -100,7 +99,7 @@ class PlayerInterface(ObservableService, metaclass=ABCMeta):
     def __episode_by_uri(self, file_uri):
         episode = self._currently_playing.get(file_uri, {}).get("episode")
         if not episode:
-            episode = episode_object_by_uri(self.model.get_podcasts(), file_uri)
+            episode = self.model.get_episode_by_uri(file_uri)
         return episode
 
     def __save(self, start, end, total, file_uri):
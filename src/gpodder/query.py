@@ -22,121 +22,428 @@
 #  gpodder.query - Episode Query Language (EQL) implementation (2010-11-29)
 #
 
+import ast
+import calendar
 import datetime
 import re
 
 import gpodder
 
+# EQL names that are shortcuts for expressions on the episode
+NAMES = {
+    # Adjectives (for direct usage)
+    'new': 'episode.state == STATE_NORMAL and episode.is_new',
+    'downloaded': 'episode.was_downloaded(and_exists=True)',
+    'deleted': 'episode.state == STATE_DELETED',
+    'played': 'not episode.is_new',
+    'downloading': 'episode.downloading',
+    'archive': 'episode.archive',
+    'finished': 'episode.is_finished()',
+    'video': 'episode.file_type() == "video"',
+    'audio': 'episode.file_type() == "audio"',
+    'torrent': 'episode.url.endswith(".torrent") or "torrent" in episode.mime_type',
+    'paused': '_is_paused(episode)',
+    'failed': '_is_failed(episode)',
+
+    # Nouns (for comparisons)
+    'megabytes': 'episode.file_size / (1024 * 1024)',
+    'title': 'episode.title',
+    'description': 'episode._text_description',
+    'since': '_since(episode)',
+    'age': 'episode.age_in_days()',
+    'minutes': 'episode.total_time / 60',
+    'remaining': '(episode.total_time - episode.current_position) / 60',
+    'podcast': 'episode.channel.title',
+    'section': 'episode.channel.section',
+    'url': 'episode.url',
+    'link': 'episode.link',
+    'filename': 'episode.download_filename',
+}
+
+ALIASES = {
+    'dl': 'downloaded',
+    'rm': 'deleted',
+    'fin': 'finished',
+    'mb': 'megabytes',
+    'min': 'minutes',
+    'rem': 'remaining',
+}
+
+# Search functions: S/s search for strings, R/r for regular expressions,
+# the uppercase variants are case-sensitive
+SEARCH_FUNCTIONS = ('S', 's', 'R', 'r')
+
+
+def _is_paused(episode):
+    task = episode.download_task
+    return task is not None and task.status in (task.PAUSED, task.PAUSING)
+
+
+def _is_failed(episode):
+    task = episode.download_task
+    return task is not None and task.status == task.FAILED
+
+
+def _since(episode):
+    try:
+        return (datetime.datetime.now() - datetime.datetime.fromtimestamp(episode.published)).days
+    except (OSError, TypeError, ValueError):
+        return (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).days
+
+
+def _unknown(name):
+    raise KeyError(name)
+
+
+def make_search(function, needle):
+    """Create a search function for a needle known in advance.
+
+    The needle is casefolded or compiled to a regular expression
+    only once, instead of for each episode. The returned function
+    takes the episode and an optional haystack, searching both
+    title and description if no haystack is given.
+    """
+    if function == 'S':
+        def search(haystack):
+            return needle in haystack
+    elif function == 's':
+        needle = needle.casefold()
+
+        def search(haystack):
+            return needle in haystack.casefold()
+    else:
+        search = re.compile(needle, re.IGNORECASE if function == 'r' else 0).search
+
+    def match(episode, haystack=None):
+        if haystack is not None:
+            return search(haystack)
+        return search(episode.title) or search(episode._text_description)
+
+    return match
+
 
-class Matcher(object):
-    """Match implementation for EQL.
+def _search(episode, function, needle, haystack=None):
+    # Search with a needle that is only known when matching
+    return make_search(function, needle)(episode, haystack)
 
-    This class implements the low-level matching of
-    EQL statements against episode objects.
+
+def search_match(phrases, column=None):
+    """Return an FTS5 query for the text search index
+
+    The query matches episodes that contain all phrases in their title
+    or shownotes (or only in column), ignoring case. Phrases shorter
+    than three characters can't be searched for in the index and are
+    left out, None is returned if no phrase is left.
     """
+    terms = []
+    for phrase in phrases:
+        phrase = phrase.casefold()
+        if len(phrase) >= 3:
+            term = '"%s"' % phrase.replace('"', '""')
+            terms.append(term if column is None else '%s : %s' % (column, term))
+
+    if not terms:
+        return None
 
-    def __init__(self, episode):
-        self._episode = episode
+    return ' AND '.join(terms)
 
-    def match(self, term):
-        try:
-            # case-sensitive search in haystack, or both title and description if no haystack
-            def S(needle, haystack=None):
-                if haystack is not None:
-                    return (needle in haystack)
-                if needle in self._episode.title:
-                    return True
-                return (needle in self._episode._text_description)
-
-            # case-insensitive search in haystack, or both title and description if no haystack
-            def s(needle, haystack=None):
-                needle = needle.casefold()
-                if haystack is not None:
-                    return (needle in haystack.casefold())
-                if needle in self._episode.title.casefold():
-                    return True
-                return (needle in self._episode._text_description.casefold())
-
-            # case-sensitive regular expression search in haystack, or both title and description if no haystack
-            def R(needle, haystack=None):
-                regexp = re.compile(needle)
-                if haystack is not None:
-                    return regexp.search(haystack)
-                if regexp.search(self._episode.title):
-                    return True
-                return regexp.search(self._episode._text_description)
-
-            # case-insensitive regular expression search in haystack, or both title and description if no haystack
-            def r(needle, haystack=None):
-                regexp = re.compile(needle, re.IGNORECASE)
-                if haystack is not None:
-                    return regexp.search(haystack)
-                if regexp.search(self._episode.title):
-                    return True
-                return regexp.search(self._episode._text_description)
-
-            return bool(eval(term, {'__builtins__': None, 'S': S, 's': s, 'R': R, 'r': r}, self))
-        except Exception:
-            return False
 
-    def __getitem__(self, k):
-        episode = self._episode
-
-        # Adjectives (for direct usage)
-        if k == 'new':
-            return (episode.state == gpodder.STATE_NORMAL and episode.is_new)
-        elif k in ('downloaded', 'dl'):
-            return episode.was_downloaded(and_exists=True)
-        elif k in ('deleted', 'rm'):
-            return episode.state == gpodder.STATE_DELETED
-        elif k == 'played':
-            return not episode.is_new
-        elif k == 'downloading':
-            return episode.downloading
-        elif k == 'archive':
-            return episode.archive
-        elif k in ('finished', 'fin'):
-            return episode.is_finished()
-        elif k in ('video', 'audio'):
-            return episode.file_type() == k
-        elif k == 'torrent':
-            return episode.url.endswith('.torrent') or 'torrent' in episode.mime_type
-        elif k == 'paused':
-            return (episode.download_task is not None
-                and episode.download_task.status in (episode.download_task.PAUSED, episode.download_task.PAUSING))
-        elif k == 'failed':
-            return (episode.download_task is not None and episode.download_task.status == episode.download_task.FAILED)
-
-        # Nouns (for comparisons)
-        if k in ('megabytes', 'mb'):
-            return episode.file_size / (1024 * 1024)
-        elif k == 'title':
-            return episode.title
-        elif k == 'description':
-            return episode._text_description
-        elif k == 'since':
+class Compiler(ast.NodeTransformer):
+    """Compiler for EQL expressions.
+
+    Turns an EQL expression into a Python function that takes an
+    episode and evaluates the expression on it. Names are replaced
+    by the expressions in NAMES, and searches with a constant needle
+    are set up once, so matching an episode does not need any name
+    lookups through the EQL implementation or regex compilation.
+    """
+
+    def __init__(self):
+        self.namespace = {
+            '__builtins__': {},
+            'STATE_NORMAL': gpodder.STATE_NORMAL,
+            'STATE_DELETED': gpodder.STATE_DELETED,
+            '_is_paused': _is_paused,
+            '_is_failed': _is_failed,
+            '_since': _since,
+            '_unknown': _unknown,
+            '_search': _search,
+        }
+        # Names bound by the lambdas and comprehensions being compiled
+        self.bound = []
+
+    def compile(self, expression):
+        tree = ast.parse(expression.strip(), '<eql-string>', 'eval')
+        body = self.visit(tree.body)
+        function = ast.Expression(ast.Lambda(
+            args=ast.arguments(posonlyargs=[], args=[ast.arg('episode')], kwonlyargs=[],
+                               kw_defaults=[], defaults=[]),
+            body=body))
+        code = compile(ast.fix_missing_locations(function), '<eql-string>', 'eval')
+        return eval(code, self.namespace)
+
+    def visit_Name(self, node):
+        if not isinstance(node.ctx, ast.Load) or any(node.id in names for names in self.bound):
+            return node
+
+        name = ALIASES.get(node.id, node.id)
+        if name in NAMES:
+            return ast.copy_location(ast.parse(NAMES[name], mode='eval').body, node)
+
+        # Unknown names only fail the match when they are evaluated
+        return ast.copy_location(ast.Call(ast.Name('_unknown', ast.Load()),
+                                          [ast.Constant(node.id)], []), node)
+
+    def visit_Lambda(self, node):
+        node.args = self.visit(node.args)
+        args = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+        args += [arg for arg in (node.args.vararg, node.args.kwarg) if arg is not None]
+        self.bound.append({arg.arg for arg in args})
+        node.body = self.visit(node.body)
+        self.bound.pop()
+        return node
+
+    def _visit_comprehension(self, node):
+        # The first iterable is evaluated outside of the comprehension
+        generators = node.generators
+        generators[0].iter = self.visit(generators[0].iter)
+        self.bound.append({name.id for generator in generators
+                           for name in ast.walk(generator.target) if isinstance(name, ast.Name)})
+        for i, generator in enumerate(generators):
+            if i > 0:
+                generator.iter = self.visit(generator.iter)
+            generator.ifs = [self.visit(test) for test in generator.ifs]
+        for field in ('elt', 'key', 'value'):
+            if hasattr(node, field):
+                setattr(node, field, self.visit(getattr(node, field)))
+        self.bound.pop()
+        return node
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+    def visit_NamedExpr(self, node):
+        node.value = self.visit(node.value)
+        if self.bound:
+            self.bound[-1].add(node.target.id)
+        else:
+            self.bound.append({node.target.id})
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in SEARCH_FUNCTIONS:
+            return self.generic_visit(node)
+
+        function = node.func.id
+        args = [self.visit(arg) for arg in node.args]
+        keywords = [self.visit(keyword) for keyword in node.keywords]
+        episode = ast.Name('episode', ast.Load())
+
+        needle = node.args[0] if node.args else None
+        if (isinstance(needle, ast.Constant) and isinstance(needle.value, str)
+                and not any(isinstance(arg, ast.Starred) for arg in node.args)):
             try:
-                return (datetime.datetime.now() - datetime.datetime.fromtimestamp(episode.published)).days
-            except (OSError, TypeError, ValueError):
-                return (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).days
-        elif k == 'age':
-            return episode.age_in_days()
-        elif k in ('minutes', 'min'):
-            return episode.total_time / 60
-        elif k in ('remaining', 'rem'):
-            return (episode.total_time - episode.current_position) / 60
-        elif k == 'podcast':
-            return episode.channel.title
-        elif k == 'section':
-            return episode.channel.section
-        elif k == 'url':
-            return episode.url
-        elif k == 'link':
-            return episode.link
-        elif k == 'filename':
-            return episode.download_filename
-
-        raise KeyError(k)
+                search = make_search(function, needle.value)
+            except re.error:
+                pass
+            else:
+                name = '_search%d' % len(self.namespace)
+                self.namespace[name] = search
+                return ast.copy_location(ast.Call(ast.Name(name, ast.Load()),
+                                                  [episode] + args[1:], keywords), node)
+
+        return ast.copy_location(ast.Call(ast.Name('_search', ast.Load()),
+                                          [episode, ast.Constant(function)] + args, keywords), node)
+
+
+class Planner(object):
+    """Translate EQL expressions to SQL conditions.
+
+    Only the terms that can be answered from the episode and podcast
+    tables are translated. If the expression is a conjunction
+    ("a and b and ..."), terms that can't be translated are left out,
+    so the condition selects the episodes that can match, and the
+    expression still has to be evaluated on them (see EQL.get_sql).
+    """
+
+    # SQL for EQL adjectives
+    CONDITIONS = {
+        'new': 'episode.state = %d AND episode.is_new' % gpodder.STATE_NORMAL,
+        'deleted': 'episode.state = %d' % gpodder.STATE_DELETED,
+        'played': 'NOT episode.is_new',
+        'archive': 'episode.archive',
+    }
+
+    # SQL for EQL nouns and the type of constants they can be compared
+    # with (in Python, other comparisons fail or are always false)
+    VALUES = {
+        'megabytes': ('episode.file_size / 1048576.0', (int, float)),
+        'minutes': ('episode.total_time / 60.0', (int, float)),
+        'remaining': ('(episode.total_time - episode.current_position) / 60.0', (int, float)),
+        'title': ('episode.title', str),
+        'podcast': ('podcast.title', str),
+        'section': ('podcast.section', str),
+        'url': ('episode.url', str),
+        'link': ('episode.link', str),
+    }
+
+    # Nullable columns can only be compared for (in)equality
+    NULLABLE_VALUES = {
+        'filename': 'episode.download_filename',
+    }
+
+    # Episodes found in the text search index (see search_match())
+    SEARCH = 'episode.id IN (SELECT rowid FROM episode_fts WHERE episode_fts MATCH ?)'
+
+    OPERATORS = {
+        ast.Eq: '=',
+        ast.NotEq: '!=',
+        ast.Lt: '<',
+        ast.LtE: '<=',
+        ast.Gt: '>',
+        ast.GtE: '>=',
+    }
+
+    # Operator to use when swapping the operands
+    SWAPPED = {
+        ast.Lt: ast.Gt(),
+        ast.LtE: ast.GtE(),
+        ast.Gt: ast.Lt(),
+        ast.GtE: ast.LtE(),
+    }
+
+    def __init__(self, search_index=False):
+        self.search_index = search_index
+        self.params = []
+
+    def plan(self, expression):
+        """Return (where, params), where is None if nothing can be translated"""
+        tree = ast.parse(expression.strip(), '<eql-string>', 'eval')
+        if isinstance(tree.body, ast.BoolOp) and isinstance(tree.body.op, ast.And):
+            terms = tree.body.values
+        else:
+            terms = [tree.body]
+
+        conditions = []
+        for term in terms:
+            count = len(self.params)
+            condition = self.condition(term)
+            if condition is None:
+                del self.params[count:]
+            else:
+                conditions.append('(%s)' % condition)
+
+        if not conditions:
+            return None, ()
+
+        return ' AND '.join(conditions), tuple(self.params)
+
+    def condition(self, node):
+        if isinstance(node, ast.Name):
+            return self.CONDITIONS.get(ALIASES.get(node.id, node.id))
+        elif isinstance(node, ast.BoolOp):
+            conditions = [self.condition(value) for value in node.values]
+            if None in conditions:
+                return None
+            return (' AND ' if isinstance(node.op, ast.And) else ' OR ').join('(%s)' % c for c in conditions)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            # The index finds more episodes than S() matches (it ignores case)
+            if any(isinstance(child, ast.Call) and self.name(child.func) == 'S'
+                   for child in ast.walk(node.operand)):
+                return None
+            condition = self.condition(node.operand)
+            return None if condition is None else 'NOT (%s)' % condition
+        elif isinstance(node, ast.Call):
+            return self.search(node)
+        elif isinstance(node, ast.Compare):
+            conditions = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                conditions.append(self.comparison(left, op, right))
+                left = right
+            if None in conditions:
+                return None
+            return ' AND '.join(conditions)
+
+        return None
+
+    def comparison(self, left, op, right):
+        if isinstance(op, (ast.In, ast.NotIn)):
+            needle, (value, types) = self.constant(left), self.value(right)
+            if isinstance(needle, str) and value is not None and types is str:
+                self.params.append(needle)
+                return 'instr(%s, ?) %s 0' % (value, '>' if isinstance(op, ast.In) else '=')
+            return None
+        elif type(op) not in self.OPERATORS:
+            return None
+
+        constant = self.constant(right)
+        if constant is None:
+            constant, left, right = self.constant(left), right, left
+            op = self.SWAPPED.get(type(op), op)
+
+        name = self.name(left)
+        if name in self.NULLABLE_VALUES and isinstance(constant, str):
+            if isinstance(op, (ast.Eq, ast.NotEq)):
+                self.params.append(constant)
+                return '%s %s ?' % (self.NULLABLE_VALUES[name], 'IS' if isinstance(op, ast.Eq) else 'IS NOT')
+            return None
+
+        value, types = self.value(left)
+        if value is None or not isinstance(constant, types):
+            return None
+
+        self.params.append(constant)
+        return '%s %s ?' % (value, self.OPERATORS[type(op)])
+
+    def search(self, node):
+        # S() and s() with a constant needle, in title and/or description
+        if not self.search_index or self.name(node.func) not in ('S', 's') or not node.args:
+            return None
+
+        needle = self.constant(node.args[0])
+        haystacks = node.args[1:] + [keyword.value for keyword in node.keywords if keyword.arg == 'haystack']
+        if (not isinstance(needle, str) or len(haystacks) > 1
+                or any(keyword.arg != 'haystack' for keyword in node.keywords)):
+            return None
+
+        column = None
+        if haystacks:
+            column = self.name(haystacks[0])
+            if column not in ('title', 'description'):
+                return None
+
+        match = search_match([needle], column)
+        if match is None:
+            return None
+
+        self.params.append(match)
+        return self.SEARCH
+
+    def name(self, node):
+        if isinstance(node, ast.Name):
+            return ALIASES.get(node.id, node.id)
+        return None
+
+    def value(self, node):
+        name = self.name(node)
+        if name == 'since':
+            # Days between now and the publication date, both in local time
+            now = calendar.timegm(datetime.datetime.now().timetuple())
+            delta = "(? - strftime('%s', episode.published, 'unixepoch', 'localtime'))"
+            self.params.extend((now, now, now))
+            return ('(CASE WHEN {0} >= 0 THEN {0} / 86400 ELSE ({0} - 86399) / 86400 END)'.format(delta),
+                    (int, float))
+        return self.VALUES.get(name, (None, None))
+
+    def constant(self, node):
+        try:
+            value = ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError):
+            return None
+
+        if isinstance(value, str) or (isinstance(value, (int, float)) and abs(value) < 2 ** 63):
+            return value
+        return None
 
 
 class EQL(object):
@@ -195,6 +502,7 @@ class EQL(object):
     """
 
     def __init__(self, query):
+        self._expression = None
         self._query = query
         self._flags = 0
         self._regex = False
@@ -218,24 +526,58 @@ class EQL(object):
         # For everything else, compile the expression
         if not self._regex and not self._string:
             try:
-                self._query = compile(query, '<eql-string>', 'eval')
+                self._query = Compiler().compile(query)
+                self._expression = query
             except Exception:
                 self._query = None
+        elif self._regex:
+            try:
+                self._query = re.compile(self._query, self._flags)
+            except re.error:
+                self._query = None
 
     def match(self, episode):
         if self._query is None:
             return False
 
         if self._regex:
-            return re.search(self._query, episode.title, self._flags) is not None
+            return self._query.search(episode.title) is not None
         elif self._string:
             return self._query in episode.title.lower() or self._query in episode._text_description.lower()
 
-        return Matcher(episode).match(self._query)
+        try:
+            return bool(self._query(episode))
+        except Exception:
+            return False
 
     def filter(self, episodes):
         return list(filter(self.match, episodes))
 
+    def get_search_text(self):
+        """Return the (lowercase) text for plain text searches, else None"""
+        return self._query if self._string else None
+
+    def get_sql(self, search_index=False):
+        """Return (where, params) selecting the episodes that can match
+
+        where is a condition on the episode and podcast tables, or None
+        if the query can't be narrowed down in the database. Episodes
+        selected by it still have to be checked with match(). Text
+        searches use the search index if search_index is True.
+        """
+        if self._string and search_index:
+            match = search_match([self._query])
+            if match is not None:
+                return Planner.SEARCH, (match,)
+
+        if self._expression is None:
+            return None, ()
+
+        try:
+            return Planner(search_index).plan(self._expression)
+        except Exception:
+            return None, ()
+
 
 def UserEQL(query):
     """EQL wrapper for user input.
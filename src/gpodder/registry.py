@@ -15,6 +15,7 @@
 # PERFORMANCE OF THIS SOFTWARE.
 #
 
+import importlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,8 +27,27 @@ class Resolver(object):
         self._description = description
         self._resolvers = []
         self._observers = set()
+        self._providers = []
+
+    def add_provider(self, module_name):
+        """Import module_name (which registers resolvers) on first use.
+
+        Resolvers of providers come before the ones registered directly.
+        """
+        self._providers.append(module_name)
+
+    def _load_providers(self):
+        if not self._providers:
+            return
+
+        resolvers = self._resolvers
+        self._resolvers = []
+        while self._providers:
+            importlib.import_module(self._providers.pop(0))
+        self._resolvers.extend(resolvers)
 
     def resolve(self, item, default, *args):
+        self._load_providers()
         for resolver in self._resolvers:
             result = resolver(item, *args)
             if result is not None:
@@ -38,6 +58,7 @@ class Resolver(object):
         return default
 
     def each(self, *args):
+        self._load_providers()
         for resolver in self._resolvers:
             result = resolver(*args)
             if result is not None:
@@ -47,6 +68,7 @@ class Resolver(object):
         list(self.each(*args))
 
     def select(self, selector=None):
+        self._load_providers()
         for resolver in self._resolvers:
             if selector is None or selector(resolver):
                 yield resolver
@@ -78,6 +100,7 @@ class Resolver(object):
                                else resolver.__class__.__name__, resolver.__module__)
 
     def _dump(self, indent=''):
+        self._load_providers()
         print('== {} ({}) =='.format(self.name, self._description))
         print('\n'.join('%s- %s' % (indent, self._info(resolver)) for resolver in self._resolvers))
         print()
@@ -91,6 +114,7 @@ class Resolver(object):
 
     def empty(self):
         """Check if any resolver is registered in this Resolver."""
+        self._load_providers()
         return not bool(self._resolvers)
 
     def _notify_observers(self):
@@ -118,6 +142,10 @@ LOCALS = locals()
 for name, description in RESOLVER_NAMES.items():
     LOCALS[name] = Resolver(name, description)
 
+# Built-in resolvers, imported when they are needed
+LOCALS['download_url'].add_provider('gpodder.youtube')
+LOCALS['download_url'].add_provider('gpodder.vimeo')
+
 
 def dump(module_dict=LOCALS):
     for name in sorted(RESOLVER_NAMES):
@@ -52,8 +52,18 @@ EpisodeColumns = (
     'description_html',
     'episode_art_url',
     'chapters',
+    'fingerprint',
 )
 
+# Large text columns, only loaded when they are needed (e.g. for shownotes)
+EpisodeDetailColumns = (
+    'description',
+    'description_html',
+    'chapters',
+)
+
+EpisodeSummaryColumns = tuple(c for c in EpisodeColumns if c not in EpisodeDetailColumns)
+
 PodcastColumns = (
     'title',
     'url',
@@ -72,14 +82,84 @@ PodcastColumns = (
     'download_strategy',
     'sync_to_mp3_player',
     'cover_thumb',
+    'feed_digest',
 )
 
-CURRENT_VERSION = 8
+CURRENT_VERSION = 12
+
+
+SEARCH_INDEX_SQL = [
+    # Episodes are added to and updated in the index by the Database class
+    """
+    CREATE TRIGGER episode_fts_delete AFTER DELETE ON episode BEGIN
+        DELETE FROM episode_fts WHERE rowid = old.id;
+    END
+    """,
+]
+
+SEARCH_INDEX_INSERT_SQL = 'INSERT INTO episode_fts (rowid, title, description) VALUES (?, ?, ?)'
+
+
+def register_functions(db):
+    """Register the SQL functions used by upgrades"""
+    db.create_function('is_html', 1, util.is_html)
+    db.create_function('remove_html_tags', 1, util.remove_html_tags)
+
+
+def search_index_row(episode_id, title, description, description_html):
+    """Return the row of the search index for an episode in the database
+
+    Like PodcastEpisode._text_description, the HTML shownotes are only
+    used if there are no plain text shownotes.
+    """
+    if not description and description_html:
+        description = util.remove_html_tags(description_html)
+    return (episode_id, (title or '').casefold(), (description or '').casefold())
+
+
+def create_search_index(db):
+    """Create the full-text search index of episode titles and shownotes
+
+    The index contains the casefolded text, split into trigrams, so it
+    can be used for case-insensitive substring searches (see
+    query.search_match()). Only deleting episodes updates the index
+    with a trigger: the text is prepared in Python, so saved episodes
+    are indexed by the Database class, and episodes added by other
+    programs with update_search_index().
+
+    Nothing is done if SQLite does not support FTS5 with the trigram
+    tokenizer (SQLite 3.34 or newer), searches are slower then.
+    """
+    try:
+        db.execute("CREATE VIRTUAL TABLE episode_fts USING fts5(title, description, "
+                   "tokenize='trigram case_sensitive 1')")
+    except sqlite.OperationalError as e:
+        logger.warning('Full-text search not available: %s', e)
+        return
+
+    for sql in SEARCH_INDEX_SQL:
+        db.execute(sql)
+
+    update_search_index(db)
+
+
+def update_search_index(db):
+    """Add episodes newer than the newest one in the search index
+
+    Episodes inserted by other programs get higher IDs, only checking
+    for those keeps this fast enough to be done on every start.
+    """
+    rows = db.execute('SELECT id, title, description, description_html FROM episode WHERE id > '
+                      'IFNULL((SELECT rowid FROM episode_fts ORDER BY rowid DESC LIMIT 1), 0)').fetchall()
+    if rows:
+        logger.info('Adding %d episodes to the search index', len(rows))
+        db.executemany(SEARCH_INDEX_INSERT_SQL, [search_index_row(*row) for row in rows])
 
 
 # SQL commands to upgrade old database versions to new ones
 # Each item is a tuple (old_version, new_version, sql_commands) that should be
 # applied to the database to migrate from old_version to new_version.
+# Instead of SQL commands, the item can contain a function to call with the database.
 UPGRADE_SQL = [
         # Version 2: Section labels for the podcast list
         (1, 2, """
@@ -123,6 +203,25 @@ UPGRADE_SQL = [
         ALTER TABLE episode ADD COLUMN chapters TEXT NULL DEFAULT NULL
         UPDATE podcast SET http_last_modified=NULL, http_etag=NULL
         """),
+
+        # Version 9: Digest of the last feed contents, to skip unchanged feeds
+        (8, 9, """
+        ALTER TABLE podcast ADD COLUMN feed_digest TEXT NULL DEFAULT NULL
+        """),
+
+        # Version 10: Fingerprint of the feed entry, to skip unchanged episodes
+        (9, 10, """
+        ALTER TABLE episode ADD COLUMN fingerprint INTEGER NOT NULL DEFAULT 0
+        """),
+
+        # Version 11: Full-text search index (see create_search_index())
+        (10, 11, create_search_index),
+
+        # Version 12: Index episodes without triggers that need Python functions
+        (11, 12, """
+        DROP TRIGGER IF EXISTS episode_fts_insert
+        DROP TRIGGER IF EXISTS episode_fts_update
+        """),
 ]
 
 
@@ -147,7 +246,8 @@ def initialize_database(db):
         payment_url TEXT NULL DEFAULT NULL,
         download_strategy INTEGER NOT NULL DEFAULT 0,
         sync_to_mp3_player INTEGER NOT NULL DEFAULT 1,
-        cover_thumb BLOB NULL DEFAULT NULL
+        cover_thumb BLOB NULL DEFAULT NULL,
+        feed_digest TEXT NULL DEFAULT NULL
     )
     """)
 
@@ -183,7 +283,8 @@ def initialize_database(db):
         payment_url TEXT NULL DEFAULT NULL,
         description_html TEXT NOT NULL DEFAULT '',
         episode_art_url TEXT NULL DEFAULT NULL,
-        chapters TEXT NULL DEFAULT NULL
+        chapters TEXT NULL DEFAULT NULL,
+        fingerprint INTEGER NOT NULL DEFAULT 0
     )
     """)
 
@@ -200,6 +301,8 @@ def initialize_database(db):
     for sql in INDEX_SQL.strip().split('\n'):
         db.execute(sql)
 
+    create_search_index(db)
+
     # Create table for version info / metadata + insert initial data
     db.execute("""CREATE TABLE version (version integer)""")
     db.execute("INSERT INTO version (version) VALUES (%d)" % CURRENT_VERSION)
@@ -207,13 +310,12 @@ def initialize_database(db):
 
 
 def upgrade(db, filename):
+    register_functions(db)
+
     if not list(db.execute('PRAGMA table_info(version)')):
         initialize_database(db)
         return
 
-    db.create_function('is_html', 1, util.is_html)
-    db.create_function('remove_html_tags', 1, util.remove_html_tags)
-
     version = db.execute('SELECT version FROM version').fetchone()[0]
     if version == CURRENT_VERSION:
         return
@@ -221,6 +323,8 @@ def upgrade(db, filename):
     # We are trying an upgrade - save the current version of the DB
     backup = '%s_upgraded-v%d_%d' % (filename, int(version), int(time.time()))
     try:
+        # With write-ahead logging, recent changes might not be in the file yet
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
         shutil.copy(filename, backup)
     except Exception as e:
         raise Exception('Cannot create DB backup before upgrade: ' + e)
@@ -229,8 +333,11 @@ def upgrade(db, filename):
 
     for old_version, new_version, upgrade in UPGRADE_SQL:
         if version == old_version:
-            for sql in upgrade.strip().split('\n'):
-                db.execute(sql)
+            if callable(upgrade):
+                upgrade(db)
+            else:
+                for sql in upgrade.strip().split('\n'):
+                    db.execute(sql)
             version = new_version
 
     assert version == CURRENT_VERSION
@@ -277,6 +384,7 @@ def convert_gpodder2_db(old_db, new_db):
                 0,
                 row['sync_to_devices'],
                 None,
+                None,
         )
         new_db.execute("""
         INSERT INTO podcast VALUES (%s)
@@ -311,6 +419,7 @@ def convert_gpodder2_db(old_db, new_db):
                 '',
                 None,
                 None,
+                0,
         )
         new_db.execute("""
         INSERT INTO episode VALUES (%s)
@@ -335,3 +444,7 @@ def check_data(db):
             'WHERE podcast_id NOT IN (SELECT id FROM podcast)')
     if orphan_episodes > 0:
         logger.error('Orphaned episodes found in database')
+
+    # Episodes added by other programs are not in the search index yet
+    if db.has_search_index():
+        update_search_index(db.db)
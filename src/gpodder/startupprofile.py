@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.startupprofile - Measure where the startup time goes
+#
+#  Enabled by setting GPODDER_PROFILE_STARTUP (or by passing
+#  --profile-startup to gpo or gpodder) before gpodder is imported.
+#  The variable is the name of the file that the JSON report is
+#  written to, "-" or "1" writes it to stderr.
+#
+#  The report contains the wall time of each startup phase (see phase())
+#  and the time spent importing each module, both including ("cumulative")
+#  and excluding ("self") the modules it imported in turn.
+#
+#  This module only uses the standard library, so that it can be
+#  imported before everything else.
+#
+
+import atexit
+import builtins
+import contextlib
+import json
+import sys
+import threading
+import time
+
+_destination = None
+_start = None
+_phases = []
+_depth = 0
+
+# Module name -> [cumulative seconds, self seconds]
+_imports = {}
+# Time spent in nested imports, one item per import in progress
+_import_stack = []
+_original_import = None
+
+
+def is_enabled():
+    return _start is not None
+
+
+def _measure_import(module, name, globals, locals, fromlist):
+    start = time.perf_counter()
+    _import_stack.append(0.)
+    try:
+        return _original_import(name, globals, locals, fromlist, 0)
+    finally:
+        duration = time.perf_counter() - start
+        nested = _import_stack.pop()
+
+        # "from module import name" also gets here when name is not a module
+        if module in sys.modules:
+            if _import_stack:
+                _import_stack[-1] += duration
+            entry = _imports.setdefault(module, [0., 0.])
+            entry[0] += duration
+            entry[1] += duration - nested
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if (threading.current_thread() is not threading.main_thread()
+            or (level == 0 and name in sys.modules and not fromlist)
+            or (level and not (globals or {}).get('__package__'))):
+        return _original_import(name, globals, locals, fromlist, level)
+
+    if level:
+        package = globals['__package__']
+        package = package.rsplit('.', level - 1)[0] if level > 1 else package
+        name = '.'.join(filter(None, (package, name)))
+
+    if name not in sys.modules:
+        _measure_import(name, name, globals, locals, ())
+
+    # Measure each module of "from package import module1, module2" separately
+    for item in fromlist or ():
+        module = '%s.%s' % (name, item)
+        if item != '*' and module not in sys.modules:
+            _measure_import(module, name, globals, locals, (item,))
+
+    return _original_import(name, globals, locals, fromlist, 0)
+
+
+def start(destination):
+    """Start measuring, the report is written to destination on finish()"""
+    global _destination, _start, _original_import
+    if _start is not None:
+        return
+
+    _destination = destination
+    _start = time.perf_counter()
+    _original_import = builtins.__import__
+    builtins.__import__ = _timed_import
+    atexit.register(finish)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Measure the wall time of a startup phase (if profiling is enabled)"""
+    global _depth
+    if not is_enabled() or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    start = time.perf_counter()
+    _depth += 1
+    try:
+        yield
+    finally:
+        _depth -= 1
+        _phases.append({
+            'name': name,
+            'depth': _depth,
+            'start': round(start - _start, 6),
+            'duration': round(time.perf_counter() - start, 6),
+        })
+
+
+def get_report():
+    imports = sorted(_imports.items(), key=lambda item: item[1][1], reverse=True)
+    return {
+        'total': round(time.perf_counter() - _start, 6),
+        'phases': sorted(_phases, key=lambda p: p['start']),
+        'import_total': round(sum(self_time for _, self_time in _imports.values()), 6),
+        'imports': [{'module': module, 'cumulative': round(cumulative, 6), 'self': round(self_time, 6)}
+                    for module, (cumulative, self_time) in imports],
+    }
+
+
+def finish():
+    """Stop measuring and write the report (only the first call does)"""
+    global _start
+    if _start is None:
+        return
+
+    builtins.__import__ = _original_import
+    report = json.dumps(get_report(), indent=2)
+    _start = None
+
+    if _destination in ('-', '1'):
+        print(report, file=sys.stderr)
+    else:
+        with open(_destination, 'w') as fp:
+            fp.write(report + '\n')
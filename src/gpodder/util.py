@@ -31,9 +31,7 @@ are not tied to any specific part of gPodder.
 """
 import collections
 import datetime
-import email
 import glob
-import http.client
 import itertools
 import locale
 import logging
@@ -54,14 +52,9 @@ import threading
 import time
 import urllib.error
 import urllib.parse
-import webbrowser
 from html.entities import entitydefs, name2codepoint
 from html.parser import HTMLParser
 
-import requests
-import requests.exceptions
-from requests.packages.urllib3.util.retry import Retry
-
 import gpodder
 
 logger = logging.getLogger(__name__)
@@ -1229,6 +1222,112 @@ def url_add_authentication(url, username, password):
     return urllib.parse.urlunsplit(url_parts)
 
 
+# Connection pools shared by all HTTP requests of this process, keyed by
+# retry policy and proxy settings (see get_http_session())
+_http_adapters = {}
+_http_adapters_lock = threading.Lock()
+_http_pool_options = {
+    'connections': 10,
+    'maxsize': 10,
+    'keep_alive': True,
+}
+
+
+# requests is only imported when it is needed (it is slow to import)
+_shared_pool_session_class = None
+
+
+def _get_shared_pool_session_class():
+    global _shared_pool_session_class
+    if _shared_pool_session_class is None:
+        import requests
+
+        class _SharedPoolSession(requests.Session):
+            """A requests session that uses the process-wide connection pools.
+
+            Sessions are not thread-safe and keep cookies, so every request gets
+            its own session, but the adapters (and their connections) are shared.
+            """
+
+            def close(self):
+                # The mounted adapters are shared, don't close their pools
+                pass
+
+        _shared_pool_session_class = _SharedPoolSession
+    return _shared_pool_session_class
+
+
+def set_http_pool_options(connections=None, maxsize=None, keep_alive=None):
+    """Configure the shared HTTP connection pools.
+
+    connections is the number of hosts to keep connections for,
+    maxsize the number of connections kept per host. Existing
+    pools are closed, new ones are created with the new settings.
+    """
+    if connections is not None:
+        _http_pool_options['connections'] = max(1, int(connections))
+    if maxsize is not None:
+        _http_pool_options['maxsize'] = max(1, int(maxsize))
+    if keep_alive is not None:
+        _http_pool_options['keep_alive'] = bool(keep_alive)
+    reset_http_sessions()
+
+
+def reset_http_sessions():
+    """Close all pooled HTTP connections (e.g. after a proxy change).
+
+    Requests that are running at the moment are not interrupted,
+    their connections are closed once they are done.
+    """
+    with _http_adapters_lock:
+        adapters = list(_http_adapters.values())
+        _http_adapters.clear()
+
+    for adapter in adapters:
+        adapter.close()
+
+
+def get_http_session(retry_strategy=None):
+    """Get a requests session using the shared connection pools.
+
+    The pools are shared with all other sessions that have the same
+    retry_strategy and proxy settings, so connections to the same
+    host are kept alive and reused between feed updates, cover and
+    episode downloads.
+    """
+    import requests.adapters
+    from requests.packages.urllib3.util.retry import Retry
+
+    from gpodder import config
+    if retry_strategy is None:
+        retry_strategy = Retry(
+            total=3,
+            status_forcelist=Retry.RETRY_AFTER_STATUS_CODES.union((408, 418, 504, 598, 599,)))
+
+    proxies = config._proxies
+    key = ((retry_strategy.total, retry_strategy.connect, retry_strategy.read,
+            retry_strategy.redirect, retry_strategy.status,
+            tuple(sorted(retry_strategy.status_forcelist or ()))),
+           tuple(sorted((proxies or {}).items())))
+
+    with _http_adapters_lock:
+        adapter = _http_adapters.get(key)
+        if adapter is None:
+            logger.debug('Creating HTTP connection pool for %r', key)
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_http_pool_options['connections'],
+                pool_maxsize=_http_pool_options['maxsize'],
+                max_retries=retry_strategy)
+            _http_adapters[key] = adapter
+
+    s = _get_shared_pool_session_class()()
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    if not _http_pool_options['keep_alive']:
+        s.headers['Connection'] = 'close'
+    return s
+
+
 def urlopen(url, headers=None, data=None, timeout=None, **kwargs):
     """Open an URL with the User-agent set to gPodder (with version)."""
     from gpodder import config
@@ -1240,13 +1339,7 @@ def urlopen(url, headers=None, data=None, timeout=None, **kwargs):
     if not timeout:
         timeout = gpodder.SOCKET_TIMEOUT
 
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=Retry.RETRY_AFTER_STATUS_CODES.union((408, 418, 504, 598, 599,)))
-    s = requests.Session()
-    a = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
-    s.mount('http://', a)
-    s.mount('https://', a)
+    s = get_http_session()
     headers.update({'User-agent': gpodder.user_agent})
     proxies = config._proxies
     logger.debug(f"urlopen: url: {url}, proxies: {proxies}")
@@ -1515,6 +1608,7 @@ def format_seconds_to_hour_min_sec(seconds):
 
 
 def http_request(url, method='HEAD'):
+    import http.client
     (scheme, netloc, path, params, query, fragment) = urllib.parse.urlparse(url)
     if scheme == 'https':
         conn = http.client.HTTPSConnection(netloc)
@@ -1570,6 +1664,7 @@ def open_website(url):
     Uses Python's "webbrowser" module, so make sure your system is set up
     correctly.
     """
+    import webbrowser
     run_in_background(lambda: webbrowser.open(url))
     return True
 
@@ -2044,6 +2139,7 @@ def website_reachable(url):
         # No network interfaces up - assume website not reachable
         return (False, None)
 
+    import requests
     try:
         response = requests.get(url, timeout=1)
         return (True, response)
@@ -2316,6 +2412,7 @@ def get_header_param(headers, param, header_name):
 
     Returns None if the filename cannot be retrieved.
     """
+    import email.utils
     value = None
     try:
         headers_string = ['%s:%s' % (k, v) for k, v in list(headers.items())]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from unittest import mock
+
+import pytest
+
+import gpodder
+from gpodder import dbsqlite, model
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def podcast(db, tmp_path):
+    """A saved podcast with one saved episode (see the episode fixture)"""
+    with mock.patch.object(gpodder, 'user_extensions'), \
+            mock.patch.object(gpodder, 'downloads', str(tmp_path / 'Downloads')):
+        podcasts = model.Model(db)
+        podcasts.get_podcasts()
+
+        podcast = model.PodcastChannel(podcasts)
+        podcast.url = 'http://example.com/feed.xml'
+        podcast.download_folder = 'Example'
+        podcast.save()
+
+        episode = model.PodcastEpisode(podcast)
+        episode.url = 'http://example.com/1.mp3'
+        episode.guid = 'guid-1'
+        episode.download_filename = '1.mp3'
+        podcast.children.append(episode)
+        podcast.save_episodes([episode])
+        db.commit()
+
+        yield podcast
+
+
+@pytest.fixture
+def episode(podcast):
+    return podcast.children[0]
+
+
+@pytest.fixture
+def add_episode(podcast):
+    """Function to add a saved episode to the podcast"""
+    def add_episode(guid, **kwargs):
+        episode = model.PodcastEpisode(podcast)
+        episode.url = 'http://example.com/%s.mp3' % guid
+        episode.guid = guid
+        for key, value in kwargs.items():
+            setattr(episode, key, value)
+        podcast.children.append(episode)
+        podcast.save_episodes([episode])
+        podcast.db.commit()
+        return episode
+
+    return add_episode
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from gpodder.download import (BandwidthLimiter, DownloadScheduler,
+                              DownloadTask, iter_blocks)
+
+
+class FakeRawResponse(object):
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+
+    @property
+    def closed(self):
+        return not self.blocks
+
+    def read(self, amt, decode_content=False):
+        return self.blocks.pop(0) if self.blocks else b''
+
+
+def test_iter_blocks_empty_reads():
+    # Compressed data might not decode to anything before the end
+    resp = SimpleNamespace(raw=FakeRawResponse([b'a', b'', b'b', b'']))
+    assert list(iter_blocks(resp)) == [b'a', b'b']
+
+
+def test_bandwidth_limiter_shared():
+    limiter = BandwidthLimiter(1000000)
+    received = [0, 0, 0, 0]
+
+    def download(index):
+        for _ in range(5):
+            limiter.consume(limiter.block_size(50000))
+            received[index] += 50000
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=download, args=(i,)) for i in range(len(received))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - start
+
+    # 1 MB at 1 MB/s, equally shared
+    assert received == [250000] * 4
+    assert .8 < duration < 1.5
+
+
+def test_bandwidth_limiter_rate_change():
+    limiter = BandwidthLimiter(10000)
+    assert limiter.block_size(65536) == 1024
+    limiter.set_rate(0)
+    assert limiter.block_size(65536) == 65536
+
+    start = time.monotonic()
+    limiter.consume(10 ** 9)
+    assert time.monotonic() - start < .1
+
+
+class FakeTask(object):
+    NEW, QUEUED, DOWNLOADING, DONE, FAILED, CANCELLING, CANCELLED, PAUSING, PAUSED = list(range(9))
+    automatic = False
+
+    def __init__(self, url, total_size=0, published=0):
+        self.url = url
+        self.total_size = total_size
+        self.episode = SimpleNamespace(published=published)
+        self.status = self.NEW
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exception_type, value, traceback):
+        pass
+
+    def set_episode_download_task(self):
+        pass
+
+
+def make_config(order='queued', per_host=0):
+    return SimpleNamespace(downloads=SimpleNamespace(order=order),
+                           limit=SimpleNamespace(downloads=SimpleNamespace(per_host=per_host)))
+
+
+def test_download_scheduler_order():
+    tasks = [FakeTask('http://a.example.com/%d' % i, total_size=size, published=i)
+             for i, size in enumerate((300, 100, 0, 200))]
+    tasks[1].automatic = True
+
+    def order(config):
+        scheduler = DownloadScheduler(config)
+        for task in tasks:
+            task.status = task.NEW
+            scheduler.queue_task(task)
+        tasks[0].status = FakeTask.PAUSED
+        result = []
+        while scheduler.has_work():
+            result.append(tasks.index(scheduler.get_next()))
+        assert all(task.status == task.DOWNLOADING for task in tasks if task is not tasks[0])
+        return result
+
+    assert order(make_config('queued')) == [2, 3, 1]
+    assert order(make_config('smallest')) == [3, 2, 1]
+    assert order(make_config('newest')) == [3, 2, 1]
+
+
+def test_download_scheduler_per_host():
+    scheduler = DownloadScheduler(make_config(per_host=2))
+    tasks = [FakeTask('http://a.example.com/%d' % i) for i in range(3)]
+    tasks.append(FakeTask('http://b.example.com/'))
+    for task in tasks:
+        scheduler.queue_task(task)
+
+    assert [scheduler.get_next() for _ in range(4)] == [tasks[0], tasks[1], tasks[3], None]
+    tasks[0].status = FakeTask.DONE
+    assert scheduler.get_next() is tasks[2]
+
+
+def test_delete_partial_files(tmp_path):
+    tempname = str(tmp_path / 'Episode [1].mp3.partial')
+    for filename in (tempname, tempname + '.segments', tempname + '.f140', str(tmp_path / 'Episode [1].mp3')):
+        open(filename, 'w').close()
+
+    DownloadTask.delete_partial_files(SimpleNamespace(tempname=tempname))
+    assert os.listdir(str(tmp_path)) == ['Episode [1].mp3']
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+
+import gpodder
+
+
+def test_check_download_folder(podcast, episode, add_episode):
+    # Downloaded, but the file has been deleted
+    episode.state = gpodder.STATE_DOWNLOADED
+    episode.save()
+
+    # Not downloaded, but the file has been downloaded externally
+    other = add_episode('2')
+    for name in ('2.mp3', 'unknown.txt'):
+        with open(os.path.join(podcast.save_dir, name), 'w') as fp:
+            fp.write('data')
+
+    podcast.check_download_folder()
+    assert episode.state == gpodder.STATE_DELETED
+    assert other.state == gpodder.STATE_DOWNLOADED
+    assert other.download_filename == '2.mp3'
@@ -16,21 +16,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-import io
-
 import pytest
 import requests.exceptions
 
-from gpodder.feedcore import Fetcher, NEW_LOCATION, Result, UPDATED_FEED
+from gpodder.feedcore import Fetcher, NEW_LOCATION, Result, UNCHANGED_FEED, UPDATED_FEED
 
 
 class MyFetcher(Fetcher):
     def parse_feed(self, url, feed_data, data_stream, headers, status, **kwargs):
+        # The body of the feed is closed after parsing
         return Result(status, {
             'parse_feed': {
                 'url': url,
                 'feed_data': feed_data,
                 'data_stream': data_stream,
+                'data': data_stream.read(),
+                'text': feed_data.text,
                 'headers': headers,
                 'extra_args': dict(**kwargs),
             },
@@ -61,12 +62,27 @@ def test_easy(httpserver):
     assert res.status == UPDATED_FEED
     args = res.feed['parse_feed']
     assert args['headers']['content-type'] == 'text/xml'
-    assert isinstance(args['data_stream'], io.BytesIO)
-    assert args['data_stream'].getvalue().decode('utf-8') == SIMPLE_RSS
+    assert args['data'].decode('utf-8') == SIMPLE_RSS
+    assert args['text'] == SIMPLE_RSS
+    assert args['data_stream'].closed
     assert args['url'] == httpserver.url_for('/feed')
     assert args['extra_args']['custom_key'] == 'value'
 
 
+def test_unchanged_feed(httpserver):
+    httpserver.expect_request('/feed').respond_with_data(SIMPLE_RSS, content_type='text/xml')
+    res = MyFetcher().fetch(httpserver.url_for('/feed'))
+    assert res.status == UPDATED_FEED
+    digest = res.feed['parse_feed']['feed_data'].digest
+    assert digest
+
+    res = MyFetcher().fetch(httpserver.url_for('/feed'), feed_digest=digest)
+    assert res.status == UNCHANGED_FEED
+
+    res = MyFetcher().fetch(httpserver.url_for('/feed'), feed_digest='other')
+    assert res.status == UPDATED_FEED
+
+
 def test_redirect(httpserver):
     httpserver.expect_request('/endfeed').respond_with_data(SIMPLE_RSS, content_type='text/xml')
     redir_headers = {
@@ -80,8 +96,8 @@ def test_redirect(httpserver):
     assert res.status == UPDATED_FEED
     args = res.feed['parse_feed']
     assert args['headers']['content-type'] == 'text/xml'
-    assert isinstance(args['data_stream'], io.BytesIO)
-    assert args['data_stream'].getvalue().decode('utf-8') == SIMPLE_RSS
+    assert args['data'].decode('utf-8') == SIMPLE_RSS
+    assert args['text'] == SIMPLE_RSS
     assert args['url'] == httpserver.url_for('/feed')
 
     res = MyFetcher().fetch(httpserver.url_for('/permanentfeed'))
@@ -101,8 +117,8 @@ def test_redirect_loop(httpserver):
         assert res.status == UPDATED_FEED
         args = res.feed['parse_feed']
         assert args['headers']['content-type'] == 'text/xml'
-        assert isinstance(args['data_stream'], io.BytesIO)
-        assert args['data_stream'].getvalue().decode('utf-8') == SIMPLE_RSS
+        assert args['data'].decode('utf-8') == SIMPLE_RSS
+        assert args['text'] == SIMPLE_RSS
         assert args['url'] == httpserver.url_for('/feed')
 
 
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import io
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import gpodder
+from gpodder import dbsqlite, feedcore, model, youtube
+from gpodder.feedcore import (NEW_LOCATION, NOT_MODIFIED, UNCHANGED_FEED,
+                              UPDATED_FEED, FetcherFeedData, Result)
+from gpodder.feedupdate import FeedUpdateScheduler
+
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.write_lock = threading.RLock()
+
+
+class FakeChannel(object):
+    lock = threading.Lock()
+    active = {}
+    max_active = {}
+    writing = 0
+
+    def __init__(self, db, url, status=UPDATED_FEED, error=None):
+        self.db = db
+        self.url = url
+        self.status = status
+        self.error = error
+
+    def fetch_update(self, max_episodes=0):
+        host = FeedUpdateScheduler.get_host(self)
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active[host] = max(self.max_active.get(host, 0), self.active[host])
+        time.sleep(.02)
+        with self.lock:
+            self.active[host] -= 1
+        if self.error is not None:
+            raise self.error
+        return Result(self.status, None)
+
+    def update(self, max_episodes=0, result=None):
+        assert result is not None
+        FakeChannel.writing += 1
+        assert FakeChannel.writing == 1
+        time.sleep(.001)
+        FakeChannel.writing -= 1
+        return [self.url] if result.status == UPDATED_FEED else []
+
+
+def test_per_host_limit():
+    db = FakeDatabase()
+    channels = [FakeChannel(db, 'http://a.example.com/%d' % i) for i in range(10)]
+    channels += [FakeChannel(db, 'http://b.example.com/%d' % i) for i in range(4)]
+    channels.append(FakeChannel(db, 'http://c.example.com/', status=NOT_MODIFIED))
+    channels.append(FakeChannel(db, 'http://c.example.com/y', status=UNCHANGED_FEED))
+    channels.append(FakeChannel(db, 'http://c.example.com/x', error=ValueError('broken')))
+
+    finished = []
+
+    def on_finished(channel, new_episodes, error, position, total):
+        finished.append((channel, error))
+
+    stats = FeedUpdateScheduler(6, 2).run(channels, on_finished=on_finished)
+
+    assert FakeChannel.max_active['a.example.com'] <= 2
+    assert FakeChannel.max_active['b.example.com'] <= 2
+    assert len(finished) == len(channels)
+    assert stats.updated == 14
+    assert stats.not_modified == 1
+    assert stats.skipped == 1
+    assert stats.unchanged == 2
+    assert stats.failed == 1
+    assert sorted(stats.new_episodes) == sorted(c.url for c in channels[:14])
+
+
+def test_cancel():
+    db = FakeDatabase()
+    channels = [FakeChannel(db, 'http://example.com/%d' % i) for i in range(20)]
+    started = []
+
+    def on_started(channel, position, total):
+        started.append(channel)
+
+    stats = FeedUpdateScheduler(2, 2).run(channels, on_started=on_started,
+                                          is_cancelled=lambda: len(started) >= 4)
+
+    assert len(started) < len(channels)
+    assert stats.cancelled == len(channels) - len(started)
+    assert stats.updated == len(started)
+
+
+def test_new_location(tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    podcasts = model.Model(db)
+    podcasts.get_podcasts()
+    with mock.patch.object(gpodder, 'user_extensions'):
+        channel = model.PodcastChannel(podcasts)
+        channel.url = 'http://old.example.com/feed.xml'
+        channel.download_folder = 'Example'
+        channel.save()
+
+        fetched = []
+
+        class Fetcher(object):
+            def fetch_channel(self, channel, max_episodes):
+                fetched.append((channel.url, db.write_lock._is_owned()))
+                if channel.url == 'http://old.example.com/feed.xml':
+                    return Result(NEW_LOCATION, 'http://new.example.com/feed.xml')
+                return Result(NOT_MODIFIED, None)
+
+        with mock.patch.object(model.PodcastChannel, 'feed_fetcher', Fetcher()):
+            stats = FeedUpdateScheduler(2, 2).run([channel])
+
+    # The new location is fetched right away, without holding the write lock
+    assert fetched == [('http://old.example.com/feed.xml', False), ('http://new.example.com/feed.xml', False)]
+    assert stats.not_modified == 1
+    assert channel.url == 'http://new.example.com/feed.xml'
+    db.close()
+
+
+@pytest.mark.parametrize('redirects,fetches', [
+    ({'http://a.example.com/': 'http://b.example.com/', 'http://b.example.com/': 'http://a.example.com/'}, 2),
+    ({'http://a.example.com/': 'http://b.example.com/', 'http://b.example.com/': 'http://b.example.com/'}, 2),
+    ({'http://%s.example.com/' % c: 'http://%s.example.com/' % chr(ord(c) + 1) for c in 'abcdefgh'}, 6),
+])
+def test_new_location_loop(podcast, redirects, fetches):
+    fetched = []
+
+    class Fetcher(object):
+        def fetch_channel(self, channel, max_episodes):
+            fetched.append(channel.url)
+            if channel.url in redirects:
+                return Result(NEW_LOCATION, redirects[channel.url])
+            return Result(NOT_MODIFIED, None)
+
+    podcast.url = 'http://a.example.com/'
+    with mock.patch.object(model.PodcastChannel, 'feed_fetcher', Fetcher()):
+        with pytest.raises(feedcore.InvalidFeed):
+            podcast.fetch_update()
+    assert len(fetched) == fetches
+
+
+class IncrementalUpdateChannel(model.PodcastChannel):
+    def save_episodes(self, episodes):
+        self.saved = episodes
+
+
+def feed_entry(i, title=None):
+    return {
+        'guid': 'episode-%d' % i,
+        'title': title or 'Episode %d' % i,
+        'link': 'http://example.com/%d' % i,
+        'description': '',
+        'total_time': 0,
+        'published': 1360000000 + i,
+        'payment_url': None,
+        'enclosures': [{'url': 'http://example.com/%d.mp3' % i,
+                        'mime_type': 'audio/mpeg', 'file_size': 1000}],
+    }
+
+
+def get_new_episodes(channel, entries, existing):
+    feed = model.PodcastParserFeed({'episodes': entries}, None)
+    return feed.get_new_episodes(channel, {e.guid: e for e in existing})
+
+
+def test_incremental_update():
+    channel = IncrementalUpdateChannel(None)
+    episodes, seen = get_new_episodes(channel, [feed_entry(i) for i in range(100)], [])
+    assert len(episodes) == 100 and len(seen) == 100
+
+    # Unchanged
+    new, seen = get_new_episodes(channel, [feed_entry(i) for i in range(100)], episodes)
+    assert new == [] and channel.saved == []
+    assert len(seen) == 100
+
+    # Changed and new
+    entries = [feed_entry(i) for i in range(101)]
+    entries[90] = feed_entry(90, 'Changed title')
+    new, seen = get_new_episodes(channel, entries, episodes)
+    assert [e.guid for e in new] == ['episode-100']
+    assert [e.guid for e in channel.saved] == ['episode-100', 'episode-90']
+    assert channel.saved[1].title == 'Changed title'
+    assert len(seen) == 101
+
+
+def test_incremental_update_stops_after_known_episodes():
+    channel = IncrementalUpdateChannel(None)
+    episodes, seen = get_new_episodes(channel, [feed_entry(i) for i in range(100)], [])
+
+    # Old episodes after a run of known episodes are still updated when
+    # their entry changed, and new episodes (e.g. after increasing the
+    # episode limit) are added
+    entries = [feed_entry(i) for i in range(-1, 100)]
+    entries[4] = feed_entry(3, 'Changed title')
+    entries[56] = feed_entry(55, 'Changed title')
+    new, seen = get_new_episodes(channel, entries, episodes)
+    assert [e.guid for e in new] == ['episode--1']
+    assert [e.guid for e in channel.saved] == ['episode-55', 'episode-3', 'episode--1']
+    assert [e.title for e in episodes if e.guid in ('episode-3', 'episode-55')] == ['Changed title'] * 2
+    assert len(seen) == 101
+
+
+def test_network_requests_without_write_lock(podcast):
+    def youtube_entry(i):
+        return dict(feed_entry(i), link='https://www.youtube.com/watch?v=video%06d' % i, enclosures=[])
+
+    pages = {
+        'http://example.com/feed.xml': {'episodes': [youtube_entry(3), youtube_entry(2)],
+                                        'paged_feed_next': 'http://example.com/page-2.xml'},
+        'http://example.com/page-2.xml': {'episodes': [youtube_entry(1)]},
+    }
+    requests = []
+
+    class Fetcher(object):
+        def fetch_channel(self, channel, max_episodes):
+            return self.fetch(channel.url, max_episodes=max_episodes)
+
+        def fetch(self, url, max_episodes=0, **kwargs):
+            requests.append((url, podcast.db.write_lock._is_owned()))
+            return Result(UPDATED_FEED, model.PodcastParserFeed(pages[url], self, max_episodes))
+
+    def get_total_time(episode):
+        requests.append((episode.url, podcast.db.write_lock._is_owned()))
+        return 60
+
+    with mock.patch.object(model.PodcastChannel, 'feed_fetcher', Fetcher()), \
+            mock.patch.object(youtube, 'get_total_time', get_total_time):
+        stats = FeedUpdateScheduler(1, 1).run([podcast])
+
+    # The next page and the durations are fetched before taking the write lock
+    assert stats.updated == 1
+    assert requests == [
+        ('http://example.com/feed.xml', False),
+        ('https://www.youtube.com/watch?v=video000003', False),
+        ('https://www.youtube.com/watch?v=video000002', False),
+        ('http://example.com/page-2.xml', False),
+        ('https://www.youtube.com/watch?v=video000001', False),
+    ]
+    assert [(e.guid, e.total_time) for e in podcast.children] == [
+        ('episode-3', 60), ('episode-2', 60), ('episode-1', 60)]
+
+
+@pytest.mark.parametrize('link,url', [
+    ('http://example.com/1.mp3', 'http://example.com/1.mp3'),
+    ('https://www.youtube.com/watch?v=abcdefghijk', 'https://www.youtube.com/watch?v=abcdefghijk'),
+    ('https://vimeo.com/123456', 'https://vimeo.com/123456'),
+    ('http://example.com/blog/post-1', ''),
+])
+def test_episode_without_enclosure(link, url):
+    entry = dict(feed_entry(1), link=link, enclosures=[])
+    episode = model.PodcastEpisode.from_podcastparser_entry(entry, IncrementalUpdateChannel(None))
+    assert episode.url == url
+
+
+def test_youtube_feed_metadata():
+    body = io.BytesIO(b'<feed xmlns="http://www.w3.org/2005/Atom" xmlns:yt="http://www.youtube.com/xml/schemas/2015">'
+                      b'<yt:channelId>UCabcdefghijklmnopqrstuv</yt:channelId><title>Channel</title></feed>')
+    url = 'https://www.youtube.com/feeds/videos.xml?user=someone'
+
+    # The channel is looked up in the body of the feed before it's parsed
+    with mock.patch.object(youtube, 'get_channel_desc', lambda url, feed_data: feed_data.text[-15:]):
+        result = model.PodcastChannel.feed_fetcher.parse_feed(
+            url, FetcherFeedData(body, 'utf-8'), body, {}, UPDATED_FEED)
+
+    assert body.closed
+    assert result.feed.get_title() == 'Channel'
+    assert result.feed.get_link() == 'https://www.youtube.com/channel/UCabcdefghijklmnopqrstuv'
+    assert result.feed.get_description() == '</title></feed>'
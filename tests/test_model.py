@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import threading
+import time
+from unittest import mock
+
+import gpodder
+from gpodder import model
+
+
+def test_podcast_lookup(podcast):
+    podcasts = podcast.model
+    assert podcasts.get_podcast('http://example.com/feed.xml') is podcast
+    assert podcasts.get_podcast_by_download_folder('Example') is podcast
+
+    podcast.rewrite_url('http://example.com/new.xml')
+    assert podcasts.get_podcast('http://example.com/feed.xml') is None
+    assert podcasts.get_podcast('http://example.com/new.xml') is podcast
+
+    # Permanent redirect while updating, before the podcast is saved
+    podcast._set_new_location('http://example.com/moved.xml')
+    assert podcasts.get_podcast('http://example.com/new.xml') is None
+    assert podcasts.get_podcast('http://example.com/moved.xml') is podcast
+
+    podcast.delete()
+    assert podcasts.get_podcast('http://example.com/moved.xml') is None
+    assert podcasts.get_podcast_by_download_folder('Example') is None
+
+
+def test_episode_lookup(podcast, episode):
+    podcasts = podcast.model
+    assert podcasts.get_episode_by_url('http://example.com/1.mp3') is episode
+    assert podcasts.get_episode_by_guid(podcast, 'guid-1') is episode
+    path = os.path.join(gpodder.downloads, 'Example', '1.mp3')
+    assert podcasts.get_episode_by_uri(path) is episode
+
+    episode.url = 'http://example.com/moved.mp3'
+    episode.save()
+    assert podcasts.get_episode_by_uri('http://example.com/1.mp3') is None
+    assert podcasts.get_episode_by_uri('http://example.com/moved.mp3') is episode
+
+    podcast.remove_unreachable_episodes([episode], set(), 0)
+    assert podcasts.get_episode_by_url('http://example.com/moved.mp3') is None
+    assert podcasts.get_episode_by_guid(podcast, 'guid-1') is None
+
+
+def test_episode_lookup_without_loading_episodes(podcast, add_episode):
+    add_episode('guid-2', download_filename='2.mp3')
+    podcasts = model.Model(podcast.db)
+    podcasts.defer_download_folder_checks = True
+    loaded = podcasts.get_podcast(podcast.url)
+
+    # Only the episodes found are loaded, not all episodes of the podcast
+    episode = podcasts.get_episode_by_url('http://example.com/1.mp3')
+    assert episode.guid == 'guid-1'
+    assert podcasts.get_episode_by_guid(loaded, 'guid-1') is episode
+    path = os.path.join(gpodder.downloads, 'Example', '2.mp3')
+    assert podcasts.get_episode_by_uri(path).guid == 'guid-2'
+    assert podcasts.get_episode_by_url('http://example.com/3.mp3') is None
+    assert loaded._children is None
+
+    # They are part of the episodes when these are loaded
+    assert episode in loaded.children
+    assert podcasts.get_episode_by_url('http://example.com/1.mp3') is episode
+
+
+def test_episode_version(podcast, episode):
+    version = episode.version
+    episode.mark(is_played=True)
+    assert episode.version > version
+
+    version = episode.version
+    podcast.save_episodes([episode])
+    assert episode.version > version
+
+
+def test_check_download_folders_without_loading_episodes(podcast, episode):
+    # Downloaded, but the file has been deleted
+    episode.state = gpodder.STATE_DOWNLOADED
+    episode.save()
+    podcast.db.commit()
+
+    # Download folders are checked by default
+    podcasts = model.Model(podcast.db)
+    loaded = podcasts.get_podcast(podcast.url)
+    assert loaded._children is None
+
+    # The checked episode is part of the episodes when they are loaded
+    deleted = podcasts.get_episode_by_guid(loaded, 'guid-1')
+    assert deleted.state == gpodder.STATE_DELETED
+    assert loaded.children == [deleted]
+
+
+def test_children_loaded_once(podcast):
+    podcasts = model.Model(podcast.db)
+    podcasts.defer_download_folder_checks = True
+    loaded = podcasts.get_podcast(podcast.url)
+
+    load_episodes = podcast.db.load_episodes
+
+    def slow_load_episodes(*args):
+        time.sleep(.05)
+        return load_episodes(*args)
+
+    results = []
+    with mock.patch.object(podcast.db, 'load_episodes', slow_load_episodes):
+        threads = [threading.Thread(target=lambda: results.append(loaded.children)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(results) == 2 and results[0] is results[1]
+
+
+def test_podcast_statistics_changed_while_querying(podcast, add_episode):
+    db = podcast.db
+    assert db.get_podcast_statistics(podcast.id)[0] == 1
+    add_episode('2')
+
+    query_podcast_statistics = db._query_podcast_statistics
+
+    def outdated_query(podcast_ids=None):
+        result = query_podcast_statistics(podcast_ids)
+        if len(podcast.children) == 2:
+            # Another thread stores newer statistics while this one queries
+            add_episode('3')
+            assert db.get_podcast_statistics(podcast.id)[0] == 3
+        return result
+
+    with mock.patch.object(db, '_query_podcast_statistics', outdated_query):
+        db.get_podcast_statistics(podcast.id)
+
+    # The outdated statistics have not replaced the newer ones
+    assert db.get_podcast_statistics(podcast.id)[0] == 3
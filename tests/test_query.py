@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import pytest
+
+import gpodder
+from gpodder import model
+from gpodder.query import EQL, UserEQL
+
+
+class Podcast(object):
+    title = 'Linux Outlaws'
+    section = 'Tech'
+
+
+class Episode(object):
+    def __init__(self, title, description='', **kwargs):
+        self.title = title
+        self._text_description = description
+        self.channel = Podcast()
+        self.state = gpodder.STATE_NORMAL
+        self.is_new = True
+        self.file_size = 0
+        self.total_time = 0
+        self.current_position = 0
+        self.download_task = None
+        self.__dict__.update(kwargs)
+
+    def was_downloaded(self, and_exists=False):
+        return self.state == gpodder.STATE_DOWNLOADED
+
+
+EPISODES = [
+    Episode('The Linux Show', 'Community news', file_size=50 * 1024 * 1024),
+    Episode('Episode 2', 'About the linux kernel', is_new=False, total_time=3600),
+    Episode('Episode 3', state=gpodder.STATE_DOWNLOADED, file_size=5 * 1024 * 1024),
+]
+
+
+@pytest.mark.parametrize('query,expected', [
+    ('new', [0]),
+    ('played or mb > 10', [0, 1]),
+    ('dl and megabytes < 10', [2]),
+    ('min >= 60 and not new', [1]),
+    ('podcast == "Linux Outlaws" and section == "Tech"', [0, 1, 2]),
+    ('s("LINUX")', [0, 1]),
+    ('S("Linux")', [0]),
+    ('s("episode", title)', [1, 2]),
+    ('r("^the")', [0]),
+    ('R("^The")', [0]),
+    ('R("^the")', []),
+    ('r(title[-1], title)', [0, 1, 2]),
+    ('new and r("(")', []),
+    ('dl or unknown', [2]),
+    ('new and', []),
+    ('(lambda x: x)(new)', [0]),
+    ('(lambda new: new)(0) or dl', [2]),
+    ('[t for t in (1, 2)] == [1, 2]', [0, 1, 2]),
+    ('[t for t in (title,) if "Linux" in t]', [0]),
+    ('[title for title in ("a",)] == ["a"] and new', [0]),
+    ('(x := mb) > 10 and x < 100', [0]),
+])
+def test_eql_match(query, expected):
+    eql = EQL(query)
+    assert [i for i, episode in enumerate(EPISODES) if eql.match(episode)] == expected
+
+
+@pytest.mark.parametrize('query,expected', [
+    ('linux', [0, 1]),
+    ("'episode'", [1, 2]),
+    ('/^episode/', []),
+    ('/^episode/i', [1, 2]),
+    ('(dl)', [2]),
+])
+def test_user_eql_filter(query, expected):
+    assert UserEQL(query).filter(EPISODES) == [EPISODES[i] for i in expected]
+
+
+@pytest.mark.parametrize('query,where,params', [
+    ('new and mb > 10', '(episode.state = 0 AND episode.is_new) AND (episode.file_size / 1048576.0 > ?)', (10,)),
+    ('s("linux") and 5 > min', '(episode.total_time / 60.0 < ?)', (5,)),
+    ('podcast == "x" or "linux" in title', '((podcast.title = ?) OR (instr(episode.title, ?) > 0))', ('x', 'linux')),
+    ('filename == "a.mp3" and title < 3', '(episode.download_filename IS ?)', ('a.mp3',)),
+    ('dl or new', None, ()),
+    ('/linux/', None, ()),
+])
+def test_eql_get_sql(query, where, params):
+    assert EQL(query).get_sql() == (where, params)
+
+
+@pytest.mark.parametrize('query,params', [
+    ('s("Linux") and new', ('"linux"',)),
+    ('S("Linux", title)', ('title : "linux"',)),
+    ('s("linux", haystack=description)', ('description : "linux"',)),
+    ("'Linux'", ('"linux"',)),
+    ('s("li")', None),
+    ('not S("Linux")', None),
+    ('s("linux", podcast)', None),
+])
+def test_eql_get_sql_search_index(query, params):
+    where, sql_params = EQL(query).get_sql(search_index=True)
+    if params is None:
+        assert where is None
+    else:
+        assert 'episode_fts MATCH ?' in where
+        assert sql_params == params
+
+
+def test_find_episodes(podcast, add_episode):
+    episode = add_episode('2', title='Second episode', file_size=20 * 1024 * 1024)
+
+    eql = EQL('mb > 10 and s("second")')
+    assert podcast.model.find_episodes(eql) == [episode]
+
+    # Episodes of other podcasts are only loaded when they can match
+    other = model.Model(podcast.db)
+    found = other.find_episodes(eql)
+    assert [e.guid for e in found] == ['2']
+    other_podcast = other.get_podcast('http://example.com/feed.xml')
+    assert other_podcast._children is None
+
+    # The found episodes are the ones used once all episodes are loaded
+    assert found[0] in other_podcast.children
+    assert other.find_episodes(eql) == found
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import sqlite3
+
+import pytest
+
+from gpodder import dbsqlite
+
+
+@pytest.fixture
+def podcast(podcast, episode, add_episode):
+    if not podcast.db.has_search_index():
+        pytest.skip('SQLite without FTS5 trigram support')
+    episode.title = 'Linux news'
+    episode.save()
+    add_episode('2', description_html='<p>All about the <b>Linux</b> kernel</p>')
+    return podcast
+
+
+def test_search_episodes(podcast, episode):
+    other = podcast.children[1]
+
+    # Matches in the title are ranked first
+    assert podcast.model.search_episodes('LINUX') == [episode, other]
+    assert podcast.model.search_episodes('linux kernel') == [other]
+    assert podcast.model.search_episodes('') == []
+
+
+def test_search_index(podcast, episode):
+    db = podcast.db
+    other = podcast.children[1]
+
+    # HTML tags are removed from the shownotes
+    assert db.search_episodes(['the linux kernel']) == [other.id]
+    assert db.search_episodes(['<b>']) == []
+
+    # The index is kept up to date
+    episode.title = 'Other news'
+    episode.save()
+    assert db.search_episodes(['linux']) == [other.id]
+    podcast.remove_unreachable_episodes([other], set(), 0)
+    assert db.search_episodes(['linux']) == []
+
+
+def test_search_index_other_programs(podcast, episode):
+    podcast.db.commit()
+
+    # Other programs can change episodes without the functions of gPodder
+    db = sqlite3.connect(podcast.db.database_file)
+    db.execute("INSERT INTO episode (podcast_id, title, url, guid) "
+               "VALUES (?, 'Linux Outlaws', 'http://example.com/3.mp3', 'guid-3')", (podcast.id,))
+    db.execute("UPDATE episode SET title = 'Other news' WHERE guid = 'guid-1'")
+    db.execute("DELETE FROM episode WHERE guid = '2'")
+    db.commit()
+    episode_id, = db.execute("SELECT id FROM episode WHERE guid = 'guid-3'").fetchone()
+    db.close()
+
+    # New episodes are added to the index when the database is opened
+    db = dbsqlite.Database(podcast.db.database_file)
+    assert db.search_episodes(['outlaws']) == [episode_id]
+    db.close()
+
+
+def test_search_index_upgrade(tmp_path):
+    filename = str(tmp_path / 'Database')
+    db = dbsqlite.Database(filename)
+    if not db.has_search_index():
+        pytest.skip('SQLite without FTS5 trigram support')
+
+    # Version 11 updated the index with triggers that need gPodder's functions
+    db.db.execute("CREATE TRIGGER episode_fts_insert AFTER INSERT ON episode BEGIN "
+                  "INSERT INTO episode_fts (rowid, title) VALUES (new.id, casefold(new.title)); END")
+    db.db.execute("UPDATE version SET version = 11")
+    db.db.commit()
+    db.close()
+
+    db = dbsqlite.Database(filename)
+    db.db.commit()
+    db.close()
+
+    db = sqlite3.connect(filename)
+    db.execute("INSERT INTO episode (podcast_id, title, url, guid) VALUES (1, 'Title', 'http://example.com/', 'guid')")
+    assert db.execute("SELECT version FROM version").fetchone() == (12,)
+    db.close()
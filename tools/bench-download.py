@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Throughput benchmark for the default downloader
+#
+# Serves a file from a local HTTP server (running in a separate process,
+# so its CPU time is not counted) and downloads it a few times using
+# DownloadURLOpener.retrieve_resume(). Reports the throughput, the CPU
+# time used per GB downloaded and the number of progress callbacks.
+#
+# Usage: PYTHONPATH=src python3 tools/bench-download.py [MIB] [RUNS]
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from gpodder import download  # isort:skip
+
+
+class Channel(object):
+    auth_username = None
+    auth_password = None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(directory):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'http.server', '--bind', '127.0.0.1',
+                               '--directory', directory, str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%d/' % port
+    for _ in range(50):
+        try:
+            urllib.request.urlopen(url).close()
+            return server, url
+        except OSError:
+            time.sleep(.1)
+    server.kill()
+    raise RuntimeError('Cannot start HTTP server')
+
+
+def measure(url, filename):
+    calls = [0]
+
+    def reporthook(count, block_size, total_size):
+        calls[0] += 1
+
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    opener = download.DownloadURLOpener(Channel())
+    start, start_cpu = time.time(), time.process_time()
+    opener.retrieve_resume(url, filename, reporthook)
+    return time.time() - start, time.process_time() - start_cpu, calls[0]
+
+
+def main():
+    mib = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, 'served')
+        os.mkdir(source)
+        with open(os.path.join(source, 'episode.mp3'), 'wb') as fp:
+            for _ in range(mib):
+                fp.write(os.urandom(1024 * 1024))
+
+        server, url = start_server(source)
+        try:
+            for run in range(runs):
+                duration, cpu, calls = measure(url + 'episode.mp3',
+                                               os.path.join(tmpdir, 'episode.mp3.partial'))
+                print('Run %d: %5d MiB, %7.1f MiB/s, %5.2f CPU s/GiB, %6d progress callbacks' % (
+                    run + 1, mib, mib / duration, cpu * 1024. / mib, calls))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
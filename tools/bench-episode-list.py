@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Benchmark for updating the episode list of the GTK UI
+#
+# Fills an EpisodeListModel with synthetic episodes (10000 by default) and
+# reports how long EpisodeListModel.update_all() takes when no episode,
+# some episodes or all episodes have changed, and how long computing the
+# displayed fields of the visible rows takes with and without the cache.
+#
+# Needs PyGObject and GTK 3 (no display is needed).
+#
+# Usage: PYTHONPATH=src python3 tools/bench-episode-list.py [EPISODES] [RUNS]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import gi  # isort:skip
+gi.require_version('Gtk', '3.0')  # isort:skip
+from gi.repository import GLib  # isort:skip
+
+import gpodder  # isort:skip
+from gpodder import model  # isort:skip
+from gpodder.gtkui.model import EpisodeListModel  # isort:skip
+
+EPISODES_PER_PODCAST = 1000
+VISIBLE_ROWS = 50
+
+
+class Podcast(object):
+    def __init__(self, podcast_id):
+        self.id = podcast_id
+        self.title = 'Podcast %d' % podcast_id
+        self.section = 'audio'
+        self.auto_archive_episodes = False
+
+
+class Channel(object):
+    def __init__(self, episodes):
+        self.episodes = episodes
+
+    def get_all_episodes(self):
+        return self.episodes
+
+
+class Config(object):
+    def __init__(self, **kwargs):
+        self.ui = self.gtk = self.episode_list = self
+        self.always_show_new = False
+        self.trim_title_prefix = False
+        self.descriptions = True
+        self.show_released_time = False
+        self.__dict__.update(kwargs)
+
+
+def create_episodes(count):
+    episodes = []
+    podcast = None
+    for i in range(count):
+        if i % EPISODES_PER_PODCAST == 0:
+            podcast = Podcast(i // EPISODES_PER_PODCAST + 1)
+
+        episode = model.PodcastEpisode(podcast)
+        episode.title = 'Episode %d: Something about topic %d' % (i, i * 7)
+        episode.description = ('Some shownotes for episode %d. ' % i) * 5
+        episode.url = 'http://cdn.example.com/%d/episode-%d.mp3' % (podcast.id, i)
+        episode.published = 1500000000 + i * 3600
+        episode.file_size = 30000000 + i * 100
+        episode.state = gpodder.STATE_NORMAL
+        episode.is_new = bool(i % 3)
+        episode.total_time = 600 * (i % 10)
+        episodes.append(episode)
+    return episodes
+
+
+def run_idle_callbacks():
+    # Run the background updates of the list model to completion
+    context = GLib.MainContext.default()
+    while context.pending():
+        context.iteration(False)
+
+
+def measure(what, function, runs, setup=None):
+    durations = []
+    for run in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    best = min(durations)
+    print('  %-48s %8.1f ms' % (what, best * 1000))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    episodes = create_episodes(count)
+    episode_list = EpisodeListModel()
+    episode_list.cache_config(Config())
+
+    print('Episode list with %d episodes' % count)
+
+    def replace_from_channel():
+        episode_list.replace_from_channel(Channel(episodes))
+        run_idle_callbacks()
+
+    measure('replace_from_channel()', replace_from_channel, runs)
+
+    def update_all():
+        episode_list.update_all()
+        run_idle_callbacks()
+
+    def change_episodes(step):
+        for episode in episodes[::step]:
+            episode.changed()
+
+    measure('update_all(), no episode changed', update_all, runs)
+    measure('update_all(), 1% of episodes changed', update_all, runs, lambda: change_episodes(100))
+    measure('update_all(), all episodes changed', update_all, runs, lambda: change_episodes(1))
+
+    def change_settings():
+        settings = Config(always_show_new=not episode_list._config_ui_gtk_episode_list_always_show_new)
+        episode_list.cache_config(settings)
+
+    measure('update_all(), settings changed', update_all, runs, change_settings)
+
+    visible = episodes[:VISIBLE_ROWS]
+
+    def draw_visible_rows():
+        for episode in visible:
+            episode_list.get_row_fields(episode)
+
+    measure('fields of %d visible rows, not cached' % VISIBLE_ROWS, draw_visible_rows, runs,
+            episode_list.clear_row_fields)
+    measure('fields of %d visible rows, cached' % VISIBLE_ROWS, draw_visible_rows, runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Memory benchmark for loading episodes from a large database
+#
+# Creates a synthetic database (200 podcasts with 1000 episodes each by
+# default) and reports the memory used per loaded episode, once with
+# only the episode summaries loaded (what gPodder does on startup) and
+# once with all shownotes loaded (what gPodder used to do on startup).
+#
+# Usage: PYTHONPATH=src python3 tools/bench-episode-memory.py [EPISODES]
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import gpodder  # isort:skip
+from gpodder import dbsqlite, model, schema  # isort:skip
+
+EPISODES_PER_PODCAST = 1000
+MIME_TYPES = ('audio/mpeg', 'audio/mp4', 'video/mp4')
+
+
+def create_database(filename, episodes):
+    db = dbsqlite.Database(filename)
+    podcasts = max(1, episodes // EPISODES_PER_PODCAST)
+
+    for podcast_id in range(1, podcasts + 1):
+        db.db.execute('INSERT INTO podcast (id, title, url, download_folder) VALUES (?, ?, ?, ?)',
+                      (podcast_id, 'Podcast %d' % podcast_id,
+                       'http://example.com/%d.xml' % podcast_id, 'Podcast %d' % podcast_id))
+
+        rows = []
+        for i in range(EPISODES_PER_PODCAST):
+            episode = {
+                'podcast_id': podcast_id,
+                'title': 'Episode %d: Something about topic %d' % (i, i * 7),
+                'description': '' if i % 2 else ('Some shownotes for episode %d. ' % i) * 20,
+                'url': 'http://cdn.example.com/%d/episode-%d.mp3' % (podcast_id, i),
+                'published': 1500000000 + i * 3600,
+                'guid': 'urn:uuid:%08d-%04d' % (podcast_id, i),
+                'link': 'http://example.com/%d/%d' % (podcast_id, i),
+                'file_size': 30000000 + i,
+                'mime_type': MIME_TYPES[i % len(MIME_TYPES)],
+                'state': gpodder.STATE_NORMAL,
+                'is_new': 0,
+                'archive': 0,
+                'download_filename': None,
+                'total_time': 3600,
+                'current_position': 0,
+                'current_position_updated': 0,
+                'last_playback': 0,
+                'payment_url': 'http://example.com/%d/donate' % podcast_id,
+                'description_html': ('<p>Some <b>shownotes</b> for episode %d.</p>' % i) * 20 if i % 2 else '',
+                'episode_art_url': 'http://example.com/%d/cover.jpg' % podcast_id,
+                'chapters': None,
+                'fingerprint': 0,
+            }
+            rows.append([episode[name] for name in schema.EpisodeColumns])
+
+        db.db.executemany('INSERT INTO episode (%s) VALUES (%s)' % (
+            ', '.join(schema.EpisodeColumns), ', '.join('?' * len(schema.EpisodeColumns))), rows)
+
+    db.db.commit()
+    db._db.close()
+    return podcasts * EPISODES_PER_PODCAST
+
+
+def measure(filename, load_details):
+    db = dbsqlite.Database(filename)
+    m = model.Model(db)
+
+    def podcast_factory(dct, db):
+        return m.PodcastClass.create_from_dict(dct, m, dct['id'])
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    podcasts = db.load_podcasts(podcast_factory)
+    count = 0
+    for podcast in podcasts:
+        for episode in podcast.children:
+            if load_details:
+                episode._text_description
+            count += 1
+    duration = time.time() - start
+    gc.collect()
+    used, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    db._db.close()
+    return count, used, duration
+
+
+def main():
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'Database')
+        print('Creating database with %d episodes...' % episodes)
+        episodes = create_database(filename, episodes)
+
+        for title, load_details in (('with shownotes', True), ('summary only', False)):
+            count, used, duration = measure(filename, load_details)
+            print('%-16s %8d episodes, %6.1f MiB, %5d bytes/episode, %.2f s' % (
+                title, count, used / 1024. / 1024., used / count, duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Benchmark for filtering episodes with EQL queries
+#
+# Creates synthetic episodes (100000 by default) and reports how long
+# filtering all of them takes for some typical queries, as done by the
+# episode list search in the GTK UI.
+#
+# Usage: PYTHONPATH=src python3 tools/bench-eql.py [EPISODES] [RUNS]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import gpodder  # isort:skip
+from gpodder import model, query  # isort:skip
+
+EPISODES_PER_PODCAST = 1000
+MIME_TYPES = ('audio/mpeg', 'audio/mp4', 'video/mp4')
+
+QUERIES = (
+    'linux',
+    '/^episode \\d+: .*topic 7/i',
+    '(new)',
+    '(downloaded and megabytes > 40)',
+    '(not played and minutes > 30 and podcast == "Podcast 3")',
+    '(s("topic 42") or r("episode 1\\d\\d:"))',
+    '(S("shownotes", description) and age < 1000)',
+)
+
+
+class Podcast(object):
+    def __init__(self, podcast_id):
+        self.id = podcast_id
+        self.title = 'Podcast %d' % podcast_id
+        self.section = 'audio'
+        self.auto_archive_episodes = False
+
+
+def create_episodes(count):
+    episodes = []
+    podcast = None
+    for i in range(count):
+        if i % EPISODES_PER_PODCAST == 0:
+            podcast = Podcast(i // EPISODES_PER_PODCAST + 1)
+
+        episode = model.PodcastEpisode(podcast)
+        episode.title = 'Episode %d: Something about topic %d' % (i, i * 7)
+        episode.description = '' if i % 2 else ('Some shownotes for episode %d. ' % i) * 20
+        episode.url = 'http://cdn.example.com/%d/episode-%d.mp3' % (podcast.id, i)
+        episode.published = 1500000000 + i * 3600
+        episode.file_size = 30000000 + i * 100
+        episode.mime_type = MIME_TYPES[i % len(MIME_TYPES)]
+        episode.state = gpodder.STATE_NORMAL
+        episode.is_new = bool(i % 3)
+        episode.total_time = 600 * (i % 10)
+        episodes.append(episode)
+    return episodes
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    episodes = create_episodes(count)
+    for episode in episodes:
+        episode.cache_text_description()
+
+    for text in QUERIES:
+        start = time.perf_counter()
+        eql = query.UserEQL(text)
+        compile_time = time.perf_counter() - start
+
+        durations = []
+        for run in range(runs):
+            start = time.perf_counter()
+            matches = eql.filter(episodes)
+            durations.append(time.perf_counter() - start)
+
+        best = min(durations)
+        print('%-58s %6d matches, %8.1f ms (%5.2f us/episode), compiled in %.2f ms' % (
+            text, len(matches), best * 1000, best * 1000000 / count, compile_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
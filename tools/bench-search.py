@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Benchmark for searching episode titles and shownotes
+#
+# Creates a synthetic database (100000 episodes with shownotes by default)
+# and compares searching all loaded episodes in memory (like EQL s() does)
+# with searching the full-text search index of the database.
+#
+# Usage: PYTHONPATH=src python3 tools/bench-search.py [EPISODES]
+
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import gpodder  # isort:skip
+from gpodder import dbsqlite, model, query, schema  # isort:skip
+
+EPISODES_PER_PODCAST = 1000
+SEARCHES = ('kernel', 'Security release', 'ÜBER', 'no such text anywhere')
+
+
+def make_words(rnd, count):
+    # Random words, plus some that are searched for
+    words = [''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rnd.randint(3, 10)))
+             for _ in range(count)]
+    return words + ['linux', 'kernel', 'security', 'release', 'über']
+
+
+def shownotes(rnd, words):
+    return '<p>%s</p>' % ' '.join(rnd.choice(words) for _ in range(150))
+
+
+def create_database(filename, episodes):
+    db = dbsqlite.Database(filename)
+    rnd = random.Random(1)
+    words = make_words(rnd, 20000)
+    for podcast_id in range(1, max(1, episodes // EPISODES_PER_PODCAST) + 1):
+        db.db.execute('INSERT INTO podcast (id, title, url, download_folder) VALUES (?, ?, ?, ?)',
+                      (podcast_id, 'Podcast %d' % podcast_id,
+                       'http://example.com/%d.xml' % podcast_id, 'Podcast %d' % podcast_id))
+        rows = [(podcast_id, 'Episode %d: %s' % (i, ' '.join(rnd.sample(words, 3))), shownotes(rnd, words),
+                 'http://example.com/%d/%d.mp3' % (podcast_id, i), 'guid-%d-%d' % (podcast_id, i),
+                 1500000000 + i * 3600)
+                for i in range(EPISODES_PER_PODCAST)]
+        db.db.executemany('INSERT INTO episode (podcast_id, title, description_html, url, guid, published) '
+                          'VALUES (?, ?, ?, ?, ?, ?)', rows)
+    if db.has_search_index():
+        schema.update_search_index(db.db)
+    db.db.commit()
+    db.close()
+
+
+def measure(what, function):
+    start = time.perf_counter()
+    result = function()
+    print('  %-40s %8.1f ms, %6d episodes' % (what, (time.perf_counter() - start) * 1000, len(result)))
+
+
+def main():
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with tempfile.TemporaryDirectory() as tmpdir, mock.patch.object(gpodder, 'user_extensions'):
+        filename = os.path.join(tmpdir, 'Database')
+        start = time.perf_counter()
+        create_database(filename, episodes)
+        print('Created %d episodes (with search index) in %.1f s' % (episodes, time.perf_counter() - start))
+
+        db = dbsqlite.Database(filename)
+        if not db.has_search_index():
+            print('No search index, SQLite %s does not support FTS5 trigrams' % schema.sqlite.sqlite_version)
+            return
+
+        loaded = model.Model(db)
+        loaded.defer_download_folder_checks = True
+        all_episodes = [e for podcast in loaded.get_podcasts() for e in podcast.children]
+        for episode in all_episodes:
+            episode.cache_text_description()
+
+        for text in SEARCHES:
+            eql = query.UserEQL(text)
+            print('Searching for %r' % text)
+            measure('in memory (episodes loaded)', lambda: eql.filter(all_episodes))
+            measure('search index', lambda: db.search_episodes([text]) or [])
+
+            unloaded = model.Model(db)
+            unloaded.defer_download_folder_checks = True
+            measure('Model.find_episodes (not loaded)', lambda: unloaded.find_episodes(eql))
+
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
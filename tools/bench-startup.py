@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Startup time benchmark with a time budget
+#
+# Runs a gPodder command (by default "bin/gpo list") a few times with
+# GPODDER_PROFILE_STARTUP set (see gpodder.startupprofile) and reports
+# the median time of each startup phase and the slowest imports. Exits
+# with status 1 if the median startup time is over the budget, so that
+# it can be used to catch startup time regressions.
+#
+# Without GPODDER_HOME in the environment, an empty gPodder home
+# directory is used.
+#
+# Usage: python3 tools/bench-startup.py [--runs N] [--budget SECONDS]
+#            [--phase-budget PHASE=SECONDS ...] [COMMAND ...]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run(command, env, report_file):
+    env = dict(env)
+    env['GPODDER_PROFILE_STARTUP'] = report_file
+    subprocess.run(command, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(report_file) as fp:
+        return json.load(fp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of gPodder')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.5,
+                        help='maximum median startup time in seconds')
+    parser.add_argument('--phase-budget', action='append', default=[], metavar='PHASE=SECONDS',
+                        help='maximum median time of a startup phase')
+    parser.add_argument('--imports', type=int, default=15,
+                        help='number of slowest imports to show')
+    parser.add_argument('command', nargs='*',
+                        default=[sys.executable, os.path.join(ROOT, 'bin', 'gpo'), 'list'])
+    args = parser.parse_args()
+
+    phase_budgets = {}
+    for item in args.phase_budget:
+        name, _, seconds = item.rpartition('=')
+        phase_budgets[name] = float(seconds)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ)
+        env.setdefault('GPODDER_HOME', os.path.join(tmpdir, 'home'))
+        report_file = os.path.join(tmpdir, 'report.json')
+
+        # The first run is not measured, so that all runs start from a warm cache
+        run(args.command, env, report_file)
+        reports = [run(args.command, env, report_file) for _ in range(args.runs)]
+
+    total = statistics.median(r['total'] for r in reports)
+    imports = statistics.median(r['import_total'] for r in reports)
+
+    phases = {}
+    for report in reports:
+        for phase in report['phases']:
+            phases.setdefault((phase['name'], phase['depth']), []).append(phase['duration'])
+
+    print('Startup: %.3f s, of which %.3f s imports (median of %d runs)' % (total, imports, len(reports)))
+    print()
+    for (name, depth), durations in phases.items():
+        print('%-32s %8.3f s' % ('  ' * depth + name, statistics.median(durations)))
+    print()
+    for item in reports[-1]['imports'][:args.imports]:
+        print('%-32s %8.3f s self %8.3f s cumulative' % (item['module'], item['self'], item['cumulative']))
+    print()
+
+    failed = []
+    if total > args.budget:
+        failed.append('startup takes %.3f s, budget is %.3f s' % (total, args.budget))
+    for name, budget in phase_budgets.items():
+        durations = [d for (phase, _), ds in phases.items() if phase == name for d in ds]
+        duration = statistics.median(durations) if durations else 0
+        if duration > budget:
+            failed.append('%s takes %.3f s, budget is %.3f s' % (name, duration, budget))
+
+    for message in failed:
+        print('FAILED:', message)
+    if failed:
+        sys.exit(1)
+    print('OK: within budget')
+
+
+if __name__ == '__main__':
+    main()